@@ -30,8 +30,7 @@ COLOR_MAP = dict(
 )
 
 repo = Repository()
-runs = repo.get_all_runs_as_list()
-runs = [run for run in runs if run.todays_runability != -2]
+runs = repo.get_predicted_runs(lightweight=True)
 options = sorted([r.select_option for r in runs], key=lambda r: r['label'])
 
 print(f'loaded {len(runs)} runs')
@@ -127,10 +126,7 @@ def build_map(value, lat, lon, zoom):
     # bin the map's markers by predicted flow rating
     marker_sets = {'unknown': []}
     for run in runs:
-        if run.todays_runability == -2:
-            continue
-
-        rating = color_scale(run.todays_runability)
+        rating = color_scale(run.runability)
 
         if run.run_id == value:
             marker_sets['selected'] = [(run, rating)]
@@ -214,7 +210,7 @@ def build_timeseries(value):
     Returns:
         graph_objs.Figure
     """
-    run = repo.get_run(value)
+    run = repo.get_run(value, lightweight=True)
     if run.predictions is None:
         return None
 
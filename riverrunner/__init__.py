@@ -1,4 +1,5 @@
 from .context import *
+from .rows import *
 from .repository import *
 from .daily import *
 from .continuous_retrieval import *
@@ -5,24 +5,692 @@ Classes:
     Arima: contains functions to retrieve data and build ARIMA model
     for given river run
         Functions:
+            training_config: the days of history and resolution a run's
+            model is trained on
+
+            window: the date range models are trained on
+
             get_data: retrieves needed data for selected run
 
             daily_avg: takes time series with measurements on different
             timeframes and creates a dataframe with daily averages for
-            flow rate and exogenous predictors
+            flow rate and exogenous predictors, appending only new days to
+            the run's cached daily series
+
+            select_order: returns the run's cached ARMA order, re-running
+            the order search when the cache is stale or forced
+
+            fit: fits the model, warm-started from the run's previous
+            coefficients when its order has not changed
+
+            update: forecasts with a state-space model whose stored state
+            is filtered through the newly observed days, refitting weekly
+
+            forecast: fits or updates the model and forecasts with it
+
+            climatology: forecasts the median flow rate of each day of the
+            year, the fallback when no model can be fit in time
+
+            persistence: forecasts the most recent day, the fallback when
+            a run has no climatology
+
+            bound: clips a forecast to the range of flow rates seen on its
+            days of the year
+
+            put_artifact: keeps a fit and its forecast in the model store
+
+            forecast_climatology: the climatology of the days of the year
+            a forecast covers
+
+            stage: times a stage of the pipeline for the profiler hook
 
             arima_model: creates flow rate predictions using statsmodel
-            package functions
+            package functions, reusing stored forecasts for unchanged data
 
             get_min_max: use get_all_runs function to query database and
             then pull min and max runnable flow rate for given run
+
+Functions:
+    daily_features: aggregates raw measurements into one column per metric
+    at daily resolution in a single grouped pass
+
+    data_fingerprint: hashes a series or frame so changes in model inputs
+    can be detected
+
+    parallel_order_select: arma_order_select_ic evaluated across a process
+    pool, cancelling candidates that cannot beat the best criterion
+
+    hannan_rissanen_order_select: ranks ARMA orders with least-squares
+    regressions on long autoregression residuals and fits only the best
+
+    run_with_budget: calls a function in a forked process that is killed
+    if it runs over a time budget
+
+    model_version: the version of the models Arima fits with a modeling
+    configuration
+
+    forecast_dates: the days a 7-day forecast covers
+
+    with_history: dates a forecast and prepends past flow rate
+
+    batched_arx: fits AR-X models for many runs in one batched
+    least-squares solve and forecasts with them
+
+Examples:
+    python -m riverrunner.arima --reselect [run_id ...] [--order-method M]
+
+    * forces ARMA order re-selection for the given runs, or every run if
+    none are given
 """
 
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import datetime
+import hashlib
+import os
+import pickle
+import select
+import signal
+import time
+import numpy as np
 import pandas as pd
-from statsmodels.tsa.arima_model import ARIMA
+from statsmodels.tools.tools import Bunch
+from statsmodels.tsa.arima_model import ARIMA, ARMA
+from statsmodels.tsa.statespace.sarimax import SARIMAX
 from statsmodels.tsa.stattools import arma_order_select_ic
+from riverrunner import settings
+from riverrunner.context import Context, ModelFit, ModelOrder, unit_of_work
+from riverrunner.profiling import StageProfiler, profile_stage
 from riverrunner.repository import Repository
+from riverrunner.series_cache import SERIES_CACHE
+from sqlalchemy import create_engine
+
+"""metric id -> (feature name, daily aggregation) of the model's inputs"""
+DAILY_AGGREGATIONS = {
+    '00001': ('temp', 'mean'),
+    '00060': ('flow', 'mean'),
+    '00003': ('precip', 'sum')
+}
+
+"""metrics sampled at the training resolution, summed metrics keep every
+reading so no precipitation is lost"""
+RESOLUTION_METRICS = [m for m, (_, function) in DAILY_AGGREGATIONS.items()
+                      if function == 'mean']
+
+"""days of history models are trained on unless configured for the run"""
+TRAINING_DAYS = 4*365
+
+"""minutes between the measurements models are trained on unless
+configured for the run, every measurement is used if None"""
+TRAINING_RESOLUTION = None
+
+"""days a cached ARMA order is reused before the order search is re-run"""
+ORDER_RESELECT_DAYS = 30
+
+"""increase in AIC per observation over the order's baseline fit that
+triggers re-selection"""
+ORDER_AIC_TOLERANCE = .05
+
+"""days a state-space model's coefficients are reused, with only its state
+updated, before the model is refit"""
+REFIT_DAYS = 7
+
+"""version of the modeling code, bump to stop reusing stored model
+artifacts after changing how models are fit"""
+MODEL_VERSION = 1
+
+"""fraction of the long autoregression's residual variance a candidate's
+innovation variance may fall below before parallel_order_select's heuristic
+bound stops holding"""
+ORDER_BOUND_SLACK = .1
+
+"""order search Arima uses by default, see Arima.select_order"""
+ORDER_METHOD = 'exhaustive'
+
+"""seconds a run's model may take to fit before it is killed and the run is
+forecast by persistence"""
+FIT_BUDGET = 120
+
+"""daily rollups a day of the year's climatology must be computed from to
+forecast with or bound forecasts by, see Arima.climatology"""
+CLIMATOLOGY_MIN_SAMPLES = 30
+
+"""margin, relative to the lowest and highest flow rate seen on a day of the
+year, forecasts may exceed before they are clipped, see Arima.bound"""
+CLIMATOLOGY_MARGIN = .5
+
+"""autoregressive lags of the batched AR-X engine"""
+ARX_LAGS = 2
+
+"""days of history the batched AR-X engine is estimated on"""
+ARX_WINDOW = 2*365
+
+"""ridge penalty, relative to each diagonal element of the normal
+equations and as a floor, keeping every run's AR-X solve well posed, e.g.
+for a run without precipitation"""
+ARX_RIDGE = 1e-8
+
+
+def data_fingerprint(data):
+    """Hashes a series or frame's index and values
+
+    Args:
+        data (Series or DataFrame): model inputs
+
+    Returns:
+        str: hex digest, equal for equal inputs
+    """
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(data.index.values).view(np.uint8))
+    digest.update(np.ascontiguousarray(data.values, dtype=float)
+                  .view(np.uint8))
+    return digest.hexdigest()
+
+
+def daily_features(time_series, aggregations=None):
+    """Aggregates raw measurements to one column per metric at daily resolution
+
+    Timestamps are converted once and every metric is aggregated in a
+    single vectorized pass over (metric, day) bins. Matching resampling
+    semantics, summed and counted metrics are zero on days without
+    readings inside the span the metric was observed over, and only days
+    every metric's span covers are kept.
+
+    Args:
+        time_series (DataFrame): measurements with date_time, metric_id
+            and value columns, assumes output from get_measurements
+        aggregations (dict) - optional: metric id -> (feature name,
+            aggregation), aggregation is one of sum, mean, count, min or
+            max. Defaults to DAILY_AGGREGATIONS
+
+    Returns:
+        DataFrame: one row per UTC day and one column per feature, may
+        contain NaN for days a metric was not observed
+
+    Raises:
+        ValueError: if an aggregation is not supported
+    """
+    if aggregations is None:
+        aggregations = DAILY_AGGREGATIONS
+    names = [name for name, _ in aggregations.values()]
+
+    for _, function in aggregations.values():
+        if function not in ('sum', 'mean', 'count', 'min', 'max'):
+            raise ValueError('unsupported aggregation: %s' % function)
+
+    values = np.asarray(time_series['value'], dtype=float)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return pd.DataFrame(columns=names)
+
+    # bin every reading by (metric, day) in one flat index
+    date_time = pd.to_datetime(time_series['date_time'], utc=True)
+    days = date_time.values.astype('datetime64[D]')[valid]
+    first = days.min()
+    day_codes = (days - first).astype(np.int64)
+    n_days = int(day_codes.max()) + 1
+
+    metric_codes, metric_ids = pd.factorize(time_series['metric_id'])
+    rows = {m: i for i, m in enumerate(metric_ids)}
+    bins = metric_codes[valid]*n_days + day_codes
+    values = values[valid]
+    size = len(metric_ids)*n_days
+
+    counts = np.bincount(bins, minlength=size).reshape(-1, n_days)
+    sums = np.bincount(bins, weights=values, minlength=size)\
+        .reshape(-1, n_days)
+
+    features = {}
+    start, end = 0, n_days - 1
+    for metric_id, (name, function) in aggregations.items():
+        if metric_id not in rows:
+            return pd.DataFrame(columns=names)
+
+        row = rows[metric_id]
+        observed = np.flatnonzero(counts[row])
+        start, end = max(start, observed[0]), min(end, observed[-1])
+
+        if function == 'sum':
+            features[name] = sums[row]
+        elif function == 'count':
+            features[name] = counts[row].astype(float)
+        elif function == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                features[name] = sums[row]/counts[row]
+        else:
+            extreme = np.full(size, np.nan)
+            ufunc = np.fmin if function == 'min' else np.fmax
+            ufunc.at(extreme, bins, values)
+            features[name] = extreme.reshape(-1, n_days)[row]
+
+    index = pd.DatetimeIndex(first + np.arange(start, end + 1), name='date_time')
+    return pd.DataFrame({name: features[name][start:end + 1] for name in names},
+                        index=index.tz_localize('UTC'),
+                        columns=names)
+
+
+def _long_ar_residuals(y, lags):
+    """Residuals of an AR(lags) model with intercept fit by least squares
+
+    Args:
+        y (ndarray): series
+        lags (int): autoregressive order
+
+    Returns:
+        ndarray: residuals for observations lags onwards
+    """
+    design = np.column_stack(
+        [np.ones(len(y) - lags)] +
+        [y[lags - i:len(y) - i] for i in range(1, lags + 1)])
+    coefficients = np.linalg.lstsq(design, y[lags:], rcond=None)[0]
+    return y[lags:] - design.dot(coefficients)
+
+
+def _order_ic(y, order, ic, trend):
+    """Information criterion of an ARMA fit, NaN if the fit fails
+
+    Args:
+        y (ndarray): series
+        order ((int, int)): (p, q)
+        ic (str): criterion, one of aic, bic or hqic
+        trend (str): 'c' to include a constant, 'nc' otherwise
+
+    Returns:
+        float: the fitted model's criterion
+    """
+    try:
+        try:
+            mod = ARMA(y, order=order).fit(disp=0, trend=trend)
+        except ValueError:
+            # non-stationary starting AR coefficients, start from small ones
+            start = [.1]*(order[0] + order[1] + (trend == 'c'))
+            mod = ARMA(y, order=order).fit(disp=0, trend=trend,
+                                           start_params=start)
+        return float(getattr(mod, ic))
+    except Exception:
+        return np.nan
+
+
+def parallel_order_select(y, max_ar=4, max_ma=2, ic='aic', trend='c',
+                          workers=None, slack=ORDER_BOUND_SLACK):
+    """Selects an ARMA order by fitting candidates across a process pool
+
+    Candidates are submitted from the fewest parameters up. The residual
+    variance of a long autoregression approximates the smallest innovation
+    variance any candidate can reach, which gives a heuristic lower bound
+    on each candidate's criterion. A finite-sample maximum likelihood fit
+    can fall below it, notably when the series has a strong moving average
+    component, so the variance is first shrunk by ORDER_BOUND_SLACK and a
+    pending candidate is only cancelled when even that bound cannot beat
+    the best criterion found so far.
+
+    Args:
+        y (Series or ndarray): series to select an order for
+        max_ar (int) - optional: maximum autoregressive order
+        max_ma (int) - optional: maximum moving average order
+        ic (str) - optional: criterion, one of aic, bic or hqic
+        trend (str) - optional: 'c' to include a constant, 'nc' otherwise
+        workers (int) - optional: pool size, defaults to the CPU count
+        slack (float) - optional: fraction the bound's variance is shrunk
+            by before cancelling, no candidate is cancelled if 1
+
+    Returns:
+        Bunch: with the same keys as arma_order_select_ic, {ic} a DataFrame
+        of criteria indexed by AR order with MA order columns (NaN for
+        failed or cancelled candidates) and {ic}_min_order
+
+    Raises:
+        ValueError: if no candidate could be fit
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    penalty = {'aic': 2., 'bic': np.log(n), 'hqic': 2*np.log(np.log(n))}[ic]
+
+    lags = min(max(int(10*np.log10(n)), max_ar + max_ma), n//4)
+    variance = np.mean(_long_ar_residuals(y, lags)**2)
+    fit_bound = n*(np.log(2*np.pi*variance*(1 - slack)) + 1) \
+        if slack < 1 else -np.inf
+
+    def bound(order):
+        return fit_bound + penalty*(order[0] + order[1] + (trend == 'c') + 1)
+
+    orders = sorted(((p, q) for p in range(max_ar + 1)
+                     for q in range(max_ma + 1)), key=sum)
+    results = pd.DataFrame(np.nan, index=range(max_ar + 1),
+                           columns=range(max_ma + 1))
+
+    best = np.inf
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_order_ic, y, order, ic, trend): order
+                   for order in orders}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+
+            p, q = futures[future]
+            results.loc[p, q] = future.result()
+            if results.loc[p, q] < best:
+                best = results.loc[p, q]
+                for pending, order in futures.items():
+                    if bound(order) >= best:
+                        pending.cancel()
+
+    if results.isnull().all().all():
+        raise ValueError('no ARMA order could be fit')
+
+    p, q = np.unravel_index(np.nanargmin(results.values), results.shape)
+    return Bunch(**{ic: results, f'{ic}_min_order': (int(p), int(q))})
+
+
+def hannan_rissanen_order_select(y, max_ar=4, max_ma=2, ic='aic', trend='c',
+                                 top=2):
+    """Selects an ARMA order by ranking candidates with regressions
+
+    Following Hannan and Rissanen, the innovations are estimated by the
+    residuals of a long autoregression and every candidate (p, q) is fit
+    by least squares of the series on its p lags and q lagged residuals,
+    all over the same sample. Candidates are ranked by the criterion of
+    that regression and only the top ones are fit by maximum likelihood.
+
+    Args:
+        y (Series or ndarray): series to select an order for
+        max_ar (int) - optional: maximum autoregressive order
+        max_ma (int) - optional: maximum moving average order
+        ic (str) - optional: criterion, one of aic, bic or hqic
+        trend (str) - optional: 'c' to include a constant, 'nc' otherwise
+        top (int) - optional: number of candidates fit by maximum
+            likelihood
+
+    Returns:
+        Bunch: with the same keys as arma_order_select_ic, {ic} a DataFrame
+        of maximum likelihood criteria indexed by AR order with MA order
+        columns (NaN for candidates that were not fit or failed) and
+        {ic}_min_order, and {ic}_regression, the regression criteria of
+        every candidate
+
+    Raises:
+        ValueError: if none of the top candidates could be fit
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+
+    lags = min(max(int(10*np.log10(n)), max_ar + max_ma), n//4)
+    residuals = np.concatenate([np.full(lags, np.nan),
+                                _long_ar_residuals(y, lags)])
+
+    # every candidate is regressed over the same observations
+    start = lags + max(max_ar, max_ma)
+    m = n - start
+    penalty = {'aic': 2., 'bic': np.log(m), 'hqic': 2*np.log(np.log(m))}[ic]
+
+    regression = pd.DataFrame(np.nan, index=range(max_ar + 1),
+                              columns=range(max_ma + 1))
+    for p in range(max_ar + 1):
+        for q in range(max_ma + 1):
+            columns = [y[start - i:n - i] for i in range(1, p + 1)] + \
+                [residuals[start - j:n - j] for j in range(1, q + 1)]
+            if trend == 'c':
+                columns.append(np.ones(m))
+
+            if len(columns) > 0:
+                design = np.column_stack(columns)
+                coefficients = np.linalg.lstsq(design, y[start:],
+                                               rcond=None)[0]
+                error = y[start:] - design.dot(coefficients)
+            else:
+                error = y[start:]
+
+            k = len(columns) + 1
+            regression.loc[p, q] = m*np.log(np.mean(error**2)) + penalty*k
+
+    ranked = np.argsort(regression.values, axis=None)[:top]
+    results = pd.DataFrame(np.nan, index=range(max_ar + 1),
+                           columns=range(max_ma + 1))
+    for p, q in zip(*np.unravel_index(ranked, regression.shape)):
+        results.loc[p, q] = _order_ic(y, (int(p), int(q)), ic, trend)
+
+    if results.isnull().all().all():
+        raise ValueError('no ARMA order could be fit')
+
+    p, q = np.unravel_index(np.nanargmin(results.values), results.shape)
+    return Bunch(**{ic: results, f'{ic}_min_order': (int(p), int(q)),
+                    f'{ic}_regression': regression})
+
+
+def run_with_budget(budget, func, *args):
+    """Calls a function in a forked process, killing it when over budget
+
+    The child's result or exception is pickled back to the caller. The
+    child exits without running cleanup so resources inherited from the
+    caller, like database connections, are left untouched.
+
+    Args:
+        budget (float): seconds the call may take
+        func (callable): function to call
+        *args: arguments to call it with
+
+    Returns:
+        the function's return value
+
+    Raises:
+        TimeoutError: if the call took longer than budget, the child is
+        killed
+        Exception: the exception raised by the function
+    """
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        try:
+            try:
+                payload = pickle.dumps((True, func(*args)))
+            except Exception as e:
+                try:
+                    payload = pickle.dumps((False, e))
+                except Exception:
+                    payload = pickle.dumps((False, RuntimeError(repr(e))))
+            with os.fdopen(write, 'wb') as f:
+                f.write(payload)
+        finally:
+            os._exit(0)
+
+    os.close(write)
+    deadline = time.time() + budget
+    chunks = []
+    try:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0 or \
+                    len(select.select([read], [], [], remaining)[0]) == 0:
+                os.kill(pid, signal.SIGKILL)
+                raise TimeoutError(f'exceeded budget of {budget}s')
+
+            chunk = os.read(read, 1 << 16)
+            if len(chunk) == 0:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(read)
+        os.waitpid(pid, 0)
+
+    if len(chunks) == 0:
+        raise RuntimeError('process exited without a result')
+
+    success, result = pickle.loads(b''.join(chunks))
+    if not success:
+        raise result
+    return result
+
+
+def forecast_dates(measures):
+    """The days a 7-day forecast covers
+
+    Args:
+        measures (DataFrame): output of Arima.daily_avg the forecast is
+            made from
+
+    Returns:
+        [Timestamp]: date of each forecast day
+    """
+    return [measures.index[-2] + datetime.timedelta(days=x)
+            for x in range(0, 7)]
+
+
+def with_history(measures, prediction):
+    """Dates a 7-day forecast and prepends past flow rate for plotting
+
+    Args:
+        measures (DataFrame): output of Arima.daily_avg the forecast was
+            made from
+        prediction (Series): 7-day flow rate forecast
+
+    Returns:
+        Series: past 20 days of flow rate followed by the forecast
+    """
+    prediction.index = forecast_dates(measures)
+    past = measures['flow'][-22:-1]
+    return pd.concat([past[:-1], prediction], axis=0)
+
+
+def batched_arx(frames, lags=ARX_LAGS, window=ARX_WINDOW, steps=7):
+    """Fits an AR-X model to every run at once and forecasts with it
+
+    Each run's flow is regressed on a constant, its previous lags days
+    and the same day's temperature and precipitation. The runs' daily
+    features are aligned on a common calendar of the last window days and
+    all runs' coefficients are estimated with one batched solve of their
+    least-squares normal equations, days with a missing value in the
+    regression are left out of the run's sums. Forecasts start from each
+    run's own last observed day with its past 7-day average temperature
+    and precipitation, the same future predictors as Arima.arima_model.
+
+    Args:
+        frames ([DataFrame]): output of Arima.daily_avg for each run
+        lags (int) - optional: autoregressive lags
+        window (int) - optional: days of history to estimate on
+        steps (int) - optional: days to forecast
+
+    Returns:
+        [Series]: flow rate forecast for each run, None for runs without
+        enough observations to fit
+    """
+    if len(frames) == 0:
+        return []
+
+    # align every run on the last window days of a common calendar
+    end = max(f.index[-1] for f in frames)
+    calendar = pd.date_range(end=end, periods=window, freq='D')
+    stacked = np.stack([
+        f.reindex(calendar)[['flow', 'temp', 'precip']].values
+        for f in frames
+    ]).astype(float)
+    y, exog = stacked[:, :, 0], stacked[:, :, 1:]
+    n_runs, n_days = y.shape
+
+    # design matrices: constant, lagged flow and same-day predictors
+    lagged = np.stack([y[:, lags - i - 1:n_days - i - 1]
+                       for i in range(lags)], axis=2)
+    X = np.concatenate([np.ones((n_runs, n_days - lags, 1)), lagged,
+                        exog[:, lags:]], axis=2)
+    target = y[:, lags:]
+
+    valid = np.isfinite(X).all(axis=2) & np.isfinite(target)
+    X = np.where(valid[:, :, None], X, 0.)
+    target = np.where(valid, target, 0.)
+
+    k = X.shape[2]
+    xtx = np.einsum('rtk,rtl->rkl', X, X)
+    xty = np.einsum('rtk,rt->rk', X, target)
+    diagonal = np.arange(k)
+    xtx[:, diagonal, diagonal] = \
+        xtx[:, diagonal, diagonal]*(1 + ARX_RIDGE) + ARX_RIDGE
+    coef = np.linalg.solve(xtx, xty[:, :, None])[:, :, 0]
+
+    # forecast from each run's own last observed day
+    last = np.maximum(calendar.searchsorted([f.index[-1] for f in frames]),
+                      lags - 1)
+    history = y[np.arange(n_runs)[:, None],
+                last[:, None] - np.arange(lags)[None, :]]
+    future = np.stack([f[['temp', 'precip']].iloc[-7:].mean(axis=0).values
+                       for f in frames])
+
+    forecast = np.empty((n_runs, steps))
+    for step in range(steps):
+        forecast[:, step] = coef[:, 0] + \
+            np.einsum('rl,rl->r', coef[:, 1:lags + 1], history) + \
+            np.einsum('re,re->r', coef[:, lags + 1:], future)
+        history = np.concatenate([forecast[:, step:step + 1],
+                                  history[:, :-1]], axis=1)
+
+    fitted = (valid.sum(axis=1) >= 2*k) & np.isfinite(forecast).all(axis=1)
+    return [pd.Series(forecast[r], name='flow') if fitted[r] else None
+            for r in range(n_runs)]
+
+
+def model_version(incremental=False, order_method=ORDER_METHOD,
+                  order_workers=None):
+    """Version of the models Arima fits with a configuration
+
+    Distinct for each kind of model and modeling configuration, as the
+    order search and whether it runs in parallel can select different
+    orders.
+
+    Args:
+        incremental (bool) - optional: whether models are updated with
+            Arima.update
+        order_method (str) - optional: order search, see Arima
+        order_workers (int) - optional: process pool size of the order
+            search, serial if None
+
+    Returns:
+        str: kind of model, MODEL_VERSION and modeling configuration
+    """
+    kind = 'statespace' if incremental else 'arima'
+    search = 'parallel' if order_workers else 'serial'
+    return f'{kind}{MODEL_VERSION}-{order_method}-{search}'
+
+
+def _forecast_in_child(cls, url, run_id, measures, exog_future_predictors,
+                       order_workers, incremental, store, order_method,
+                       profile):
+    """Arima.forecast in a process forked by run_with_budget
+
+    The forked process connects to the database with its own engine,
+    forecasts with an instance of cls, the caller's class, and, if
+    profiled, records its stages to return them to the caller's hook.
+
+    Returns:
+        (Series, str, [StageRecord]): forecast, the kind of model used and
+        the stages recorded
+    """
+    with unit_of_work(create_engine(url)) as session:
+        arima = cls(session, order_workers, incremental, store,
+                    fit_budget=None, order_method=order_method,
+                    profiler=StageProfiler() if profile else None)
+        prediction = arima.forecast(run_id, measures,
+                                    exog_future_predictors)
+        records = arima.profiler.records if profile else []
+        return prediction, arima.last_model, records
+
+
+def _forecast_in_fork(arima, run_id, measures, exog_future_predictors):
+    """Arima.forecast in a process forked by run_with_budget without a
+    database
+
+    The forked process forecasts with its copy of arima and returns the
+    copy's repository, whose orders and fits the caller adopts in place of
+    the database the fit would otherwise have written them to.
+
+    Returns:
+        (Series, str, [StageRecord], repository): forecast, the kind of
+        model used, the stages recorded and the repository
+    """
+    profile = arima.profiler is not None
+    arima.fit_budget = None
+    arima.profiler = StageProfiler() if profile else None
+    prediction = arima.forecast(run_id, measures, exog_future_predictors)
+    records = arima.profiler.records if profile else []
+    return prediction, arima.last_model, records, arima.repo
 
 
 class Arima:
@@ -31,29 +699,131 @@ class Arima:
 
     Args:
         session: (Session) db session
+        order_workers: (int) optional process pool size for order
+            selection, the search runs serially if None
+        incremental: (bool) optional, forecast with Arima.update instead
+            of refitting every day
+        store: (ModelStore) optional store fitted models are kept in and
+            reused from, models are not stored if None, see
+            riverrunner.model_store.MODEL_STORE
+        fit_budget: (float) optional seconds a run's model may take to fit
+            before falling back to climatology, unbounded if None
+        order_method: (str) optional order search, 'exhaustive' fits every
+            candidate, 'hannan_rissanen' only the best ranked by regression
+        profiler: optional hook every stage's time, memory and row count is
+            recorded to, see riverrunner.profiling, nothing is recorded if
+            None
+        series_cache: (SeriesCache) optional cache of daily features,
+            daily features are rebuilt from raw measurements if None
+        training_days: (int) optional days of history every run is trained
+            on, overriding the run's configuration and TRAINING_DAYS
+        training_resolution: (int) optional minutes between the
+            measurements every run is trained on, overriding the run's
+            configuration and TRAINING_RESOLUTION
+        repo: optional repository runs are read from and orders and fits
+            written to, a Repository over session if None, e.g. an
+            in-memory repository to model without a database, see
+            riverrunner.backtest.MemoryRepository
     """
-    def __init__(self, session):
-        self.repo = Repository(session)
+    def __init__(self, session, order_workers=None, incremental=False,
+                 store=None, fit_budget=FIT_BUDGET,
+                 order_method=ORDER_METHOD, profiler=None,
+                 series_cache=SERIES_CACHE, training_days=None,
+                 training_resolution=None, repo=None):
+        self.session = session
+        self.repo = Repository(session) if repo is None else repo
+        self.order_workers = order_workers
+        self.order_method = order_method
+        self.incremental = incremental
+        self.store = store
+        self.fit_budget = fit_budget
+        self.profiler = profiler
+        self.series_cache = series_cache
+        self.training_days = training_days
+        self.training_resolution = training_resolution
+        self.last_fit = None
+        self.last_artifact = None
+        self.last_model = None
+
+    @property
+    def model_version(self):
+        """version stored model artifacts are keyed by, see model_version"""
+        return model_version(self.incremental, self.order_method,
+                             self.order_workers)
 
-    def get_data(self, run_id, metric_ids=None):
-        """Retrieves data for selected run from database for past four years
-        from current date using Repository.get_measurements function.
+    def stage(self, run_id, name):
+        """Times a stage of the pipeline for the profiler hook
+
+        Args:
+            run_id (int): id of run the stage is for
+            name (str): stage name
+
+        Returns:
+            context manager yielding a dict whose rows key the stage may set
+        """
+        return profile_stage(self.profiler, run_id, name)
+
+    def training_config(self, run_id):
+        """The days of history and resolution a run's model is trained on
+
+        Settings given to the instance apply to every run, otherwise the
+        run's own configuration is used and TRAINING_DAYS and
+        TRAINING_RESOLUTION where it has none.
 
         Args:
             run_id (int): id of run for which model will be created
-            metric_ids ([str]) - optional: list of metric ids to include
 
         Returns:
-            DataFrame: containing four years of measurements up to current
-            date for the given run
+            (int, int): days of history and minutes between measurements,
+            None for every measurement
+        """
+        days, resolution = self.training_days, self.training_resolution
+        if days is None or resolution is None:
+            run_days, run_resolution = self.repo.get_training_config(run_id)
+            days = run_days if days is None else days
+            resolution = run_resolution if resolution is None else resolution
+
+        return (TRAINING_DAYS if days is None else days,
+                TRAINING_RESOLUTION if resolution is None else resolution)
+
+    def window(self, days=TRAINING_DAYS):
+        """The date range models are trained on
+
+        Args:
+            days (int) - optional: days of history
+
+        Returns:
+            (DateTime, DateTime): days ago and the start of today
         """
         now = datetime.datetime.now()
         end = datetime.datetime(now.year, now.month, now.day)
-        start = end - datetime.timedelta(days=4*365)
-        test_measures = self.repo.get_measurements(run_id=run_id,
-                                                   start_date=start,
-                                                   end_date=end,
-                                                   metric_ids=metric_ids)
+        return end - datetime.timedelta(days=days), end
+
+    def get_data(self, run_id, metric_ids=None, start_date=None):
+        """Retrieves data for selected run from database over its training
+        window using Repository.get_measurements function.
+
+        Args:
+            run_id (int): id of run for which model will be created
+            metric_ids ([str]) - optional: list of metric ids to include
+            start_date (DateTime) - optional: beginning of the measurements
+                to retrieve, defaults to the start of the training window
+
+        Returns:
+            DataFrame: containing the run's training window of measurements
+            up to current date at its training resolution, with the compact
+            dtypes of rows.measurement_frame
+        """
+        days, resolution = self.training_config(run_id)
+        start, end = self.window(days)
+        if start_date is not None:
+            start = start_date
+        with self.stage(run_id, 'get_data') as stage:
+            test_measures = self.repo.get_measurements(
+                run_id=run_id, start_date=start, end_date=end,
+                metric_ids=metric_ids, resolution=resolution,
+                resolution_metric_ids=RESOLUTION_METRICS, compact=True)
+            stage['rows'] = len(test_measures)
         return test_measures
 
     def daily_avg(self, run_id):
@@ -63,65 +833,337 @@ class Arima:
         creates a dataframe with daily averages for flow rate and exogenous
         predictors.
 
+        With a series cache, the run's cached daily averages are reused as
+        long as the fingerprint of the raw measurements they were computed
+        from is unchanged, and only measurements from the first day after
+        them are retrieved and aggregated. Otherwise the whole window is
+        rebuilt. Every day but the most recent, which may be incomplete, is
+        cached for the next call.
+
         Args:
             run_id (int): id of run for which model will be created
 
         Returns:
             DataFrame: containing daily measurements
         """
-        time_series = self.get_data(run_id=run_id,
-                                    metric_ids=['00003', '00060', '00001'])
-        if len(time_series) == 0:
+        metric_ids = list(DAILY_AGGREGATIONS.keys())
+        days, resolution = self.training_config(run_id)
+        start, _ = self.window(days)
+
+        def fingerprint(start_date, end_date):
+            return self.repo.get_input_fingerprint(
+                run_id, metric_ids, start_date, end_date, resolution,
+                RESOLUTION_METRICS)
+
+        history = None
+        if self.series_cache is not None:
+            with self.stage(run_id, 'series_cache') as stage:
+                cached = self.series_cache.get(run_id)
+                if cached is not None and \
+                        cached.start <= start < cached.through and \
+                        fingerprint(cached.start, cached.through) == \
+                        cached.fingerprint:
+                    history = cached.frame[cached.frame.index >=
+                                           pd.Timestamp(start, tz='UTC')]
+                    stage['rows'] = len(history)
+
+        time_series = self.get_data(
+            run_id=run_id, metric_ids=metric_ids,
+            start_date=cached.through if history is not None else None)
+        if history is None and len(time_series) == 0:
             return None
 
-        precip = time_series[time_series.metric_id == '00003']
-        precip['date_time'] = pd.to_datetime(precip['date_time'], utc=True)
-        precip.index = precip['date_time']
-        precip_daily = precip.resample('D').sum()
-
-        flow = time_series[time_series.metric_id == '00060']
-        flow['date_time'] = pd.to_datetime(flow['date_time'], utc=True)
-        flow.index = flow['date_time']
-        flow_daily = flow.resample('D').mean()
-
-        temp = time_series[time_series.metric_id == '00001']
-        temp['date_time'] = pd.to_datetime(temp['date_time'], utc=True)
-        temp.index = temp['date_time']
-        temp_daily = temp.resample('D').mean()
-
-        time_series_daily = temp_daily\
-            .merge(flow_daily,
-                   how='inner',
-                   left_index=True,
-                   right_index=True) \
-            .merge(precip_daily,
-                   how='inner',
-                   left_index=True,
-                   right_index=True)
-        time_series_daily.columns = ['temp', 'flow', 'precip']
-        time_series_daily = time_series_daily.dropna()
-        return time_series_daily
-
-    def arima_model(self, run_id):
+        with self.stage(run_id, 'daily_avg') as stage:
+            frames = [] if history is None else [history]
+            if len(time_series) > 0:
+                frames.append(daily_features(time_series))
+            features = pd.concat(frames)
+            stage['rows'] = len(features)
+
+        if self.series_cache is not None and len(features) > 0:
+            through = features.index[-1].tz_convert(None).to_pydatetime()
+            try:
+                self.series_cache.put(run_id, features.iloc[:-1], start,
+                                      through, fingerprint(start, through))
+            except OSError:
+                # the cache only saves work, a failed write costs a rebuild
+                pass
+
+        return features.dropna()
+
+    def select_order(self, run_id, flow, force=False):
+        """Returns the ARMA order to model a run with
+
+        The order cached for the run is reused until it is older than
+        ORDER_RESELECT_DAYS, as long as it was selected with the instance's
+        order method. Otherwise, or when forced, the order is searched for
+        and cached along with the flow series' fingerprint and the method,
+        replacing the previous order's baseline AIC.
+        The exhaustive arma_order_select_ic search runs across a process
+        pool if the instance has order workers, the hannan_rissanen order
+        method uses hannan_rissanen_order_select instead.
+
+        Args:
+            run_id (int): id of run for which model will be created
+            flow (Series): daily flow rate the order is selected on
+            force (bool) - optional: re-run the search even if the cached
+                order is current
+
+        Returns:
+            ModelOrder: the selected order
+
+        Raises:
+            ValueError: if the order search does not converge
+        """
+        now = datetime.datetime.now()
+
+        order = self.repo.get_model_order(run_id)
+        if not force and order is not None and \
+                order.method == self.order_method and \
+                now - order.selected_on < \
+                datetime.timedelta(days=ORDER_RESELECT_DAYS):
+            return order
+
+        with self.stage(run_id, 'select_order') as stage:
+            stage['rows'] = len(flow)
+            if self.order_method == 'hannan_rissanen':
+                params = hannan_rissanen_order_select(flow, ic='aic')
+            elif self.order_workers is None:
+                params = arma_order_select_ic(flow, ic='aic')
+            else:
+                params = parallel_order_select(flow, ic='aic',
+                                               workers=self.order_workers)
+        return self.repo.put_model_order(ModelOrder(
+            run_id=run_id,
+            p=int(params.aic_min_order[0]),
+            q=int(params.aic_min_order[1]),
+            fingerprint=data_fingerprint(flow),
+            selected_on=now,
+            method=self.order_method,
+            # merge keeps columns that are not set, the previous order's
+            # baseline must not carry over
+            aic=None,
+            nobs=None
+        ))
+
+    def fit(self, measures, order):
+        """Fits an ARIMA model with exogenous temperature and precipitation
+
+        If the run was last fit with the same order, its coefficients are
+        used as start parameters. A warm start that fails or does not
+        converge falls back to the default cold start. The coefficients,
+        iterations and fit time are stored for the next fit and kept in
+        Arima.last_fit.
+
+        Args:
+            measures (DataFrame): output of Arima.daily_avg
+            order (ModelOrder): ARMA order to fit
+
+        Returns:
+            ARIMAResults: fitted model
+        """
+        model = ARIMA(measures['flow'],
+                      order=(order.p, 0, order.q),
+                      exog=measures[['temp', 'precip']])
+
+        # constant, two exogenous coefficients, ar and ma terms
+        k = 3 + order.p + order.q
+        previous = self.repo.get_model_fit(order.run_id)
+
+        start = time.time()
+        with self.stage(order.run_id, 'fit') as stage:
+            stage['rows'] = len(measures)
+            mod = None
+            if previous is not None and \
+                    previous.model in (None, 'arima') and \
+                    (previous.p, previous.q) == (order.p, order.q) and \
+                    len(previous.params) == k:
+                try:
+                    mod = model.fit(start_params=np.array(previous.params))
+                    if not mod.mle_retvals.get('converged', True):
+                        mod = None
+                except Exception:
+                    mod = None
+
+            warm_start = mod is not None
+            if mod is None:
+                mod = model.fit()
+
+        self.last_fit = self.repo.put_model_fit(ModelFit(
+            run_id=order.run_id,
+            p=order.p,
+            q=order.q,
+            model='arima',
+            params=[float(p) for p in mod.params],
+            fit_on=datetime.datetime.now(),
+            warm_start=warm_start,
+            iterations=mod.mle_retvals.get('iterations'),
+            fit_seconds=time.time() - start,
+            state=None,
+            state_cov=None,
+            observed_through=None,
+            refit_on=None
+        ))
+        return mod
+
+    def update(self, measures, order, exog_future):
+        """Forecasts with a state-space model updated through the newest days
+
+        The run's stored coefficients and filtered state are reused and only
+        the Kalman filter is run, over the days observed since the state was
+        stored. The model is refit, warm-started from the stored
+        coefficients, when they are REFIT_DAYS old, were fit with a
+        different order or the update fails. The most recent day may still
+        be incomplete so the state is stored through the day before it and
+        that day is filtered again by the next update.
+
+        Args:
+            measures (DataFrame): output of Arima.daily_avg
+            order (ModelOrder): ARMA order of the model
+            exog_future (DataFrame): temp and precip for the next 7 days
+
+        Returns:
+            Series: flow rate forecast for the next 7 days
+        """
+        def model(data):
+            return SARIMAX(data['flow'].values,
+                           exog=data[['temp', 'precip']].values,
+                           order=(order.p, 0, order.q), trend='c')
+
+        def through(index):
+            return index.tz_convert(None).to_pydatetime()
+
+        previous = self.repo.get_model_fit(order.run_id)
+        now = datetime.datetime.now()
+        start = time.time()
+
+        if previous is not None and previous.model == 'statespace' and \
+                (previous.p, previous.q) == (order.p, order.q) and \
+                now - previous.refit_on < \
+                datetime.timedelta(days=REFIT_DAYS):
+            observed = pd.Timestamp(previous.observed_through, tz='UTC')
+            new = measures[measures.index > observed]
+            try:
+                if len(new) == 0:
+                    raise ValueError('no new observations')
+
+                with self.stage(order.run_id, 'update') as stage:
+                    stage['rows'] = len(new)
+                    mod = model(new)
+                    k = mod.k_states
+                    mod.initialize_known(np.array(previous.state),
+                                         np.array(previous.state_cov)
+                                         .reshape(k, k))
+                    res = mod.filter(np.array(previous.params))
+                    forecast = res.forecast(
+                        steps=7, exog=exog_future[['temp', 'precip']].values)
+
+                if len(new) > 1:
+                    previous.state = \
+                        [float(x) for x in res.predicted_state[:, -2]]
+                    previous.state_cov = [
+                        float(x) for x in
+                        res.predicted_state_cov[:, :, -2].ravel()]
+                    previous.observed_through = through(new.index[-2])
+
+                previous.fit_on = now
+                previous.warm_start = True
+                previous.iterations = 0
+                previous.fit_seconds = time.time() - start
+                self.last_fit = self.repo.put_model_fit(previous)
+                return pd.Series(forecast, name='flow')
+            except Exception:
+                pass
+
+        start_params = None
+        if previous is not None and previous.model == 'statespace' and \
+                (previous.p, previous.q) == (order.p, order.q):
+            start_params = np.array(previous.params)
+
+        with self.stage(order.run_id, 'fit') as stage:
+            stage['rows'] = len(measures)
+            res = model(measures).fit(start_params=start_params, disp=False)
+        if self.degraded(order, res):
+            raise ValueError('fit degraded')
+
+        self.last_fit = self.repo.put_model_fit(ModelFit(
+            run_id=order.run_id,
+            p=order.p,
+            q=order.q,
+            model='statespace',
+            params=[float(p) for p in res.params],
+            fit_on=now,
+            warm_start=start_params is not None,
+            iterations=res.mle_retvals.get('iterations'),
+            fit_seconds=time.time() - start,
+            state=[float(x) for x in res.predicted_state[:, -2]],
+            state_cov=[float(x) for x in
+                       res.predicted_state_cov[:, :, -2].ravel()],
+            observed_through=through(measures.index[-2]),
+            refit_on=now
+        ))
+        with self.stage(order.run_id, 'forecast') as stage:
+            stage['rows'] = 7
+            forecast = res.forecast(
+                steps=7, exog=exog_future[['temp', 'precip']].values)
+        return pd.Series(forecast, name='flow')
+
+    def degraded(self, order, mod):
+        """Checks a fit against its order's baseline fit
+
+        The first fit with a newly selected order becomes the baseline and
+        is recorded on the order.
+
+        Args:
+            order (ModelOrder): order the model was fit with
+            mod (ARIMAResults): fitted model
+
+        Returns:
+            bool: True if the fit's AIC per observation exceeds the
+            baseline's by more than ORDER_AIC_TOLERANCE
+        """
+        if order.aic is None:
+            order.aic = float(mod.aic)
+            order.nobs = int(mod.nobs)
+            self.repo.put_model_order(order)
+            return False
+
+        return mod.aic/mod.nobs > \
+            order.aic/order.nobs + ORDER_AIC_TOLERANCE
+
+    def arima_model(self, run_id, measures=None):
         """Creates flow rate predictions using ARIMA model.
 
-        Calls Arima.daily_avg to retrieve data for given run, then creates
-        flow rate predictions by using statsmodels functions
-        arma_order_select_ic and ARIMA. Three weeks of past flow rate data
-        are also returned for plotting purposes.
+        Calls Arima.daily_avg to retrieve data for given run unless its
+        daily data is given, e.g. from shared_series, then reuses
+        the forecast of a model already fit to exactly that data from the
+        model store, or creates flow rate predictions with Arima.forecast.
+        Arima.forecast runs in a forked process that is killed once it
+        exceeds the fit budget, without a session the fork's repository
+        replaces the instance's. If it is killed, dies without a result or
+        raises, the run is forecast with Arima.climatology instead. Model
+        forecasts are clipped by Arima.bound. The kind of model used is
+        kept in Arima.last_model. Three weeks of past flow rate data are
+        also returned for plotting purposes.
 
         Args:
             run_id (int): id of run for which model will be created
+            measures (DataFrame) - optional: output of Arima.daily_avg for
+                the run, retrieved if None
 
         Returns:
-            DataFrame: containing time-series flow rate predictions for next
+            Series: containing time-series flow rate predictions for next
             7 days and historical flow rate for past 21 days
         """
         # Retrieve data for modelling
-        measures = self.daily_avg(run_id)
+        self.last_fit = None
+        self.last_artifact = None
+        self.last_model = None
+        if measures is None:
+            measures = self.daily_avg(run_id)
 
         # don't try to compute if there aren't any measures
-        if measures is None:
+        if measures is None or len(measures) == 0:
             return pd.DataFrame()
 
         # Take past 7-day average of exogenous predictors to use for
@@ -131,41 +1173,225 @@ class Arima:
             ignore_index=True
         )
 
+        # Reuse the forecast of a model already fit to exactly this data
+        if self.store is not None:
+            self.last_artifact = self.store.get(
+                run_id, self.model_version, data_fingerprint(measures))
+
+        if self.last_artifact is not None:
+            prediction = pd.Series(self.last_artifact['forecast'],
+                                   name='flow')
+            self.last_model = str(self.last_artifact.get(
+                'model', 'statespace' if self.incremental else 'arima'))
+        elif self.fit_budget is None:
+            prediction = self.forecast(run_id, measures,
+                                       exog_future_predictors)
+        else:
+            try:
+                if self.session is None:
+                    prediction, self.last_model, records, self.repo = \
+                        run_with_budget(self.fit_budget, _forecast_in_fork,
+                                        self, run_id, measures,
+                                        exog_future_predictors)
+                else:
+                    prediction, self.last_model, records = run_with_budget(
+                        self.fit_budget, _forecast_in_child, type(self),
+                        self.session.bind.url, run_id, measures,
+                        exog_future_predictors, self.order_workers,
+                        self.incremental, self.store, self.order_method,
+                        self.profiler is not None)
+            except Exception:
+                # over budget, killed, e.g. out of memory, or failed
+                prediction = self.climatology(run_id, measures)
+            else:
+                for record in records:
+                    self.profiler.record(record)
+                self.last_fit = self.repo.get_model_fit(run_id)
+
+        if self.last_model in ('arima', 'statespace'):
+            prediction = self.bound(run_id, measures, prediction)
+
+        # Add dates and return past 21 days for plotting
+        return with_history(measures, prediction)
+
+    def forecast(self, run_id, measures, exog_future_predictors):
+        """Forecasts flow rate for the next 7 days
+
+        Fits a model with the order from Arima.select_order, or updates its
+        state-space model with Arima.update in incremental mode. If that
+        fit fails or has degraded the order is re-selected and the model
+        refit. Forecasts from a fitted model are kept in the model store.
+
+        Args:
+            run_id (int): id of run for which model will be created
+            measures (DataFrame): output of Arima.daily_avg
+            exog_future_predictors (DataFrame): predictors for next 7 days
+
+        Returns:
+            Series: flow rate forecast, or the Arima.climatology forecast if
+            no model could be fit
+        """
         try:
             # Find optimal order for model
-            params = arma_order_select_ic(measures['flow'], ic='aic')
+            order = self.select_order(run_id, measures['flow'])
             try:
-                # Build and fit model
-                mod = ARIMA(measures['flow'],
-                            order=(params.aic_min_order[0], 0,
-                                   params.aic_min_order[1]),
-                            exog=measures[['temp', 'precip']]).fit()
-
-                prediction = pd.DataFrame(
-                    [mod.forecast(steps=7,
-                                  exog=exog_future_predictors[
-                                      ['temp', 'precip']],
-                                  alpha=0.05)[0]]).T
+                # Build and fit model, re-selecting the order if the
+                # cached one no longer fits the data
+                if self.incremental:
+                    try:
+                        prediction = self.update(measures, order,
+                                                 exog_future_predictors)
+                    except Exception:
+                        order = self.select_order(run_id, measures['flow'],
+                                                  force=True)
+                        prediction = self.update(measures, order,
+                                                 exog_future_predictors)
+                else:
+                    try:
+                        mod = self.fit(measures, order)
+                        if self.degraded(order, mod):
+                            raise ValueError('fit degraded')
+                    except Exception:
+                        order = self.select_order(run_id, measures['flow'],
+                                                  force=True)
+                        mod = self.fit(measures, order)
+                        self.degraded(order, mod)
+
+                    with self.stage(run_id, 'forecast') as stage:
+                        stage['rows'] = 7
+                        prediction = pd.Series(
+                            mod.forecast(steps=7,
+                                         exog=exog_future_predictors[
+                                             ['temp', 'precip']],
+                                         alpha=0.05)[0], name='flow')
             except Exception:
-                # If model doesn't converge, return "prediction"
-                # of most recent day
-                prediction = pd.concat([measures.iloc[-1, :].to_frame().T]*7,
-                                       ignore_index=True)['flow']
+                # If model doesn't converge, return the climatology
+                return self.climatology(run_id, measures)
         except ValueError:
-            # If order fitting doesn't converge, return "prediction"
-            # of most recent day
-            prediction = pd.concat([measures.iloc[-1, :].to_frame().T]*7,
-                                   ignore_index=True)['flow']
-
-        # Add dates and return past 21 days for plotting
-        prediction_dates = [measures.index[-2] +
-                            datetime.timedelta(days=x) for x in range(0, 7)]
-        prediction.index = prediction_dates
-        past = measures['flow'][-22:-1]
-        prediction = pd.concat([past[:-1], prediction], axis=0)
+            # If order fitting doesn't converge, return the climatology
+            return self.climatology(run_id, measures)
 
+        self.last_model = 'statespace' if self.incremental else 'arima'
+        self.put_artifact(run_id, measures, order, prediction)
         return prediction
 
+    def forecast_climatology(self, run_id, measures):
+        """The climatology of the days of the year a forecast covers
+
+        Args:
+            run_id (int): id of run to forecast
+            measures (DataFrame): output of Arima.daily_avg
+
+        Returns:
+            DataFrame: one row of Repository.get_climatology per forecast
+            day, None if any day has fewer than CLIMATOLOGY_MIN_SAMPLES
+        """
+        days = [d.dayofyear for d in forecast_dates(measures)]
+        climatology = self.repo.get_climatology(run_id, days)
+        sampled = climatology.index[
+            climatology['samples'] >= CLIMATOLOGY_MIN_SAMPLES]
+        if not set(days).issubset(sampled):
+            return None
+
+        return climatology.loc[days]
+
+    def climatology(self, run_id, measures):
+        """Forecasts the median flow rate of each of the next 7 days of the
+        year
+
+        The forecast is looked up from the run's precomputed climatology,
+        see Repository.put_climatology, and falls back to
+        Arima.persistence for days of the year with too few samples.
+
+        Args:
+            run_id (int): id of run to forecast
+            measures (DataFrame): output of Arima.daily_avg
+
+        Returns:
+            Series: flow rate forecast
+        """
+        climatology = self.forecast_climatology(run_id, measures)
+        if climatology is None:
+            return self.persistence(measures)
+
+        self.last_model = 'climatology'
+        return pd.Series(climatology['q50'].values, name='flow')
+
+    def bound(self, run_id, measures, prediction):
+        """Clips a forecast to the range of flow rates seen on its days of
+        the year
+
+        Each day is bounded by the lowest and highest flow rate of its day
+        of the year, widened to the most recent day's flow rate and by
+        CLIMATOLOGY_MARGIN. Forecasts of runs without enough climatology
+        are returned unchanged.
+
+        Args:
+            run_id (int): id of run the forecast is for
+            measures (DataFrame): output of Arima.daily_avg the forecast was
+                made from
+            prediction (Series): 7-day flow rate forecast
+
+        Returns:
+            Series: the clipped forecast
+        """
+        climatology = self.forecast_climatology(run_id, measures)
+        if climatology is None:
+            return prediction
+
+        last = measures['flow'].iloc[-1]
+        lower = np.minimum(climatology['min'].values, last)
+        upper = np.maximum(climatology['max'].values, last)
+        return pd.Series(np.clip(prediction.values,
+                                 lower*(1 - CLIMATOLOGY_MARGIN),
+                                 upper*(1 + CLIMATOLOGY_MARGIN)),
+                         index=prediction.index, name=prediction.name)
+
+    def persistence(self, measures):
+        """Forecasts the most recent day's flow rate for the next 7 days
+
+        Args:
+            measures (DataFrame): output of Arima.daily_avg
+
+        Returns:
+            Series: flow rate forecast
+        """
+        self.last_model = 'persistence'
+        return pd.Series([measures['flow'].iloc[-1]]*7, name='flow')
+
+    def put_artifact(self, run_id, measures, order, prediction):
+        """Keeps the last fit and its forecast in the model store
+
+        Args:
+            run_id (int): id of run the model was fit for
+            measures (DataFrame): data the model was fit on
+            order (ModelOrder): order the model was fit with
+            prediction (Series): the model's forecast
+        """
+        fit = self.last_fit
+        if self.store is None or fit is None:
+            return
+
+        try:
+            self.store.put(run_id, self.model_version,
+                           data_fingerprint(measures), {
+                               'p': order.p,
+                               'q': order.q,
+                               'params': fit.params,
+                               'state': fit.state,
+                               'state_cov': fit.state_cov,
+                               'aic': order.aic,
+                               'nobs': order.nobs,
+                               'warm_start': fit.warm_start,
+                               'iterations': fit.iterations,
+                               'fit_seconds': fit.fit_seconds,
+                               'model': self.last_model,
+                               'forecast': prediction.values
+                           })
+        except OSError:
+            # the store is a cache, a failed write only costs a refit
+            pass
+
     def get_min_max(self, run_id):
         """Gets min and max runnable flow rate for river run to use for plots
 
@@ -178,3 +1404,35 @@ class Arima:
         runs = self.repo.get_all_runs()
         levels = runs[['min_level', 'max_level']][runs['run_id'] == run_id]
         return levels
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='force ARMA order re-selection')
+    parser.add_argument('--reselect', nargs='*', type=int, required=True,
+                        metavar='run_id')
+    parser.add_argument('--order-method', default=ORDER_METHOD,
+                        choices=['exhaustive', 'hannan_rissanen'])
+    args = parser.parse_args()
+
+    session = Context(settings.DATABASE).Session()
+    arima = Arima(session, order_method=args.order_method)
+
+    run_ids = args.reselect
+    if len(run_ids) == 0:
+        run_ids = [r.run_id for r in
+                   arima.repo.get_all_runs_as_list(lightweight=True)]
+
+    for run_id in run_ids:
+        measures = arima.daily_avg(run_id)
+        if measures is None or len(measures) == 0:
+            print(f'{run_id}: no measurements')
+            continue
+
+        try:
+            order = arima.select_order(run_id, measures['flow'], force=True)
+            print(f'{run_id}: ({order.p}, 0, {order.q})')
+        except ValueError as e:
+            print(f'{run_id}: order selection failed - {e}')
+
+    session.close()
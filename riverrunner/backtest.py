@@ -0,0 +1,482 @@
+""" script that backtests model configurations with rolling-origin evaluation
+
+Examples:
+    python backtest.py [--synthetic RUNS | --run-ids RUN_ID ...] [--configs NAME ...] [--origins N] [--horizon DAYS]
+                       [--workers N] [--output PATH]
+
+    * loads every run's daily features from the database, or generates synthetic runs
+    * forecasts each run from several origins rolling back through its history with every model configuration, the
+      arima and statespace configurations with an Arima instance over an in-memory repository so cached orders,
+      warm starts, incremental updates, the model store and the fit budget carry from one origin to the next
+    * records forecast error, fit latency and peak memory per run, origin and configuration
+    * writes a JSON report with the individual results and a summary per configuration
+
+Classes:
+    MemoryRepository: the orders, fits and climatology Arima reads and writes, kept in memory
+        Functions:
+            put_climatology: compute a run's day-of-year climatology from its training days
+
+Functions:
+    rolling_origins: positions in a run's history forecasts are made from
+
+    config_model: the Arima instance a model configuration is forecast with
+
+    forecast_config: fit a model configuration to a run's training days and forecast
+
+    backtest_run: evaluate every configuration on one run from every origin
+
+    summarize: aggregate results per configuration
+
+    backtest: evaluate every configuration on every run across a process pool
+
+    synthetic_frames: daily features of synthetic runs
+
+    database_frames: daily features of runs in the database
+
+    write_report: atomically write a report as JSON
+"""
+
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import datetime as dt
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from riverrunner import settings
+from riverrunner.arima import FIT_BUDGET, ORDER_METHOD, Arima, batched_arx, daily_features
+from riverrunner.context import Context
+from riverrunner.model_store import ModelStore
+
+
+"""a model configuration, engine is one of arima, statespace, arx or persistence. the arima and statespace engines
+are forecast by Arima.arima_model, statespace with incremental updates, order_method is their order search, see
+Arima.select_order, store keeps their fitted models in a model store and fit_budget is the seconds a fit may take,
+unbounded if None"""
+ModelConfig = namedtuple('ModelConfig', ['name', 'engine', 'order_method', 'store', 'fit_budget'])
+
+"""configurations backtested by default"""
+CONFIGS = [
+    ModelConfig('arima', 'arima', 'exhaustive', False, None),
+    ModelConfig('arima_hannan_rissanen', 'arima', 'hannan_rissanen', False, None),
+    ModelConfig('arima_daily', 'arima', 'exhaustive', True, FIT_BUDGET),
+    ModelConfig('statespace', 'statespace', 'exhaustive', False, None),
+    ModelConfig('arx', 'arx', None, False, None),
+    ModelConfig('persistence', 'persistence', None, False, None)
+]
+
+"""number of origins each run is forecast from"""
+BACKTEST_ORIGINS = 4
+
+"""days forecast from each origin"""
+BACKTEST_HORIZON = 7
+
+"""minimum days of training history for an origin to be evaluated"""
+MIN_TRAINING_DAYS = 60
+
+"""file the report is written to"""
+BACKTEST_REPORT = 'data/backtest.json'
+
+
+class MemoryRepository:
+    """
+    Keeps the model orders, fits and climatology Arima reads and writes in memory, in place of a Repository over
+    the database. every run uses the default training window and resolution
+    """
+    climatology_columns = ['day_of_year', 'samples', 'min', 'q10', 'q25', 'q50', 'q75', 'q90', 'max']
+
+    def __init__(self):
+        self.orders = {}
+        self.fits = {}
+        self.climatologies = {}
+
+    def get_training_config(self, run_id):
+        """see Repository.get_training_config"""
+        return None, None
+
+    def get_model_order(self, run_id):
+        """see Repository.get_model_order"""
+        return self.orders.get(run_id)
+
+    def put_model_order(self, order):
+        """see Repository.put_model_order"""
+        self.orders[order.run_id] = order
+        return order
+
+    def get_model_fit(self, run_id):
+        """see Repository.get_model_fit"""
+        return self.fits.get(run_id)
+
+    def put_model_fit(self, fit):
+        """see Repository.put_model_fit"""
+        self.fits[fit.run_id] = fit
+        return fit
+
+    def get_climatology(self, run_id, days_of_year=None):
+        """see Repository.get_climatology"""
+        climatology = self.climatologies.get(run_id)
+        if climatology is None:
+            return pd.DataFrame(columns=self.climatology_columns).set_index('day_of_year')
+        if days_of_year is None:
+            return climatology
+
+        return climatology[climatology.index.isin([int(d) for d in days_of_year])]
+
+    def put_climatology(self, run_id, flow, window=7):
+        """compute a run's day-of-year climatology from its training days
+
+        the statistics of a day of the year are computed over every day whose day of the year is within window days
+        of it, as in Repository.put_climatology, replacing the run's previous climatology
+
+        Args:
+            run_id: (int) run the flow rate is for
+            flow: (Series) daily flow rate
+            window: (int) optional days either side of a day of the year its statistics are computed over
+        """
+        flow = flow.dropna()
+        days = np.arange(1, 367)
+        distance = np.abs(days[:, None] - flow.index.dayofyear.values[None, :])
+        near = np.minimum(distance, 366 - distance) <= window
+
+        rows = []
+        for day, mask in zip(days, near):
+            samples = flow.values[mask]
+            if len(samples) > 0:
+                rows.append([day, len(samples), samples.min(), *np.percentile(samples, [10, 25, 50, 75, 90]),
+                             samples.max()])
+
+        self.climatologies[run_id] = pd.DataFrame(rows, columns=self.climatology_columns).set_index('day_of_year')
+
+
+def rolling_origins(n, origins=BACKTEST_ORIGINS, horizon=BACKTEST_HORIZON, step=None):
+    """positions in a run's history forecasts are made from
+
+    the last origin leaves exactly horizon days to score its forecast on, earlier origins are step days apart.
+    origins with fewer than MIN_TRAINING_DAYS days of training history are dropped
+
+    Args:
+        n: (int) days of history
+        origins: (int) optional number of origins
+        horizon: (int) optional days forecast from each origin
+        step: (int) optional days between origins, defaults to horizon so scored days do not overlap
+
+    Returns:
+        [int]: number of training days of each origin, oldest first
+    """
+    if step is None:
+        step = horizon
+
+    cuts = [n - horizon - i*step for i in reversed(range(origins))]
+    return [cut for cut in cuts if cut >= MIN_TRAINING_DAYS]
+
+
+def config_model(config, directory=None):
+    """the Arima instance a model configuration is forecast with
+
+    the instance has no session and reads and writes a MemoryRepository, so a run's orders and fits carry from one
+    forecast to the next as they do from day to day in the database
+
+    Args:
+        config: (ModelConfig) configuration to forecast
+        directory: (str) optional directory of the model store, required if the configuration stores its models
+
+    Returns:
+        Arima: the configured instance
+    """
+    return Arima(None, incremental=config.engine == 'statespace', order_method=config.order_method or ORDER_METHOD,
+                 store=ModelStore(directory) if config.store else None, fit_budget=config.fit_budget,
+                 series_cache=None, repo=MemoryRepository())
+
+
+def forecast_config(config, train, horizon=BACKTEST_HORIZON, arima=None, run_id=0):
+    """fit a model configuration to a run's training days and forecast
+
+    the arima and statespace engines forecast with Arima.arima_model, after the run's climatology is computed from
+    the training days, and may fall back to climatology or persistence as the daily job does, see Arima.last_model.
+    the arx engine forecasts with batched_arx as the daily job's arx engine does
+
+    Args:
+        config: (ModelConfig) configuration to fit
+        train: (DataFrame) output of Arima.daily_avg up to the origin
+        horizon: (int) optional days to forecast, at most 7 for the arima and statespace engines
+        arima: (Arima) optional instance to forecast with, see config_model, a new one without a model store if
+            None
+        run_id: (int) optional run the instance keys the training days' order and fit by
+
+    Returns:
+        ndarray: flow rate forecast
+
+    Raises:
+        ValueError: if the engine is unknown or the model cannot be fit
+    """
+    if config.engine == 'persistence':
+        return np.repeat(float(train['flow'].iloc[-1]), horizon)
+
+    if config.engine == 'arx':
+        forecast = batched_arx([train], steps=horizon)[0]
+        if forecast is None:
+            raise ValueError('not enough observations to fit')
+        return forecast.values
+
+    if config.engine not in ('arima', 'statespace'):
+        raise ValueError(f'unknown engine: {config.engine}')
+
+    if horizon > 7:
+        raise ValueError(f'Arima forecasts 7 days, not {horizon}')
+
+    if arima is None:
+        arima = config_model(config._replace(store=False))
+
+    arima.repo.put_climatology(run_id, train['flow'])
+    forecast = arima.arima_model(run_id, train)
+    if len(forecast) == 0:
+        raise ValueError('no training days to fit')
+
+    # arima_model returns the past flow rate followed by its 7-day forecast
+    return forecast.values[-7:][:horizon]
+
+
+def backtest_run(run_id, measures, configs=CONFIGS, origins=BACKTEST_ORIGINS, horizon=BACKTEST_HORIZON,
+                 window=None):
+    """evaluate every configuration on one run from every origin
+
+    each configuration is forecast from every origin, oldest first, by one Arima instance, see config_model, with
+    a temporary model store. each fit runs under tracemalloc to measure its peak memory, the tracing overhead is
+    included in the latencies of every configuration alike. the CPU time and memory of fits forked to enforce a fit
+    budget are not measured. failures are recorded rather than raised
+
+    Args:
+        run_id: (int) run the daily features are for
+        measures: (DataFrame) output of Arima.daily_avg
+        configs: ([ModelConfig]) optional configurations to evaluate
+        origins: (int) optional number of origins
+        horizon: (int) optional days forecast from each origin
+        window: (int) optional days of history before each origin to train on, all of it if None
+
+    Returns:
+        [dict]: one result per configuration and origin with run_id, config, window, origin, training days, the
+        kind of model Arima forecast with, mae, rmse, fit wall-clock and CPU seconds, peak memory in megabytes and the
+        error message of a failed fit
+    """
+    directory = tempfile.mkdtemp()
+    models = {config.name: config_model(config, os.path.join(directory, config.name)) for config in configs}
+
+    results = []
+    try:
+        for cut in rolling_origins(len(measures), origins, horizon):
+            train = measures.iloc[:cut] if window is None else measures.iloc[max(0, cut - window):cut]
+            actual = measures['flow'].values[cut:cut + horizon]
+
+            for config in configs:
+                results.append(_backtest_origin(run_id, config, models[config.name], train, actual, horizon, window,
+                                                str(measures.index[cut].date())))
+    finally:
+        shutil.rmtree(directory)
+
+    return results
+
+
+def _backtest_origin(run_id, config, arima, train, actual, horizon, window, origin):
+    """forecast_config from one origin under tracemalloc, see backtest_run"""
+    result = dict(run_id=run_id, config=config.name, window=window, origin=origin, days=len(train), model=None,
+                  mae=None, rmse=None, wall=None, cpu=None, peak_mb=None, error=None)
+
+    tracemalloc.start()
+    wall, cpu = time.time(), time.process_time()
+    try:
+        forecast = forecast_config(config, train, horizon, arima, run_id)
+        result['wall'] = time.time() - wall
+        result['cpu'] = time.process_time() - cpu
+        result['model'] = arima.last_model if config.engine in ('arima', 'statespace') else config.engine
+
+        error = forecast - actual
+        result['mae'] = float(np.mean(np.abs(error)))
+        result['rmse'] = float(np.sqrt(np.mean(error**2)))
+    except Exception as e:
+        result['error'] = repr(e)
+    finally:
+        result['peak_mb'] = tracemalloc.get_traced_memory()[1]/2**20
+        tracemalloc.stop()
+
+    if result['mae'] is not None and not np.isfinite(result['mae']):
+        result['mae'] = result['rmse'] = None
+        result['error'] = 'forecast is not finite'
+
+    return result
+
+
+def summarize(results):
+    """aggregate results per configuration
+
+    Args:
+        results: ([dict]) output of backtest_run
+
+    Returns:
+        {str: dict}: for each configuration the runs, forecasts and failures, mean mae and rmse over successful
+        forecasts, mean and 95th percentile fit seconds, total CPU seconds and largest peak memory. if persistence
+        was evaluated, skill is 1 - mae/persistence mae over the run origins both forecast
+    """
+    if len(results) == 0:
+        return {}
+
+    df = pd.DataFrame(results)
+    ok = df[df['error'].isnull()]
+
+    persistence = ok[ok['config'] == 'persistence'].set_index(['run_id', 'origin'])['mae']
+
+    summary = {}
+    for name, group in df.groupby('config', sort=False):
+        scored = ok[ok['config'] == name]
+        entry = dict(
+            runs=int(group['run_id'].nunique()),
+            forecasts=int(len(group)),
+            failures=int(group['error'].notnull().sum()),
+            mae=float(scored['mae'].mean()) if len(scored) > 0 else None,
+            rmse=float(np.sqrt((scored['rmse']**2).mean())) if len(scored) > 0 else None,
+            wall=float(scored['wall'].mean()) if len(scored) > 0 else None,
+            wall_p95=float(scored['wall'].quantile(.95)) if len(scored) > 0 else None,
+            cpu=float(scored['cpu'].sum()),
+            peak_mb=float(group['peak_mb'].max())
+        )
+
+        if len(persistence) > 0 and len(scored) > 0:
+            paired = scored.set_index(['run_id', 'origin'])['mae'].to_frame('mae')\
+                .join(persistence.rename('baseline'), how='inner')
+            baseline = paired['baseline'].mean()
+            entry['skill'] = float(1 - paired['mae'].mean()/baseline) if baseline > 0 else None
+
+        summary[name] = entry
+
+    return summary
+
+
+def _backtest_job(job):
+    """backtest_run in a pool worker"""
+    return backtest_run(*job)
+
+
+def backtest(frames, configs=CONFIGS, origins=BACKTEST_ORIGINS, horizon=BACKTEST_HORIZON, workers=None,
+             windows=(None,)):
+    """evaluate every configuration on every run across a process pool
+
+    the summary pools every training window, see window_sweep to compare them
+
+    Args:
+        frames: ({int: DataFrame}) output of Arima.daily_avg by run id
+        configs: ([ModelConfig]) optional configurations to evaluate
+        origins: (int) optional number of origins per run
+        horizon: (int) optional days forecast from each origin
+        workers: (int) optional number of worker processes, runs are evaluated serially if 1 and across the CPUs if
+            None
+        windows: ([int]) optional training windows in days to evaluate, None for all of a run's history
+
+    Returns:
+        dict: report with its creation time, settings, configurations, summary per configuration and every result
+    """
+    jobs = [(run_id, measures, configs, origins, horizon, window) for run_id, measures in frames.items()
+            if measures is not None and len(measures) > 0 for window in windows]
+
+    if workers == 1:
+        results = [r for job in jobs for r in _backtest_job(job)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = [r for run_results in pool.map(_backtest_job, jobs) for r in run_results]
+
+    return dict(
+        created=dt.datetime.now().isoformat(),
+        origins=origins,
+        horizon=horizon,
+        windows=list(windows),
+        configs=[c._asdict() for c in configs],
+        summary=summarize(results),
+        results=results
+    )
+
+
+def synthetic_frames(runs, days=4*365):
+    """daily features of synthetic runs
+
+    Args:
+        runs: (int) number of runs, numbered from 0
+        days: (int) optional days of history per run
+
+    Returns:
+        {int: DataFrame}: daily features by run id
+    """
+    # imported here as the benchmarks are not needed against the database
+    from riverrunner.static.benchmarks import synthetic_measurements
+
+    return {run_id: daily_features(synthetic_measurements(days, seed=run_id)).dropna() for run_id in range(runs)}
+
+
+def database_frames(session, run_ids=None, training_days=None):
+    """daily features of runs in the database
+
+    Args:
+        session: (Session) database connection
+        run_ids: ([int]) optional runs to load, every run if None
+        training_days: (int) optional days of history to load, each run's training window if None
+
+    Returns:
+        {int: DataFrame}: daily features by run id, None for runs without measurements
+    """
+    arima = Arima(session, store=None, training_days=training_days)
+    if run_ids is None:
+        run_ids = [r.run_id for r in arima.repo.get_all_runs_as_list(lightweight=True)]
+
+    return {run_id: arima.daily_avg(run_id) for run_id in run_ids}
+
+
+def write_report(report, path=BACKTEST_REPORT):
+    """atomically write a report as JSON
+
+    Args:
+        report: (dict) output of backtest
+        path: (str) optional destination file
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='backtest model configurations with rolling-origin evaluation')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--synthetic', type=int, metavar='RUNS', help='backtest this many synthetic runs')
+    source.add_argument('--run-ids', nargs='+', type=int, help='runs to backtest, every run if omitted')
+    parser.add_argument('--configs', nargs='+', choices=[c.name for c in CONFIGS], default=[c.name for c in CONFIGS])
+    parser.add_argument('--origins', type=int, default=BACKTEST_ORIGINS)
+    parser.add_argument('--horizon', type=int, default=BACKTEST_HORIZON)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=BACKTEST_REPORT)
+    args = parser.parse_args()
+
+    pd.options.mode.chained_assignment = None
+
+    if args.synthetic is not None:
+        frames = synthetic_frames(args.synthetic)
+    else:
+        session = Context(settings.DATABASE).Session()
+        frames = database_frames(session, args.run_ids)
+        session.close()
+
+    configs = [c for c in CONFIGS if c.name in args.configs]
+    report = backtest(frames, configs, args.origins, args.horizon, args.workers)
+    write_report(report, args.output)
+
+    for name, entry in report['summary'].items():
+        mae = f'{entry["mae"]:.1f}' if entry['mae'] is not None else '-'
+        wall = f'{entry["wall"]:.2f}s' if entry['wall'] is not None else '-'
+        print(f'{name}: MAE {mae}, {wall} per fit, {entry["peak_mb"]:.1f}MB peak, '
+              f'{entry["failures"]}/{entry["forecasts"]} failed')
+    print(f'report written to {args.output}')
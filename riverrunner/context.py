@@ -18,15 +18,18 @@ Classes:
         context initialization.
 
     ORM Classes: map objects their respective type to their associated database tables. See the design
-    specification for more detailed information. Mapped objects defined below are: Address, Measurement,
-    Metric, Prediction, RiverRun, State, Station, StationRiverDistance, and TmpMeasurement.
+    specification for more detailed information. Mapped objects defined below are: Address, Climatology,
+    DailyMeasurement, Measurement, Metric, ModelFit, ModelOrder, Prediction, RiverRun, SeriesDiagnostics, State, Station,
+    StationRiverDistance, and TmpMeasurement.
 """
 
 
+from contextlib import contextmanager
 import datetime
-from sqlalchemy import create_engine, select
+from sqlalchemy import and_, case, create_engine, exists, func, or_, select
 from sqlalchemy.engine.url import URL
-from sqlalchemy import Column, Integer, String, Float, DateTime, Index, ForeignKey, ForeignKeyConstraint
+from sqlalchemy import ARRAY, Boolean, Column, Integer, String, Float, Date, DateTime, Index, ForeignKey, \
+    ForeignKeyConstraint
 from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
@@ -35,6 +38,26 @@ from sqlalchemy.ext.hybrid import hybrid_property
 """ SQLAlchemy declarative base for ORM features """
 Base = declarative_base()
 
+""" session factory for units of work, see unit_of_work """
+UnitOfWork = sessionmaker(expire_on_commit=False)
+
+""" statements bringing tables created before a column or index was introduced up to date, must be idempotent """
+MIGRATIONS = [
+    'ALTER TABLE river_run ADD COLUMN IF NOT EXISTS runability FLOAT',
+    'CREATE INDEX IF NOT EXISTS ix_river_run_runability ON river_run (runability)',
+    'ALTER TABLE river_run ADD COLUMN IF NOT EXISTS runability_on TIMESTAMP',
+    'ALTER TABLE river_run ADD COLUMN IF NOT EXISTS input_fingerprint VARCHAR(40)',
+    'ALTER TABLE river_run ADD COLUMN IF NOT EXISTS training_days INTEGER',
+    'ALTER TABLE river_run ADD COLUMN IF NOT EXISTS training_resolution INTEGER',
+    'ALTER TABLE model_order ADD COLUMN IF NOT EXISTS method VARCHAR(31)',
+    'ALTER TABLE prediction ADD COLUMN IF NOT EXISTS model VARCHAR(16)',
+    'ALTER TABLE model_fit ADD COLUMN IF NOT EXISTS model VARCHAR(16)',
+    'ALTER TABLE model_fit ADD COLUMN IF NOT EXISTS state FLOAT[]',
+    'ALTER TABLE model_fit ADD COLUMN IF NOT EXISTS state_cov FLOAT[]',
+    'ALTER TABLE model_fit ADD COLUMN IF NOT EXISTS observed_through TIMESTAMP WITHOUT TIME ZONE',
+    'ALTER TABLE model_fit ADD COLUMN IF NOT EXISTS refit_on TIMESTAMP WITHOUT TIME ZONE'
+]
+
 
 class Context(object):
     """generate a managed session with the database
@@ -62,6 +85,61 @@ class Context(object):
             exit(101)
 
         Base.metadata.create_all(self.__engine)
+        for migration in MIGRATIONS:
+            self.__engine.execute(migration)
+
+
+def compute_runability(predictions, min_level, max_level):
+    """rate today's predicted flow against a run's recommended levels
+
+    Args:
+        predictions ([Prediction]): the run's predictions
+        min_level (int): minimum recommended flow rate
+        max_level (int): maximum recommended flow rate
+
+    Returns:
+        float: distance of today's flow rate from the midpoint of the recommended range relative to half the range,
+        -1 if the range is unknown and -2 if there is no prediction for today
+    """
+    today = datetime.datetime.today()
+    predictions = list(predictions)
+
+    td = datetime.timedelta(days=1)
+    t_prediction = [p for p in predictions if today - td <= p.timestamp < today + td]
+    if len(t_prediction) == 0:
+        return -2
+    elif max_level is None or min_level is None:
+        return -1.
+    else:
+        p = min(t_prediction, key=lambda p: p.timestamp)
+
+        midpoint = (max_level+min_level)/2.
+        den = float(max_level-midpoint)
+        return float(abs(p.fr-midpoint)/den) if den != 0 else -1.
+
+
+@contextmanager
+def unit_of_work(bind):
+    """managed short-lived session
+
+    the session does not expire objects on commit, is committed when the block exits, rolled back if it raises and
+    always closed
+
+    Args:
+        bind (Engine): database the session connects to
+
+    Yields:
+        Session: the unit of work's session
+    """
+    session = UnitOfWork(bind=bind)
+    try:
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
 
 class Address(Base):
@@ -99,6 +177,80 @@ class Address(Base):
         return '%s, %s, %s' % (self.address, self.city, self.state)
 
 
+class Climatology(Base):
+    """ORM mapping for the day-of-year flow rate climatology of a run
+
+    the statistics of each day of the year are taken over the daily mean flow rate rollups of the run's closest USGS
+    station on every day of every year within a window around it, see Repository.put_climatology
+
+    Attributes:
+        run_id (int): reference to the river run the climatology is for
+        day_of_year (int): day of the year, 1 through 366
+        samples (int): number of daily rollups the statistics were computed from
+        min (float): lowest daily mean flow rate
+        q10 (float): 10th percentile of the daily mean flow rate
+        q25 (float): 25th percentile of the daily mean flow rate
+        q50 (float): median daily mean flow rate
+        q75 (float): 75th percentile of the daily mean flow rate
+        q90 (float): 90th percentile of the daily mean flow rate
+        max (float): highest daily mean flow rate
+        updated_on (DateTime): when the statistics were last recomputed
+    """
+    __tablename__ = 'climatology'
+
+    run_id = Column(ForeignKey('river_run.run_id'), primary_key=True)
+    day_of_year = Column(Integer, primary_key=True)
+
+    samples = Column(Integer, nullable=False)
+    min = Column(Float)
+    q10 = Column(Float)
+    q25 = Column(Float)
+    q50 = Column(Float)
+    q75 = Column(Float)
+    q90 = Column(Float)
+    max = Column(Float)
+
+    updated_on = Column(DateTime)
+
+    def __repr__(self):
+        return f'<Climatology(run_id="{self.run_id}", day_of_year="{self.day_of_year}")>'
+
+
+class DailyMeasurement(Base):
+    """ORM mapping for daily measurement rollups
+
+    raw measurements older than the retention window are compacted into one row per station, metric and day
+
+    Attributes:
+        date (Date): the day the rollup covers
+        metric_id (int): reference to the metric gathered
+        station_id (str): reference to the weather station that gathered the measurements
+        count (int): number of raw measurements in the day
+        mean (float): mean of the day's values
+        sum (float): sum of the day's values
+        min (float): minimum of the day's values
+        max (float): maximum of the day's values
+    """
+    __tablename__ = 'daily_measurement'
+
+    date = Column(Date, primary_key=True)
+
+    metric_id = Column(ForeignKey('metric.metric_id'), primary_key=True)
+    metric    = relationship('Metric')
+
+    station_id = Column(ForeignKey('station.station_id'), primary_key=True)
+    station = relationship('Station')
+
+    count = Column(Integer)
+    mean  = Column(Float)
+    sum   = Column(Float)
+    min   = Column(Float)
+    max   = Column(Float)
+
+    def __repr__(self):
+        return f'<DailyMeasurement(station_id="{self.station_id}", date="{self.date}", metric="{self.metric_id}")>'
+
+
 class Measurement(Base):
     """ORM mapping for measurements
 
@@ -165,6 +317,78 @@ class Metric(Base):
         return f'metric_id: {self.metric_id}, name: {self.name}'
 
 
+class ModelFit(Base):
+    """ORM mapping for the most recent model fit of a run
+
+    Attributes:
+        run_id (int): reference to the river run the model was fit for
+        p (int): autoregressive order of the fit
+        q (int): moving average order of the fit
+        model (str): model the coefficients belong to, 'arima' or 'statespace'
+        params ([float]): fitted coefficients, used as the next fit's start parameters
+        fit_on (DateTime): when the model was fit or its state last updated
+        warm_start (bool): whether the fit started from the previous fit's coefficients
+        iterations (int): optimizer iterations the fit took, 0 for a state update
+        fit_seconds (float): wall-clock time the fit took
+        state ([float]): statespace only, predicted state for the day after observed_through
+        state_cov ([float]): statespace only, flattened covariance of the predicted state
+        observed_through (DateTime): statespace only, last daily observation the state has been filtered through
+        refit_on (DateTime): statespace only, when the coefficients were last estimated
+    """
+    __tablename__ = 'model_fit'
+
+    run_id = Column(ForeignKey('river_run.run_id'), primary_key=True)
+
+    p = Column(Integer, nullable=False)
+    q = Column(Integer, nullable=False)
+    model = Column(String(16))
+    params = Column(ARRAY(Float), nullable=False)
+
+    fit_on = Column(DateTime, nullable=False)
+    warm_start  = Column(Boolean)
+    iterations  = Column(Integer)
+    fit_seconds = Column(Float)
+
+    state = Column(ARRAY(Float))
+    state_cov = Column(ARRAY(Float))
+    observed_through = Column(DateTime)
+    refit_on = Column(DateTime)
+
+    def __repr__(self):
+        return f'<ModelFit(run_id="{self.run_id}", fit_on="{self.fit_on}")>'
+
+
+class ModelOrder(Base):
+    """ORM mapping for the ARMA order selected for a run
+
+    Attributes:
+        run_id (int): reference to the river run the order was selected for
+        p (int): autoregressive order
+        q (int): moving average order
+        fingerprint (str): fingerprint of the flow series the order was selected on
+        selected_on (DateTime): when the order was selected
+        method (str): order search the order was selected with, see Arima.select_order
+        aic (float): AIC of the first model fit with this order, the baseline later fits are compared against
+        nobs (int): number of observations the baseline fit used
+    """
+    __tablename__ = 'model_order'
+
+    run_id = Column(ForeignKey('river_run.run_id'), primary_key=True)
+
+    p = Column(Integer, nullable=False)
+    q = Column(Integer, nullable=False)
+
+    fingerprint = Column(String(64))
+    selected_on = Column(DateTime, nullable=False)
+    method = Column(String(31))
+
+    aic  = Column(Float)
+    nobs = Column(Integer)
+
+    def __repr__(self):
+        return f'<ModelOrder(run_id="{self.run_id}", p="{self.p}", q="{self.q}")>'
+
+
 class Prediction(Base):
     """ORM mapping for predictions
 
@@ -174,6 +398,7 @@ class Prediction(Base):
         fr_lb (float): the lower bound of a confidence interval surrounding the prediction
         fr (float): the predicted flow rate
         fr_ub (float): the upper bound of a confidence interval surrounding the prediction
+        model (str): kind of model the forecast was published from, see Arima.last_model
     """
     __tablename__ = 'prediction'
 
@@ -183,6 +408,7 @@ class Prediction(Base):
     fr_lb = Column(Float)
     fr    = Column(Float)
     fr_ub = Column(Float)
+    model = Column(String(16))
 
     @hybrid_property
     def year(self):
@@ -219,6 +445,14 @@ class RiverRun(Base):
         run_name (str): the name of the run
         take_out_latitude (float) geographical latitude (DD) representing where the run ends
         take_out_longitude (float) geographical longitdue (DD) representing where the run ends
+        runability (float): todays_runability as of runability_on, a snapshot that goes stale when the daily job
+            fails, see Repository.put_runability
+        runability_on (DateTime): when runability was last computed
+        input_fingerprint (str): fingerprint of the measurements and model configuration the run's published
+            predictions were computed from, see daily.prediction_fingerprint
+        training_days (int): days of history the run's model is trained on, arima.TRAINING_DAYS if None
+        training_resolution (int): minutes between the flow and temperature measurements the run's model is trained
+            on, arima.TRAINING_RESOLUTION if None
     """
     __tablename__ = 'river_run'
 
@@ -239,7 +473,7 @@ class RiverRun(Base):
     max_level = Column(Integer)
     min_level = Column(Integer)
 
-    predictions = relationship("Prediction", lazy='joined')
+    predictions = relationship("Prediction", lazy='joined', order_by="Prediction.timestamp")
 
     put_in_latitude  = Column(Float, nullable=False)
     put_in_longitude = Column(Float, nullable=False)
@@ -259,6 +493,12 @@ class RiverRun(Base):
         primaryjoin="and_(Address.latitude == foreign(RiverRun.take_out_latitude), "
                     "Address.longitude == foreign(RiverRun.take_out_longitude))")
 
+    runability = Column(Float, index=True)
+    runability_on = Column(DateTime)
+    input_fingerprint = Column(String(40))
+    training_days = Column(Integer)
+    training_resolution = Column(Integer)
+
     def __repr__(self):
         return 'RiverRun(run_id="%s", run_name="%s")>' % (self.run_id, self.run_name)
 
@@ -298,27 +538,82 @@ class RiverRun(Base):
 
     @hybrid_property
     def todays_runability(self):
-        today = datetime.datetime.today()
-        predictions = list(self.predictions)
+        return compute_runability(self.predictions, self.min_level, self.max_level)
 
+    @todays_runability.expression
+    def todays_runability(cls):
+        """SQL form of todays_runability evaluated by the database for every run in a single statement"""
+        today = datetime.datetime.today()
         td = datetime.timedelta(days=1)
-        t_prediction = [p for p in predictions if today - td <= p.timestamp < today + td]
-        if len(t_prediction) == 0:
-            return -2
-        elif self.max_level is None or self.min_level is None:
-            return -1.
-        else:
-            p = t_prediction[0]
-
-            midpoint = (self.max_level+self.min_level)/2.
-            den = float(self.max_level-midpoint)
-            return float(abs(p.fr-midpoint)/den) if den != 0 else -1.
+
+        in_window = and_(Prediction.run_id == cls.run_id,
+                         Prediction.timestamp >= today - td,
+                         Prediction.timestamp < today + td)
+        fr = select([Prediction.fr]).where(in_window).order_by(Prediction.timestamp).limit(1).as_scalar()
+
+        midpoint = (cls.max_level+cls.min_level)/2.
+        return case([
+            (~exists().where(in_window), -2.),
+            (or_(cls.max_level.is_(None), cls.min_level.is_(None)), -1.),
+            (cls.max_level == cls.min_level, -1.)
+        ], else_=func.abs(fr-midpoint)/(cls.max_level-midpoint))
 
     @property
     def select_option(self):
         return {'label': self.run_name, 'value': self.run_id}
 
 
+class SeriesDiagnostics(Base):
+    """ORM mapping for the time series diagnostics of a run's daily flow rate
+
+    Attributes:
+        run_id (int): reference to the river run the diagnostics were computed for
+        computed_on (DateTime): when the diagnostics were computed
+        fingerprint (str): fingerprint of the daily features the diagnostics were computed from
+        start (Date): first day of the series
+        end (Date): last day of the series
+        nobs (int): number of daily observations
+        acf ([float]): autocorrelation of the flow rate at lags 0 through the number of lags computed
+        pacf ([float]): partial autocorrelation of the flow rate at lags 0 through the number of lags computed
+        adf_stat (float): augmented Dickey-Fuller test statistic, with a constant
+        adf_pvalue (float): MacKinnon approximate p-value of the test statistic
+        adf_lags (int): lagged differences included in the test regression
+        stationary (bool): whether a unit root is rejected at the diagnostics' significance level
+        rolling_window (int): days in each rolling window
+        rolling_mean ([float]): mean flow rate of consecutive windows, the last ending on the last day
+        rolling_std ([float]): standard deviation of the flow rate of the same windows
+    """
+    __tablename__ = 'series_diagnostics'
+
+    run_id = Column(ForeignKey('river_run.run_id'), primary_key=True)
+
+    computed_on = Column(DateTime, nullable=False)
+    fingerprint = Column(String(40))
+    start = Column(Date)
+    end   = Column(Date)
+    nobs  = Column(Integer)
+
+    acf  = Column(ARRAY(Float))
+    pacf = Column(ARRAY(Float))
+
+    adf_stat   = Column(Float)
+    adf_pvalue = Column(Float)
+    adf_lags   = Column(Integer)
+    stationary = Column(Boolean)
+
+    rolling_window = Column(Integer)
+    rolling_mean = Column(ARRAY(Float))
+    rolling_std  = Column(ARRAY(Float))
+
+    def __repr__(self):
+        return f'<SeriesDiagnostics(run_id="{self.run_id}", computed_on="{self.computed_on}")>'
+
+    @property
+    def dict(self):
+        """dictionary representation of the diagnostics"""
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
 class State(Base):
     """ORM mapping for a state
 
@@ -1,18 +1,31 @@
 """Module to perform daily operations
 
-There are two major methods to be used: daily_run, fill_gaps
+There are four major methods to be used: daily_run, fill_gaps, compact_measurements, update_climatology
 
 daily run: retrieves weather data from the day prior then computes and inserts predictions for all river runs.
 fill_gaps: the variables day and end can be modified as necessary to retrieve weather measurements between a
 specified date range
+compact_measurements: rolls raw measurements older than the retention window up into daily rollups, archives them
+to disk and deletes them from the measurement table
+update_climatology: rolls the most recent raw measurements up into daily rollups and recomputes the day-of-year flow
+rate climatology they contribute to
 """
 
+import argparse
+import hashlib
+from multiprocessing import Pool
+import numpy as np
 import os
-from riverrunner.arima import Arima
-from riverrunner.context import Prediction
+from riverrunner.arima import ARX_LAGS, ARX_WINDOW, Arima, DAILY_AGGREGATIONS, MODEL_VERSION, TRAINING_DAYS, \
+    TRAINING_RESOLUTION, batched_arx, model_version, with_history
+from riverrunner.context import Prediction, unit_of_work
+from riverrunner.model_store import MODEL_STORE
+from riverrunner.profiling import StageProfiler, profile_stage
 from riverrunner import continuous_retrieval
 from riverrunner.continuous_retrieval import *
 from riverrunner.repository import Repository
+from riverrunner.shared_series import SharedSeries, pack_series
+from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
 import time
 
@@ -22,6 +35,47 @@ DARK_SKY_RETRIES = 10
 """wait time in seconds between API call"""
 DARK_SKY_WAIT = 600
 
+"""age in days after which raw measurements are compacted, must exceed the longest training window, see
+arima.TRAINING_DAYS and RiverRun.training_days"""
+RETENTION_DAYS = 5*365
+
+"""directory compacted raw measurements are archived to"""
+ARCHIVE_DIR = 'data/archive'
+
+"""maximum number of raw measurements deleted per transaction during compaction"""
+COMPACTION_CHUNK_SIZE = 50000
+
+"""days of raw measurements rolled up and folded into the climatology by each daily run, covering late arrivals"""
+CLIMATOLOGY_ROLLUP_DAYS = 7
+
+"""days either side of a day of the year its climatology is computed over, see Repository.put_climatology"""
+CLIMATOLOGY_WINDOW = 7
+
+"""number of worker processes predictions are computed with, predictions are computed serially if None"""
+PREDICTION_WORKERS = None
+
+"""number of runs whose predictions are published per transaction in parallel mode"""
+PUBLISH_BATCH_SIZE = 50
+
+"""whether forecasts update each run's stored state-space model rather than refitting it daily, see Arima.update"""
+INCREMENTAL_FORECASTS = False
+
+"""engine predictions are computed with, 'arima' fits each run with Arima.arima_model, 'arx' fits every run at once
+with arima.batched_arx"""
+PREDICTION_ENGINE = 'arima'
+
+"""database engine of a prediction worker process, see _init_prediction_worker"""
+_worker_engine = None
+
+"""whether a prediction worker process forecasts incrementally, see _init_prediction_worker"""
+_worker_incremental = False
+
+"""daily series a prediction worker process models runs from, see _init_prediction_worker"""
+_worker_series = None
+
+"""model store a prediction worker process keeps and reuses fitted models in, see _init_prediction_worker"""
+_worker_store = None
+
 
 def log(message):
     """write log message to file
@@ -83,47 +137,240 @@ def get_usgs_observations():
     return True
 
 
-def compute_predictions(session):
+def to_predictions(run_id, predictions, model=None):
+    """convert a forecast into Predictions
+
+    Args:
+        run_id: (int) run the forecast is for
+        predictions: (Series) flow rate indexed by date, output of Arima.arima_model
+        model: (str) optional kind of model the forecast came from, see Arima.last_model
+
+    Returns:
+        [Prediction]: one prediction per day
+    """
+    return [
+        Prediction(
+            run_id=run_id,
+            timestamp=pd.to_datetime(d),
+            fr_lb=round(float(p), 1),
+            fr=round(float(p), 1),
+            fr_ub=round(float(p), 1),
+            model=model
+        )
+        for p, d in zip(predictions.values, predictions.index.values)
+    ]
+
+
+def describe_fit(fit):
+    """summarize a model fit for the log
+
+    Args:
+        fit: (ModelFit) the fit, Arima.last_fit
+
+    Returns:
+        str: start type, iterations and fit time or an empty string if no model was fit
+    """
+    if fit is None:
+        return ''
+
+    if fit.model == 'statespace' and fit.iterations == 0:
+        return f' (state update, {fit.fit_seconds:.2f}s)'
+
+    start = 'warm' if fit.warm_start else 'cold'
+    return f' ({start} start, {fit.iterations} iterations, {fit.fit_seconds:.2f}s)'
+
+
+def _init_prediction_worker(url, incremental=False, series=None, store=None):
+    """give a prediction worker process its own database engine and attach it to the shared daily series
+
+    Args:
+        url: (URL) database the parent process is connected to
+        incremental: (bool) optional, whether the worker forecasts incrementally
+        series: (str) optional directory of the daily series packed by the parent, see shared_series
+        store: (ModelStore) optional store the worker keeps and reuses fitted models in
+    """
+    global _worker_engine, _worker_incremental, _worker_series, _worker_store
+    _worker_engine = create_engine(url)
+    _worker_incremental = incremental
+    _worker_store = store
+    _worker_series = SharedSeries(series) if series is not None else None
+
+
+def _predict_run(run_id):
+    """model a single run in a prediction worker process
+
+    failures are returned rather than raised so one run cannot take down the pool
+
+    Args:
+        run_id: (int) run to model
+
+    Returns:
+        (int, Series, [str], str, str, [StageRecord]): run id, forecast or None, error messages or None, the fit
+        summary, the kind of model used and the stages profiled
+    """
+    profiler = StageProfiler()
+    try:
+        with unit_of_work(_worker_engine) as session:
+            arima = Arima(session, incremental=_worker_incremental, store=_worker_store, profiler=profiler)
+            measures = _worker_series.frame(run_id) if _worker_series is not None else None
+            predictions = arima.arima_model(run_id, measures)
+            return run_id, predictions, None, describe_fit(arima.last_fit), arima.last_model, profiler.records
+    except Exception as e:
+        return run_id, None, [str(a) for a in e.args], '', None, profiler.records
+
+
+def group_runs(repo, runs):
+    """group runs that are modeled on the same weather stations with the same training configuration
+
+    runs resolving to the same stations and trained on the same days of history at the same resolution have identical
+    model inputs so a single forecast serves all of them
+
+    Args:
+        repo: (Repository) data access
+        runs: ([RiverRunRow]) runs to group
+
+    Returns:
+        [[RiverRunRow]]: groups in order of their first run, each group in run order
+    """
+    groups = {}
+    for run in runs:
+        stations = tuple(sorted(s[0] for s in repo.get_run_stations(run.run_id)))
+        groups.setdefault((stations, training_config(run)), []).append(run)
+
+    return list(groups.values())
+
+
+def training_config(run):
+    """the days of history and resolution a run's model is trained on
+
+    Args:
+        run: (RiverRunRow) the run
+
+    Returns:
+        (int, int): days of history and minutes between measurements, TRAINING_DAYS and TRAINING_RESOLUTION where
+        the run has no configuration of its own
+    """
+    return (TRAINING_DAYS if run.training_days is None else run.training_days,
+            TRAINING_RESOLUTION if run.training_resolution is None else run.training_resolution)
+
+
+def prediction_fingerprint(input_fingerprint, run, engine=PREDICTION_ENGINE, incremental=INCREMENTAL_FORECASTS):
+    """fingerprint of everything a run's published predictions depend on
+
+    combines the fingerprint of the run's measurements with its training configuration, the prediction engine and
+    the version and configuration of the engine's models, so changing any of them recomputes the run's predictions
+
+    Args:
+        input_fingerprint: (str) fingerprint of the run's measurements, see Repository.get_input_fingerprint
+        run: (RiverRunRow) the run
+        engine: (str) optional engine the predictions are computed with, 'arima' or 'arx'
+        incremental: (bool) optional, whether the arima engine updates stored state-space models
+
+    Returns:
+        str: hex digest the size of an input fingerprint
+    """
+    model = f'arx{MODEL_VERSION}-{ARX_LAGS}-{ARX_WINDOW}' if engine == 'arx' else model_version(incremental)
+    key = (input_fingerprint, training_config(run), engine, model)
+
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def compute_predictions(session, workers=PREDICTION_WORKERS, incremental=INCREMENTAL_FORECASTS, force=False,
+                        engine=PREDICTION_ENGINE, profiler=None, store=MODEL_STORE):
     """compute and cache predictions for all runs
 
+    runs are grouped by the weather stations they resolve to and one model is fit per group, its forecast is
+    published for every run in the group. groups whose measurements and model configuration have not changed since
+    their predictions were last published, judged by a cheap fingerprint of the latest timestamp and number of
+    measurements per station and metric combined with the configuration, see prediction_fingerprint, are skipped and
+    only have their runability refreshed. each remaining group is modeled and published
+    in its own unit of work so nothing loaded for one group is kept in memory while the next is computed. with more
+    than one worker, groups are modeled in a process pool where every worker has its own database session and
+    forecasts are published in group order, PUBLISH_BATCH_SIZE groups per transaction. the 'arx' engine instead
+    fits every group at once in a single batched solve. every stage of every model is recorded to the profiler
+    hook and its summary is logged at the end
+
     Args:
         session: (Session) database connection
+        workers: (int) optional number of worker processes, predictions are computed serially if None
+        incremental: (bool) optional, update each group's stored state-space model instead of refitting it
+        force: (bool) optional, recompute groups whose measurements have not changed
+        engine: (str) optional engine to compute predictions with, 'arima' or 'arx'
+        profiler: optional hook with record and summary methods, see riverrunner.profiling, defaults to a
+            StageProfiler
+        store: (ModelStore) optional store fitted models are kept in and reused from, models are not stored if None
 
     Returns:
         True: if observations were successfully retrieved and inserted
         False: otherwise
     """
+    if profiler is None:
+        profiler = StageProfiler()
+
     try:
-        arima = Arima(session)
         repo = Repository(session)
 
-        runs = repo.get_all_runs_as_list()
-        for run in runs:
-            try:
-                predictions = arima.arima_model(run.run_id)
-
-                to_add = [
-                    Prediction(
-                        run_id=run.run_id,
-                        timestamp=pd.to_datetime(d),
-                        fr_lb=round(float(p), 1),
-                        fr=round(float(p), 1),
-                        fr_ub=round(float(p), 1)
-                    )
-                    for p, d in zip(predictions.values, predictions.index.values)
-                ]
-
-                repo.clear_predictions(run.run_id)
-                repo.put_predictions(to_add)
-                log(f'predictions for {run.run_id}-{run.run_name} added to db')
-
-            except SQLAlchemyError as e:
-                log(f'{run.run_id}-{run.run_name} failed - {[str(a) for a in e.args]}')
-                session.rollback()
-
-            except Exception as e:
-                log(f'predictions for {run.run_id}-{run.run_name} failed - {[str(a) for a in e.args]}')
-
+        runs = repo.get_all_runs_as_list(lightweight=True)
+        groups = group_runs(repo, runs)
+        fingerprints = {}
+        for group in groups:
+            fingerprint = prediction_fingerprint(repo.get_input_fingerprint(group[0].run_id, list(DAILY_AGGREGATIONS)),
+                                                 group[0], engine, incremental)
+            fingerprints.update({run.run_id: fingerprint for run in group})
+
+        def unchanged(group):
+            return all(run.input_fingerprint == fingerprints[run.run_id] for run in group)
+
+        skipped = [run for group in groups if not force and unchanged(group) for run in group]
+        groups = [group for group in groups if force or not unchanged(group)]
+
+        for run in skipped:
+            log(f'predictions for {run.run_id}-{run.run_name} skipped, measurements unchanged')
+        if len(skipped) > 0:
+            repo.put_runability([run.run_id for run in skipped])
+
+        # make any pending work visible to the per-group sessions
+        session.commit()
+        repo.close()
+
+        if engine == 'arx':
+            computed = _compute_predictions_arx(session, groups, fingerprints, profiler)
+        elif workers is not None and workers > 1:
+            computed = _compute_predictions_parallel(session, groups, fingerprints, workers, incremental, profiler,
+                                                     store)
+        else:
+            computed = []
+            for group in groups:
+                run_ids = [run.run_id for run in group]
+                try:
+                    with unit_of_work(session.bind) as group_session:
+                        arima = Arima(group_session, incremental=incremental, store=store, profiler=profiler)
+                        group_repo = Repository(group_session)
+
+                        predictions = arima.arima_model(group[0].run_id)
+
+                        group_repo.replace_predictions(
+                            run_ids,
+                            [p for run_id in run_ids
+                             for p in to_predictions(run_id, predictions, arima.last_model)],
+                            commit=False
+                        )
+                        group_repo.put_runability(run_ids, commit=False)
+                        group_repo.put_input_fingerprints({run_id: fingerprints[run_id] for run_id in run_ids},
+                                                          commit=False)
+                    log_group(group, arima.last_model, describe_fit(arima.last_fit))
+                    computed.extend(run_ids)
+
+                except SQLAlchemyError as e:
+                    log(f'{run_ids} failed - {[str(a) for a in e.args]}')
+
+                except Exception as e:
+                    log(f'predictions for {run_ids} failed - {[str(a) for a in e.args]}')
+
+        failed = sum(len(group) for group in groups) - len(computed)
+        log(f'predictions computed for {len(computed)} runs from {len(groups)} models, {failed} failed, '
+            f'{len(skipped)} skipped with unchanged measurements')
+        log(f'time per stage:\n{profiler.summary()}')
         return True
 
     except Exception as e:
@@ -131,19 +378,353 @@ def compute_predictions(session):
         return False
 
 
-def daily_run(db_context):
-    """perform the daily observation retrieval and flow rate predictions"""
+def log_group(group, model, fit):
+    """log the publication of a group's predictions
+
+    Args:
+        group: ([RiverRunRow]) runs the forecast was published for, the first was modeled
+        model: (str) kind of model the forecast came from, see Arima.last_model
+        fit: (str) fit summary of the model, see describe_fit
+    """
+    source = f' from {model}' if model is not None else ''
+    log(f'predictions for {group[0].run_id}-{group[0].run_name} added to db{source}{fit}')
+    for run in group[1:]:
+        log(f'predictions for {run.run_id}-{run.run_name} added to db (shared with {group[0].run_id})')
+
+
+def _compute_predictions_parallel(session, groups, fingerprints, workers, incremental=False, profiler=None,
+                                  store=None):
+    """model groups of runs in a process pool and publish their forecasts in order
+
+    every group's daily series is retrieved once by the parent and packed into a shared block the workers memory-map
+    read-only, so workers neither query measurements nor receive a copy of each series. the series are retrieved and
+    their features built serially before the pool starts, only model fitting runs in parallel, so this stage's time
+    grows with the number of groups however many workers there are
+
+    Args:
+        session: (Session) database connection
+        groups: ([[RiverRunRow]]) runs to model, the first run of each group is modeled
+        fingerprints: ({int: str}) input fingerprint of each run, recorded with its published predictions
+        workers: (int) number of worker processes
+        incremental: (bool) optional, whether workers forecast incrementally
+        profiler: optional hook the stages profiled by the workers are recorded to
+        store: (ModelStore) optional store the workers keep and reuse fitted models in
+
+    Returns:
+        [int]: ids of the runs whose predictions were published
+    """
+    members = {group[0].run_id: group for group in groups}
+    computed = []
+
+    def publish(batch):
+        computed.extend(_publish_groups(session, members, fingerprints, batch))
+
+    arima = Arima(session, profiler=profiler)
+    frames = {}
+    for run_id in members:
+        try:
+            frames[run_id] = arima.daily_avg(run_id)
+        except Exception as e:
+            log(f'predictions for {[run.run_id for run in members[run_id]]} failed - {[str(a) for a in e.args]}')
+    series = pack_series(frames)
+
+    # connections must not be shared with forked workers, dispose only drops the pool's idle connections so every
+    # checked out connection is returned to it first
+    arima.repo.close()
+    session.close()
+    session.bind.dispose()
+
+    try:
+        initargs = (session.bind.url, incremental, series.directory, store)
+        with Pool(workers, initializer=_init_prediction_worker, initargs=initargs) as pool:
+            batch = []
+            for run_id, predictions, errors, fit, model, records in pool.imap(_predict_run, list(frames)):
+                if profiler is not None:
+                    for record in records:
+                        profiler.record(record)
+
+                if errors is not None:
+                    log(f'predictions for {[run.run_id for run in members[run_id]]} failed - {errors}')
+                    continue
+
+                batch.append((run_id, predictions, fit, model))
+                if len(batch) >= PUBLISH_BATCH_SIZE:
+                    publish(batch)
+                    batch = []
+
+            if len(batch) > 0:
+                publish(batch)
+    finally:
+        series.unlink()
+
+    return computed
+
+
+def _compute_predictions_arx(session, groups, fingerprints, profiler=None):
+    """model groups of runs with the batched AR-X engine and publish their forecasts in order
+
+    every group's daily features are retrieved first, then all groups are fit and forecast with a single
+    Arima.batched_arx call and clipped by Arima.bound. groups that cannot be fit are forecast by Arima.climatology
+
+    Args:
+        session: (Session) database connection
+        groups: ([[RiverRunRow]]) runs to model, the first run of each group is modeled
+        fingerprints: ({int: str}) input fingerprint of each run, recorded with its published predictions
+        profiler: optional hook the retrieval of every group and the batched solve are recorded to
+
+    Returns:
+        [int]: ids of the runs whose predictions were published
+    """
+    members = {group[0].run_id: group for group in groups}
+    arima = Arima(session, profiler=profiler)
+
+    frames = {}
+    for run_id in members:
+        try:
+            measures = arima.daily_avg(run_id)
+            frames[run_id] = measures if measures is not None and len(measures) > 0 else None
+        except Exception as e:
+            log(f'predictions for {[run.run_id for run in members[run_id]]} failed - {[str(a) for a in e.args]}')
+
+    modeled = [run_id for run_id, measures in frames.items() if measures is not None]
+    start = time.time()
+    with profile_stage(profiler, None, 'batched_arx') as stage:
+        stage['rows'] = sum(len(frames[run_id]) for run_id in modeled)
+        forecasts = dict(zip(modeled, batched_arx([frames[run_id] for run_id in modeled])))
+    fit = f' ({time.time() - start:.2f}s for {len(modeled)} models)'
+
+    computed = []
+    batch = []
+    for run_id, measures in frames.items():
+        if measures is None:
+            batch.append((run_id, pd.DataFrame(), '', None))
+        elif forecasts[run_id] is None:
+            prediction = arima.climatology(run_id, measures)
+            batch.append((run_id, with_history(measures, prediction), '', arima.last_model))
+        else:
+            prediction = arima.bound(run_id, measures, forecasts[run_id])
+            batch.append((run_id, with_history(measures, prediction), fit, 'arx'))
+
+        if len(batch) >= PUBLISH_BATCH_SIZE:
+            computed.extend(_publish_groups(session, members, fingerprints, batch))
+            batch = []
+
+    if len(batch) > 0:
+        computed.extend(_publish_groups(session, members, fingerprints, batch))
+
+    return computed
+
+
+def _publish_groups(session, members, fingerprints, batch):
+    """publish a batch of group forecasts in a single transaction
+
+    Args:
+        session: (Session) database connection
+        members: ({int: [RiverRunRow]}) runs of each group by the id of the group's modeled run
+        fingerprints: ({int: str}) input fingerprint of each run, recorded with its published predictions
+        batch: ([(int, Series, str, str)]) modeled run id, forecast, fit summary and kind of model of each group
+
+    Returns:
+        [int]: ids of the runs whose predictions were published, empty if the transaction failed
+    """
+    run_ids = [run.run_id for run_id, _, _, _ in batch for run in members[run_id]]
+    try:
+        with Repository(session).unit_of_work() as batch_repo:
+            batch_repo.replace_predictions(
+                run_ids,
+                [p for run_id, predictions, _, model in batch
+                 for run in members[run_id] for p in to_predictions(run.run_id, predictions, model)],
+                commit=False
+            )
+            batch_repo.put_runability(run_ids, commit=False)
+            batch_repo.put_input_fingerprints({run_id: fingerprints[run_id] for run_id in run_ids}, commit=False)
+        for run_id, _, fit, model in batch:
+            log_group(members[run_id], model, fit)
+
+        return run_ids
+
+    except SQLAlchemyError as e:
+        log(f'{run_ids} failed - {[str(a) for a in e.args]}')
+        return []
+
+
+def archive_measurements(measurements, path):
+    """write raw measurements to a compressed columnar archive
+
+    each column is stored as its own array in a numpy .npz file. an existing archive at path is never replaced
+    by fewer rows, the measurements are merged into it, so archiving again after an interrupted compaction keeps
+    every row archived before. the file is written to a temporary name first and moved into place so a partially
+    written archive is never left behind
+
+    Args:
+        measurements: (DataFrame) columns date_time, station_id, metric_id and value
+        path: (str) destination file
+
+    Returns:
+        int: size of the archive in bytes
+    """
+    columns = {
+        'date_time': pd.to_datetime(measurements['date_time']).values.astype('datetime64[s]'),
+        'station_id': np.asarray(measurements['station_id'], dtype=str),
+        'metric_id': np.asarray(measurements['metric_id'], dtype=str),
+        'value': np.asarray(measurements['value'], dtype=float)
+    }
+
+    if os.path.exists(path):
+        with np.load(path) as archived:
+            merged = pd.concat([pd.DataFrame({c: archived[c] for c in columns}), pd.DataFrame(columns)],
+                               ignore_index=True)
+        merged = merged.drop_duplicates(subset=['date_time', 'station_id', 'metric_id'], keep='first')
+        columns = {c: merged[c].to_numpy() for c in columns}
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(
+            f,
+            date_time=np.asarray(columns['date_time'], dtype='datetime64[s]'),
+            station_id=np.asarray(columns['station_id'], dtype=str),
+            metric_id=np.asarray(columns['metric_id'], dtype=str),
+            value=np.asarray(columns['value'], dtype=float)
+        )
+    os.replace(tmp, path)
+
+    return os.path.getsize(path)
+
+
+def compact_measurements(session, retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR,
+                         chunk_size=COMPACTION_CHUNK_SIZE):
+    """compact raw measurements older than the retention window
+
+    measurements are processed one calendar month at a time. each month is rolled up into daily_measurement,
+    archived to archive_dir and then deleted from measurement in chunks of chunk_size rows. nothing is compacted
+    unless the retention window exceeds the longest window any run is trained on
+
+    compaction can be rerun after being interrupted: days that already have a rollup keep it, so a rollup is never
+    recomputed from the rows an interrupted delete left behind, and archives are merged into rather than replaced
+
+    Args:
+        session: (Session) database connection
+        retention_days: (int) optional age in days after which measurements are compacted
+        archive_dir: (str) optional directory to write archives to
+        chunk_size: (int) optional maximum number of rows deleted per transaction
+
+    Returns:
+        dict: {rows, rollups, tuple_bytes} number of rows deleted, daily rollups written and bytes the deleted
+        tuples occupied, reusable after the next vacuum of measurement
+    """
+    repo = Repository(session)
+
+    today = dt.datetime.today()
+    cutoff = dt.datetime(today.year, today.month, today.day) - dt.timedelta(days=retention_days)
+
+    summary = dict(rows=0, rollups=0, tuple_bytes=0)
+    longest = max(TRAINING_DAYS, repo.get_longest_training_days() or 0)
+    if retention_days <= longest:
+        log(f'not compacting, retention of {retention_days} days must exceed the longest training window of '
+            f'{longest} days')
+        return summary
+
+    start = repo.get_oldest_measurement_date()
+    if start is None or start >= cutoff:
+        log('no measurements to compact')
+        return summary
+
+    if not os.path.exists(archive_dir):
+        os.makedirs(archive_dir)
+
+    start = dt.datetime(start.year, start.month, 1)
+    while start < cutoff:
+        next_month = (start + dt.timedelta(days=32)).replace(day=1)
+        end = min(next_month, cutoff)
+
+        measurements = repo.get_raw_measurements(start, end)
+        if len(measurements) > 0:
+            summary['rollups'] += repo.put_daily_measurements(start, end, overwrite=False)
+            repo.put_climatology(start, end, CLIMATOLOGY_WINDOW)
+            archive_measurements(
+                measurements,
+                os.path.join(archive_dir, f'measurement_{start:%Y%m%d}_{end:%Y%m%d}.npz')
+            )
+
+            rows, size = repo.delete_measurements(start, end, chunk_size)
+            summary['rows'] += rows
+            summary['tuple_bytes'] += size
+
+        start = next_month
+
+    log(f'compacted {summary["rows"]} measurements into {summary["rollups"]} daily rollups, '
+        f'freed {summary["tuple_bytes"]} bytes of tuples for reuse after the next vacuum')
+    return summary
+
+
+def update_climatology(session, start_date=None, end_date=None, window=CLIMATOLOGY_WINDOW):
+    """roll raw measurements up into daily rollups and recompute the climatology they contribute to
+
+    only the days of the year within window days of the rolled up range are recomputed, see
+    Repository.put_climatology
+
+    Args:
+        session: (Session) database connection
+        start_date: (DateTime) optional beginning of the range, CLIMATOLOGY_ROLLUP_DAYS before end_date if None
+        end_date: (DateTime) optional end of the range, exclusive, the start of today if None
+        window: (int) optional days either side of a day of the year its climatology is computed over
+
+    Returns:
+        dict: {rollups, days} number of daily rollups and runs' days of the year written
+    """
+    repo = Repository(session)
+
+    if end_date is None:
+        today = dt.datetime.today()
+        end_date = dt.datetime(today.year, today.month, today.day)
+    if start_date is None:
+        start_date = end_date - dt.timedelta(days=CLIMATOLOGY_ROLLUP_DAYS)
+
+    summary = dict(rollups=repo.put_daily_measurements(start_date, end_date),
+                   days=repo.put_climatology(start_date, end_date, window))
+
+    log(f'rolled up {summary["rollups"]} daily measurements, updated {summary["days"]} days of climatology')
+    return summary
+
+
+def daily_run(db_context, workers=PREDICTION_WORKERS, incremental=INCREMENTAL_FORECASTS, force=False,
+              engine=PREDICTION_ENGINE):
+    """perform the daily observation retrieval and flow rate predictions
+
+    Args:
+        db_context: (dict) database connection string
+        workers: (int) optional number of worker processes to compute predictions with
+        incremental: (bool) optional, update stored state-space models instead of refitting them
+        force: (bool) optional, recompute runs whose measurements have not changed
+        engine: (str) optional engine to compute predictions with, 'arima' or 'arx'
+    """
     context = Context(db_context)
     session = context.Session()
 
     # get_weather_observations(session)
     # get_usgs_observations()
-    compute_predictions(session)
+    update_climatology(session)
+    compute_predictions(session, workers, incremental, force, engine)
+    Repository(session).put_runability(stale=True)
+    compact_measurements(session)
 
     session.close()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='perform the daily run')
+    parser.add_argument('--workers', type=int, default=PREDICTION_WORKERS,
+                        help='number of worker processes to compute predictions with')
+    parser.add_argument('--incremental', action='store_true', default=INCREMENTAL_FORECASTS,
+                        help='update stored state-space models, refitting weekly, instead of refitting daily')
+    parser.add_argument('--force', action='store_true',
+                        help='recompute predictions for runs whose measurements have not changed')
+    parser.add_argument('--engine', choices=['arima', 'arx'], default=PREDICTION_ENGINE,
+                        help='fit each run with ARIMA or every run at once with a batched AR-X model')
+    parser.add_argument('--backfill-climatology', action='store_true',
+                        help='roll up every raw measurement and rebuild the climatology instead of the daily run')
+    args = parser.parse_args()
+
     # just make sure the path exists, we need reproducibility
     # for aws auto-scaling
     if not os.path.exists('data'):
@@ -152,4 +733,14 @@ if __name__ == '__main__':
     elif not os.path.exists('data/logs'):
         os.makedirs('data/logs')
 
-    daily_run(settings.DATABASE)
+    if not os.path.exists(ARCHIVE_DIR):
+        os.makedirs(ARCHIVE_DIR)
+
+    if args.backfill_climatology:
+        session = Context(settings.DATABASE).Session()
+        oldest = Repository(session).get_oldest_measurement_date()
+        if oldest is not None:
+            update_climatology(session, oldest)
+        session.close()
+    else:
+        daily_run(settings.DATABASE, args.workers, args.incremental, args.force, args.engine)
@@ -0,0 +1,298 @@
+""" script that computes time series diagnostics of every run's daily flow rate
+
+Examples:
+    python diagnostics.py [--run-ids RUN_ID ...] [--acf-lags N] [--pacf-lags N] [--adf-lags N] [--window DAYS]
+
+    * loads every run's daily features through the series cache, see Arima.daily_avg
+    * stacks the runs' flow rates and computes their diagnostics in one batched pass
+    * stores one row of diagnostics per run in the series_diagnostics table, see Repository.get_series_diagnostics
+
+Functions:
+    stack_series: stack runs' series into one zero padded matrix
+
+    batched_acf: autocorrelation of every run via FFT
+
+    batched_pacf: partial autocorrelation of every run from its autocorrelation via Durbin-Levinson
+
+    batched_adf: augmented Dickey-Fuller test of every run
+
+    rolling_statistics: mean and standard deviation of every run over consecutive windows
+
+    diagnose: compute every diagnostic for a set of runs
+"""
+
+import argparse
+import datetime as dt
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.adfvalues import mackinnonp
+from riverrunner import settings
+from riverrunner.arima import data_fingerprint
+from riverrunner.backtest import database_frames
+from riverrunner.context import Context, SeriesDiagnostics
+from riverrunner.repository import Repository
+
+
+"""lags the autocorrelation is computed for, as plotted by arima_exploration.plot_autocorrs"""
+ACF_LAGS = 400
+
+"""lags the partial autocorrelation is computed for"""
+PACF_LAGS = 40
+
+"""significance level a unit root must be rejected at for a series to be considered stationary"""
+ADF_SIGNIFICANCE = .05
+
+"""days in each window of the rolling statistics"""
+ROLLING_WINDOW = 365
+
+"""days between the ends of consecutive rolling windows"""
+ROLLING_STEP = 30
+
+
+def stack_series(series):
+    """stack runs' series into one zero padded matrix
+
+    Args:
+        series: ([array]) one series per run, consecutive observations without missing values
+
+    Returns:
+        (array, array): runs by longest series matrix with each run's series left aligned and zero padded, and the
+        length of each run's series
+    """
+    lengths = np.array([len(s) for s in series], dtype=int)
+    values = np.zeros((len(series), lengths.max() if len(series) > 0 else 0))
+    for i, s in enumerate(series):
+        values[i, :lengths[i]] = s
+
+    return values, lengths
+
+
+def batched_acf(values, lengths, nlags=ACF_LAGS):
+    """autocorrelation of every run via FFT
+
+    each run is demeaned over its own observations and the padding is kept at zero, so the FFT of the whole matrix,
+    padded to at least twice the longest series, yields each run's own autocovariances. Matches
+    statsmodels.tsa.stattools.acf.
+
+    Args:
+        values: (array) runs by days matrix, see stack_series
+        lengths: (array) length of each run's series
+        nlags: (int) optional largest lag
+
+    Returns:
+        array: runs by nlags + 1 autocorrelations from lag 0, NaN at lags a run's series is too short for
+    """
+    observed = np.arange(values.shape[1])[None, :] < lengths[:, None]
+    means = values.sum(axis=1)/np.maximum(lengths, 1)
+    centered = np.where(observed, values - means[:, None], 0.)
+
+    n = 1 << int(np.ceil(np.log2(max(2*values.shape[1] - 1, 1))))
+    spectrum = np.fft.rfft(centered, n=n, axis=1)
+    acov = np.fft.irfft(spectrum*np.conj(spectrum), n=n, axis=1)[:, :nlags + 1]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        acf = acov/acov[:, :1]
+    acf[np.arange(acf.shape[1])[None, :] >= lengths[:, None]] = np.nan
+
+    return acf
+
+
+def batched_pacf(acf, nlags=PACF_LAGS):
+    """partial autocorrelation of every run from its autocorrelation via Durbin-Levinson
+
+    matches statsmodels.tsa.stattools.pacf with method='ywm', the Yule-Walker estimate without bias correction
+
+    Args:
+        acf: (array) runs by lags autocorrelations from lag 0, see batched_acf
+        nlags: (int) optional largest lag, at most the largest lag of acf
+
+    Returns:
+        array: runs by nlags + 1 partial autocorrelations from lag 0
+    """
+    n_runs = acf.shape[0]
+    pacf = np.ones((n_runs, nlags + 1))
+    phi = np.zeros((n_runs, nlags + 1))
+
+    for k in range(1, nlags + 1):
+        previous = phi[:, 1:k]
+        numerator = acf[:, k] - (previous*acf[:, k - 1:0:-1]).sum(axis=1)
+        denominator = 1 - (previous*acf[:, 1:k]).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            reflection = numerator/denominator
+
+        phi[:, 1:k] = previous - reflection[:, None]*previous[:, ::-1]
+        phi[:, k] = reflection
+        pacf[:, k] = reflection
+
+    return pacf
+
+
+def batched_adf(values, lengths, lags=None):
+    """augmented Dickey-Fuller test of every run
+
+    each run's differences are regressed on a constant, its previous level and lags previous differences, the
+    regressions of all runs are solved at once through their normal equations. Matches
+    statsmodels.tsa.stattools.adfuller with regression='c' and autolag=None.
+
+    Args:
+        values: (array) runs by days matrix, see stack_series
+        lengths: (array) length of each run's series
+        lags: (int) optional lagged differences, Schwert's rule for the longest series if None
+
+    Returns:
+        (array, array, int): test statistic and MacKinnon approximate p-value of each run, NaN for runs too short to
+        test, and the lagged differences used
+    """
+    n_runs, n_days = values.shape
+    if lags is None:
+        lags = int(np.ceil(12*(n_days/100)**.25))
+
+    diff = np.diff(values, axis=1)
+    rows = n_days - 1 - lags
+    if rows <= 0:
+        return np.full(n_runs, np.nan), np.full(n_runs, np.nan), lags
+
+    # design matrices: constant, previous level and lagged differences
+    X = np.concatenate([
+        np.ones((n_runs, rows, 1)),
+        values[:, lags:n_days - 1, None],
+        np.stack([diff[:, lags - i:n_days - 1 - i] for i in range(1, lags + 1)], axis=2)
+    ], axis=2)
+    target = diff[:, lags:]
+
+    # a regression row is observed when its target difference lies within the run's series
+    valid = np.arange(lags + 1, n_days)[None, :] < lengths[:, None]
+    X = np.where(valid[:, :, None], X, 0.)
+    target = np.where(valid, target, 0.)
+
+    k = X.shape[2]
+    nobs = valid.sum(axis=1)
+    testable = nobs > k
+
+    # the pseudo-inverse keeps a constant series from failing the whole batch
+    xtx_inv = np.linalg.pinv(np.einsum('rtk,rtl->rkl', X, X))
+    coef = np.einsum('rkl,rtl,rt->rk', xtx_inv, X, target)
+
+    resid = target - np.einsum('rtk,rk->rt', X, coef)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma2 = (resid**2).sum(axis=1)/(nobs - k)
+        stat = coef[:, 1]/np.sqrt(sigma2*xtx_inv[:, 1, 1])
+    stat[~testable] = np.nan
+
+    pvalue = np.array([mackinnonp(s, regression='c', N=1) if np.isfinite(s) else np.nan for s in stat])
+
+    return stat, pvalue, lags
+
+
+def rolling_statistics(values, lengths, window=ROLLING_WINDOW, step=ROLLING_STEP):
+    """mean and standard deviation of every run over consecutive windows
+
+    windows are taken every step days back from each run's last observation, the statistics of all windows of all
+    runs are computed at once from cumulative sums
+
+    Args:
+        values: (array) runs by days matrix, see stack_series
+        lengths: (array) length of each run's series
+        window: (int) optional observations in each window
+        step: (int) optional observations between the ends of consecutive windows
+
+    Returns:
+        ([array], [array]): per run, the mean and sample standard deviation of each window ordered by its end, empty
+        for runs shorter than a window
+    """
+    zero = np.zeros((values.shape[0], 1))
+    sums = np.concatenate([zero, np.cumsum(values, axis=1)], axis=1)
+    squares = np.concatenate([zero, np.cumsum(values**2, axis=1)], axis=1)
+
+    window_sums = sums[:, window:] - sums[:, :-window]
+    window_squares = squares[:, window:] - squares[:, :-window]
+    means = window_sums/window
+    stds = np.sqrt(np.maximum(window_squares - window_sums*means, 0.)/max(window - 1, 1))
+
+    rolling_mean, rolling_std = [], []
+    for i, n in enumerate(lengths):
+        # window ending on observation e is at column e - window + 1
+        ends = np.arange(n - 1, window - 2, -step)[::-1] - window + 1
+        rolling_mean.append(means[i, ends])
+        rolling_std.append(stds[i, ends])
+
+    return rolling_mean, rolling_std
+
+
+def diagnose(frames, acf_lags=ACF_LAGS, pacf_lags=PACF_LAGS, adf_lags=None, window=ROLLING_WINDOW,
+             step=ROLLING_STEP, significance=ADF_SIGNIFICANCE):
+    """compute every diagnostic for a set of runs
+
+    Args:
+        frames: ({int: DataFrame}) daily features by run id, see Arima.daily_avg, runs without features are skipped
+        acf_lags: (int) optional largest autocorrelation lag
+        pacf_lags: (int) optional largest partial autocorrelation lag, at most acf_lags
+        adf_lags: (int) optional lagged differences of the Dickey-Fuller regression, see batched_adf
+        window: (int) optional days in each rolling window
+        step: (int) optional days between the ends of consecutive rolling windows
+        significance: (float) optional significance level stationarity is decided at
+
+    Returns:
+        [SeriesDiagnostics]: diagnostics of each run with features
+    """
+    frames = {run_id: f for run_id, f in frames.items() if f is not None and len(f) > 0}
+    if len(frames) == 0:
+        return []
+
+    run_ids = list(frames)
+    values, lengths = stack_series([frames[r]['flow'].values for r in run_ids])
+
+    acf = batched_acf(values, lengths, max(acf_lags, pacf_lags))
+    pacf = batched_pacf(acf, pacf_lags)
+    adf_stat, adf_pvalue, adf_lags = batched_adf(values, lengths, adf_lags)
+    rolling_mean, rolling_std = rolling_statistics(values, lengths, window, step)
+
+    def floats(a):
+        return [None if np.isnan(v) else float(v) for v in a]
+
+    computed_on = dt.datetime.now()
+    diagnostics = []
+    for i, run_id in enumerate(run_ids):
+        frame = frames[run_id]
+        diagnostics.append(SeriesDiagnostics(
+            run_id=run_id,
+            computed_on=computed_on,
+            fingerprint=data_fingerprint(frame),
+            start=frame.index[0].date(),
+            end=frame.index[-1].date(),
+            nobs=int(lengths[i]),
+            acf=floats(acf[i, :acf_lags + 1]),
+            pacf=floats(pacf[i]),
+            adf_stat=None if np.isnan(adf_stat[i]) else float(adf_stat[i]),
+            adf_pvalue=None if np.isnan(adf_pvalue[i]) else float(adf_pvalue[i]),
+            adf_lags=adf_lags,
+            stationary=None if np.isnan(adf_pvalue[i]) else bool(adf_pvalue[i] < significance),
+            rolling_window=window,
+            rolling_mean=floats(rolling_mean[i]),
+            rolling_std=floats(rolling_std[i])
+        ))
+
+    return diagnostics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="compute time series diagnostics of every run's daily flow rate")
+    parser.add_argument('--run-ids', nargs='+', type=int, help='runs to diagnose, every run if omitted')
+    parser.add_argument('--acf-lags', type=int, default=ACF_LAGS)
+    parser.add_argument('--pacf-lags', type=int, default=PACF_LAGS)
+    parser.add_argument('--adf-lags', type=int, default=None)
+    parser.add_argument('--window', type=int, default=ROLLING_WINDOW)
+    parser.add_argument('--step', type=int, default=ROLLING_STEP)
+    args = parser.parse_args()
+
+    pd.options.mode.chained_assignment = None
+
+    session = Context(settings.DATABASE).Session()
+    diagnostics = diagnose(database_frames(session, args.run_ids), args.acf_lags, args.pacf_lags, args.adf_lags,
+                           args.window, args.step)
+
+    repo = Repository(session)
+    repo.put_series_diagnostics(diagnostics)
+    print(repo.get_series_diagnostics([d.run_id for d in diagnostics])
+          [['run_id', 'nobs', 'adf_stat', 'adf_pvalue', 'stationary']].to_string(index=False))
+    session.close()
@@ -0,0 +1,431 @@
+""" script that proposes, checks and applies indexes for the measurement access pattern
+
+Examples:
+    python index_advisor.py [--run-id RUN_ID] [--days DAYS] [--stations STATIONS] [--apply]
+
+    * captures the SQL every reader of measurement issues for the given run: the model's training data, the input
+      fingerprint, the raw measurements compaction archives and the daily rollup the climatology is computed from
+    * proposes composite, covering and BRIN indexes from the columns those statements filter on
+    * times every captured statement with EXPLAIN ANALYZE on a synthetic copy of measurement before and after
+      each candidate is built
+    * optional argument to build the candidates that improved every statement on measurement and sped them up by
+      the minimum speedup in total, concurrently
+
+Functions:
+    capture_queries: record the measurement statements Repository issues for a run
+
+    propose_indexes: derive index candidates from captured statements
+
+    captured_station_ids: station ids captured statements were executed with
+
+    check_indexes: time captured statements on a synthetic dataset with and without each candidate
+
+    improves: whether a candidate sped up every captured statement
+
+    apply_indexes: build indexes on measurement without blocking writes
+"""
+
+import argparse
+from collections import namedtuple
+import datetime as dt
+import re
+from riverrunner import settings
+from riverrunner.arima import DAILY_AGGREGATIONS, Arima
+from riverrunner.context import Context, Measurement
+from riverrunner.repository import Repository
+from sqlalchemy import event
+
+
+"""name of the scratch table synthetic measurements are generated into"""
+SYNTHETIC_TABLE = 'measurement_synthetic'
+
+"""minimum total before/after execution time ratio for a candidate to be applied"""
+MIN_SPEEDUP = 1.2
+
+"""days of raw measurements the captured rollup and archive statements cover, as update_climatology rolls up"""
+ROLLUP_DAYS = 7
+
+"""columns of measurement, statements qualify them with the table name or, in raw SQL, leave them bare"""
+COLUMNS = '|'.join(c.name for c in Measurement.__table__.columns)
+
+
+"""a captured statement and the parameters it was executed with"""
+Query = namedtuple('Query', ['statement', 'parameters'])
+
+"""a proposed index, ddl is formatted with {table} and {concurrently}"""
+IndexCandidate = namedtuple('IndexCandidate', ['name', 'kind', 'columns', 'include', 'ddl'])
+
+"""EXPLAIN ANALYZE execution times in milliseconds of each captured statement for a candidate"""
+IndexCheck = namedtuple('IndexCheck', ['candidate', 'before', 'after'])
+
+
+class _RecordingConnection:
+    """DBAPI connection proxy recording the statements executed through its cursors
+
+    commits are ignored so every write is rolled back with the capture
+
+    Args:
+        connection: DBAPI connection
+        record: (callable) called with each statement and its parameters before it is executed
+    """
+    def __init__(self, connection, record):
+        self.connection = connection
+        self.record = record
+
+    def cursor(self):
+        return _RecordingCursor(self.connection.cursor(), self.record)
+
+    def commit(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+class _RecordingCursor:
+    """DBAPI cursor proxy recording the statements it executes, see _RecordingConnection"""
+    def __init__(self, cursor, record):
+        self.cursor = cursor
+        self.record = record
+
+    def execute(self, statement, parameters=None):
+        self.record(statement, parameters)
+        return self.cursor.execute(statement, parameters)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def capture_queries(session, run_id, rollup_days=ROLLUP_DAYS):
+    """record the statements against measurement issued by every reader of a run's measurements
+
+    the run's training data is retrieved as Arima.daily_avg retrieves it and its input fingerprint as
+    compute_predictions computes it, then the raw measurements compaction archives and the daily rollup
+    update_climatology computes the climatology from are read over the last rollup_days. ORM statements are
+    recorded from the engine, raw SQL through a recording connection. the capture runs in one transaction that is
+    rolled back, so the rollup and climatology writes it issues are discarded. statements that do not read
+    measurement, like the climatology's own statement over daily_measurement, are not recorded
+
+    Args:
+        session: (Session) database connection
+        run_id: (int) run to retrieve measurements for
+        rollup_days: (int) optional days of raw measurements the rollup and archive statements cover
+
+    Returns:
+        [Query]: captured statements
+    """
+    end_date = dt.datetime.combine(dt.date.today(), dt.time())
+    start_date = end_date - dt.timedelta(days=rollup_days)
+
+    queries = []
+
+    def record(statement, parameters):
+        if re.search(r'\bFROM\s+measurement\b', statement):
+            queries.append(Query(statement, parameters))
+
+    def record_orm(conn, cursor, statement, parameters, context, executemany):
+        record(statement, parameters)
+
+    engine = session.bind
+    raw = engine.raw_connection()
+    event.listen(engine, 'before_cursor_execute', record_orm)
+    try:
+        repo = Repository(session, connection=_RecordingConnection(raw, record))
+
+        Arima(session, series_cache=None).daily_avg(run_id)
+        repo.get_input_fingerprint(run_id, list(DAILY_AGGREGATIONS))
+        repo.get_raw_measurements(start_date, end_date)
+        repo.put_daily_measurements(start_date, end_date)
+        repo.put_climatology(start_date, end_date)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record_orm)
+        raw.rollback()
+        raw.close()
+        session.rollback()
+
+    return queries
+
+
+def propose_indexes(queries):
+    """derive index candidates from the columns captured statements filter and select on
+
+    equality and IN predicates lead a composite b-tree followed by range predicates, the covering variant
+    additionally includes every other selected column so the scan never visits the heap, and range predicates
+    on naturally ordered columns get a BRIN index
+
+    Args:
+        queries: ([Query]) captured statements
+
+    Returns:
+        [IndexCandidate]: proposed indexes
+    """
+    equality, ranges, selected = [], [], []
+
+    def add(columns, column):
+        if column not in columns:
+            columns.append(column)
+
+    for query in queries:
+        select, _, where = query.statement.partition('WHERE')
+        for column in re.findall(rf'(?:measurement\.)?\b({COLUMNS})\s+(?:IN\b|=)', where):
+            add(equality, column)
+        for column in re.findall(rf'(?:measurement\.)?\b({COLUMNS})\s+(?:>=|<=|>|<|BETWEEN\b)', where):
+            add(ranges, column)
+        for column in re.findall(rf'(?:measurement\.)?\b({COLUMNS})\b', select):
+            add(selected, column)
+
+    # station ids are the most selective equality predicate
+    equality.sort(key=lambda c: c != 'station_id')
+    ranges = [c for c in ranges if c not in equality]
+    if len(equality) + len(ranges) == 0:
+        return []
+
+    columns = tuple(equality + ranges)
+    include = tuple(c for c in selected if c not in columns)
+    suffix = '_'.join(columns)
+
+    candidates = [
+        IndexCandidate(
+            name=f'idx_measurement_{suffix}',
+            kind='btree',
+            columns=columns,
+            include=(),
+            ddl=f'CREATE INDEX {{concurrently}} IF NOT EXISTS {{name}} ON {{table}} ({", ".join(columns)})'
+        )
+    ]
+
+    if len(include) > 0:
+        candidates.append(IndexCandidate(
+            name=f'idx_measurement_{suffix}_covering',
+            kind='covering',
+            columns=columns,
+            include=include,
+            ddl=f'CREATE INDEX {{concurrently}} IF NOT EXISTS {{name}} ON {{table}} ({", ".join(columns)}) '
+                f'INCLUDE ({", ".join(include)})'
+        ))
+
+    for column in ranges:
+        candidates.append(IndexCandidate(
+            name=f'idx_measurement_{column}_brin',
+            kind='brin',
+            columns=(column,),
+            include=(),
+            ddl=f'CREATE INDEX {{concurrently}} IF NOT EXISTS {{name}} ON {{table}} USING brin ({column})'
+        ))
+
+    return candidates
+
+
+def captured_station_ids(queries):
+    """station ids captured statements were executed with
+
+    Args:
+        queries: ([Query]) captured statements
+
+    Returns:
+        [str]: distinct station ids in the order they were first bound
+    """
+    station_ids = []
+    for query in queries:
+        for key, value in (query.parameters or {}).items():
+            if key.startswith('station_id') and value not in station_ids:
+                station_ids.append(value)
+
+    return station_ids
+
+
+def build_synthetic_table(connection, station_ids, days=4*365, stations=50):
+    """fill the scratch table with hourly measurements for the captured stations and a sample of other real stations
+
+    the table copies measurement's primary key and indexes so timings before a candidate is built are those of
+    production. rows are inserted in time order, as they are in production, so BRIN candidates see a realistic
+    layout
+
+    Args:
+        connection: DBAPI connection
+        station_ids: ([str]) stations the captured statements select, see captured_station_ids
+        days: (int) optional number of days of history to generate
+        stations: (int) optional number of other stations to generate measurements for
+
+    Returns:
+        int: number of synthetic rows
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {SYNTHETIC_TABLE};')
+        cursor.execute(f'CREATE TABLE {SYNTHETIC_TABLE} (LIKE measurement INCLUDING ALL);')
+        cursor.execute(f"""
+            INSERT INTO {SYNTHETIC_TABLE} (date_time, metric_id, station_id, value)
+                SELECT t, m.metric_id, s.station_id, random()*1000
+                FROM generate_series(now()::date - %s * interval '1 day', now(), interval '1 hour') t
+                CROSS JOIN (
+                    SELECT unnest(%s::varchar[]) AS station_id
+                    UNION
+                    (SELECT station_id FROM station WHERE station_id <> ALL(%s::varchar[])
+                     ORDER BY station_id LIMIT %s)
+                ) s
+                CROSS JOIN metric m
+                ORDER BY t;
+        """, (days, list(station_ids), list(station_ids), stations))
+        rows = cursor.rowcount
+        cursor.execute(f'ANALYZE {SYNTHETIC_TABLE};')
+
+    connection.commit()
+    return rows
+
+
+def explain_analyze(connection, queries, table=SYNTHETIC_TABLE):
+    """EXPLAIN ANALYZE execution time of each captured statement run against table
+
+    EXPLAIN ANALYZE executes the statements, the transaction is rolled back so the writes of captured rollups
+    are discarded
+
+    Args:
+        connection: DBAPI connection
+        queries: ([Query]) captured statements
+        table: (str) optional table to run the statements against in place of measurement
+
+    Returns:
+        [float]: execution time in milliseconds of each statement
+    """
+    times = []
+    with connection.cursor() as cursor:
+        for query in queries:
+            statement = re.sub(r'\bmeasurement\b', table, query.statement)
+            cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {statement}', query.parameters)
+            times.append(cursor.fetchone()[0][0]['Execution Time'])
+
+    connection.rollback()
+    return times
+
+
+def check_indexes(connection, queries, candidates, days=4*365, stations=50):
+    """time captured statements on a synthetic dataset before and after building each candidate
+
+    candidates are built and dropped one at a time so each is measured against the same baseline
+
+    Args:
+        connection: DBAPI connection
+        queries: ([Query]) captured statements
+        candidates: ([IndexCandidate]) proposed indexes
+        days: (int) optional number of days of synthetic history
+        stations: (int) optional number of synthetic stations besides those the statements select
+
+    Returns:
+        [IndexCheck]: before and after timings of every statement for each candidate
+    """
+    build_synthetic_table(connection, captured_station_ids(queries), days, stations)
+
+    # warm the cache so the first candidate isn't penalized
+    explain_analyze(connection, queries)
+
+    checks = []
+    for candidate in candidates:
+        before = explain_analyze(connection, queries)
+
+        name = f'{candidate.name}_synthetic'
+        with connection.cursor() as cursor:
+            cursor.execute(candidate.ddl.format(concurrently='', name=name, table=SYNTHETIC_TABLE))
+            cursor.execute(f'ANALYZE {SYNTHETIC_TABLE};')
+        connection.commit()
+
+        after = explain_analyze(connection, queries)
+        checks.append(IndexCheck(candidate, before, after))
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX {name};')
+        connection.commit()
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {SYNTHETIC_TABLE};')
+    connection.commit()
+
+    return checks
+
+
+def improves(check, min_speedup=MIN_SPEEDUP):
+    """whether a candidate sped up every captured statement
+
+    Args:
+        check: (IndexCheck) timings of the candidate
+        min_speedup: (float) optional minimum ratio of the total time before to the total time after
+
+    Returns:
+        bool: True if every statement ran faster with the candidate and the total by at least min_speedup
+    """
+    before, after = sum(check.before), sum(check.after)
+    return all(a < b for b, a in zip(check.before, check.after)) and \
+        (after == 0 or before/after >= min_speedup)
+
+
+def apply_indexes(connection, candidates):
+    """build indexes on measurement without blocking writes
+
+    CREATE INDEX CONCURRENTLY cannot run inside a transaction so the driver connection is switched to autocommit
+    for the duration of the call. a pooled connection proxy does not forward attribute writes, so the flag is set on
+    the DBAPI connection it wraps
+
+    Args:
+        connection: DBAPI connection, or a pooled proxy of one as returned by Engine.raw_connection
+        candidates: ([IndexCandidate]) indexes to build
+
+    Returns:
+        [str]: names of the indexes built
+    """
+    driver = getattr(connection, 'connection', connection)
+
+    # autocommit can only be switched outside a transaction
+    driver.rollback()
+
+    autocommit = driver.autocommit
+    driver.autocommit = True
+    try:
+        with driver.cursor() as cursor:
+            for candidate in candidates:
+                cursor.execute(candidate.ddl.format(concurrently='CONCURRENTLY', name=candidate.name,
+                                                    table='measurement'))
+    finally:
+        driver.autocommit = autocommit
+
+    return [c.name for c in candidates]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='propose and apply indexes for measurement')
+    parser.add_argument('--run-id', type=int, default=599)
+    parser.add_argument('--days', type=int, default=4*365)
+    parser.add_argument('--stations', type=int, default=50)
+    parser.add_argument('--min-speedup', type=float, default=MIN_SPEEDUP)
+    parser.add_argument('--apply', action='store_true')
+    args = parser.parse_args()
+
+    session = Context(settings.DATABASE).Session()
+    connection = session.bind.raw_connection()
+
+    queries = capture_queries(session, args.run_id)
+    candidates = propose_indexes(queries)
+    checks = check_indexes(connection, queries, candidates, args.days, args.stations)
+
+    accepted = []
+    for check in checks:
+        before, after = sum(check.before), sum(check.after)
+        speedup = before/after if after > 0 else float('inf')
+        print(f'{check.candidate.name} ({check.candidate.kind}): '
+              f'{before:.1f}ms -> {after:.1f}ms ({speedup:.1f}x)')
+        for query, b, a in zip(queries, check.before, check.after):
+            print(f'    {b:.1f}ms -> {a:.1f}ms {" ".join(query.statement.split())[:100]}')
+
+        if improves(check, args.min_speedup):
+            accepted.append(check.candidate)
+
+    if args.apply:
+        for name in apply_indexes(connection, accepted):
+            print(f'built {name}')
+
+    connection.close()
+    session.close()
@@ -0,0 +1,139 @@
+"""
+Module for storing fitted model artifacts on local disk.
+
+An artifact holds everything needed to reproduce a run's forecast without refitting: the ARMA order, coefficients,
+filter state, fit diagnostics and the forecast itself. Artifacts are keyed by run, model version and a fingerprint
+of the data the model was fit on, so a model is only reused for exactly the inputs it was fit to, and by a model
+version that is bumped whenever the modeling code changes. Each artifact is a compressed numpy .npz file.
+
+Classes:
+    ModelStore: versioned, size-bounded artifact store
+        Functions:
+            get: retrieve an artifact, marking it as recently used
+
+            put: atomically write an artifact, then evict the least recently used artifacts over the size limit
+
+            evict: remove the least recently used artifacts until the store fits its size limit
+"""
+
+import os
+import numpy as np
+
+
+"""directory model artifacts are stored in"""
+MODEL_STORE_DIR = 'data/models'
+
+"""maximum total size in bytes of the stored artifacts"""
+MODEL_STORE_MAX_BYTES = 256*1024*1024
+
+
+class ModelStore:
+    """
+    Stores fitted model artifacts keyed by (run_id, model version, data fingerprint)
+
+    Args:
+        directory: (str) optional directory the artifacts are stored in, created on first write
+        max_bytes: (int) optional maximum total size of the artifacts
+    """
+    def __init__(self, directory=MODEL_STORE_DIR, max_bytes=MODEL_STORE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, run_id, version, fingerprint):
+        """file an artifact is stored in
+
+        Args:
+            run_id: (int) run the model was fit for
+            version: (str) model version
+            fingerprint: (str) fingerprint of the data the model was fit on
+
+        Returns:
+            str: path of the artifact
+        """
+        return os.path.join(self.directory, f'{run_id}_{version}_{fingerprint}.npz')
+
+    def get(self, run_id, version, fingerprint):
+        """retrieve an artifact, marking it as recently used
+
+        Args:
+            run_id: (int) run the model was fit for
+            version: (str) model version
+            fingerprint: (str) fingerprint of the data the model was fit on
+
+        Returns:
+            {str: ndarray}: the artifact's arrays or None if no artifact is stored
+        """
+        path = self.path(run_id, version, fingerprint)
+        try:
+            with np.load(path) as npz:
+                artifact = {k: npz[k] for k in npz.files}
+            os.utime(path)
+        except (OSError, ValueError):
+            # missing, evicted concurrently or unreadable
+            return None
+
+        return artifact
+
+    def put(self, run_id, version, fingerprint, artifact):
+        """atomically write an artifact, then evict the least recently used artifacts over the size limit
+
+        the artifact is written to a temporary file unique to this process and moved into place so readers never
+        see a partially written artifact
+
+        Args:
+            run_id: (int) run the model was fit for
+            version: (str) model version
+            fingerprint: (str) fingerprint of the data the model was fit on
+            artifact: ({str: array_like}) arrays to store, None values are skipped
+
+        Returns:
+            str: path of the artifact
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        path = self.path(run_id, version, fingerprint)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **{k: np.asarray(v) for k, v in artifact.items() if v is not None})
+        os.replace(tmp, path)
+
+        self.evict()
+        return path
+
+    def evict(self):
+        """remove the least recently used artifacts until the store fits its size limit
+
+        Returns:
+            int: number of artifacts removed
+        """
+        if not os.path.exists(self.directory):
+            return 0
+
+        artifacts = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.npz'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            artifacts.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in artifacts)
+        removed = 0
+        for _, size, path in sorted(artifacts):
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            total -= size
+
+        return removed
+
+
+"""the store models are kept in by default"""
+MODEL_STORE = ModelStore()
@@ -0,0 +1,112 @@
+"""
+Module for profiling the stages of the modeling pipeline.
+
+Arima reports every stage it runs for a run, such as get_data, daily_avg, select_order, fit and forecast, to a
+profiler hook. A hook is any object with a record method accepting a StageRecord and a summary method returning a
+printable report. compute_predictions uses a StageProfiler by default and logs its summary once all runs are
+computed.
+
+Classes:
+    StageRecord: wall-clock and CPU time, peak memory and row count of one stage for one run
+
+    StageProfiler: hook collecting records and summarizing them per stage
+
+Functions:
+    profile_stage: context manager timing a stage and reporting it to a hook
+"""
+
+from collections import namedtuple
+from contextlib import contextmanager
+import resource
+import sys
+import time
+import pandas as pd
+
+
+"""wall-clock and CPU seconds, peak resident memory in bytes and number of rows of one stage for one run"""
+StageRecord = namedtuple('StageRecord', ['run_id', 'stage', 'wall', 'cpu', 'peak_memory', 'rows'])
+
+
+class StageProfiler:
+    """
+    Collects stage records and summarizes them per stage
+
+    Attributes:
+        records ([StageRecord]): everything recorded so far, in order
+    """
+    def __init__(self):
+        self.records = []
+
+    def record(self, record):
+        """keep a stage record
+
+        Args:
+            record: (StageRecord) the stage's measurements
+        """
+        self.records.append(record)
+
+    def summary(self):
+        """summarize the records per stage
+
+        Returns:
+            DataFrame: indexed by stage in order of first appearance with the number of runs, total and mean
+            wall-clock seconds, total CPU seconds, the largest peak memory in megabytes and total rows
+        """
+        columns = ['runs', 'wall', 'mean_wall', 'cpu', 'peak_mb', 'rows']
+        if len(self.records) == 0:
+            return pd.DataFrame(columns=columns)
+
+        df = pd.DataFrame(self.records, columns=StageRecord._fields)
+        grouped = df.groupby('stage', sort=False)
+
+        summary = pd.DataFrame({
+            'runs': grouped['run_id'].nunique(),
+            'wall': grouped['wall'].sum(),
+            'mean_wall': grouped['wall'].mean(),
+            'cpu': grouped['cpu'].sum(),
+            'peak_mb': grouped['peak_memory'].max()/2**20,
+            'rows': grouped['rows'].sum()
+        }, columns=columns)
+        return summary
+
+
+def _peak_memory():
+    """peak resident memory of the process in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak*1024
+
+
+@contextmanager
+def profile_stage(profiler, run_id, stage):
+    """time a stage and report it to a profiler hook
+
+    the body may set the number of rows the stage handled on the yielded dict. peak memory is the process' high
+    water mark when the stage completes, so it is attributed to the first stage that reaches it
+
+    Args:
+        profiler: hook with a record method, nothing is measured if None
+        run_id: (int) run the stage is for
+        stage: (str) name of the stage
+
+    Yields:
+        dict: with a rows key for the body to set
+    """
+    counts = {'rows': None}
+    if profiler is None:
+        yield counts
+        return
+
+    wall, cpu = time.time(), time.process_time()
+    try:
+        yield counts
+    finally:
+        profiler.record(StageRecord(
+            run_id=run_id,
+            stage=stage,
+            wall=time.time() - wall,
+            cpu=time.process_time() - cpu,
+            peak_memory=_peak_memory(),
+            rows=counts['rows']
+        ))
@@ -5,15 +5,20 @@ The repository class represents an abstraction for the user to interface with th
 standard CRUD operations as defined below.
 """
 
+from contextlib import contextmanager
 import datetime
+import hashlib
 from builtins import list
 
 import pandas as pd
-import psycopg2
 from riverrunner import context
-from riverrunner.context import Measurement, Prediction, RiverRun, Station, StationRiverDistance
+from riverrunner.context import Climatology, Measurement, ModelFit, ModelOrder, Prediction, RiverRun, SeriesDiagnostics, Station, \
+    StationRiverDistance
+from riverrunner.rows import MeasurementRow, PredictionRow, RiverRunRow, StationRow, measurement_frame
 from riverrunner import settings
+from sqlalchemy import Integer, cast, extract, func, or_, select
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import lazyload
 
 
 class Repository:
@@ -27,14 +32,48 @@ class Repository:
         else:
             self.__session = session
 
-        if connection is None:
-            self.__connection = psycopg2.connect(**settings.PSYCOPG_DB)
-        else:
-            self.__connection = connection
+        # only resources opened by the repository are closed with it
+        self.__owns_session = session is None
+        self.__owns_connection = connection is None
+        self.__raw_connection = connection
 
     def __del__(self):
-        self.__session.close()
-        self.__connection.close()
+        self.close()
+
+    def close(self):
+        """return the session's and the raw connection's database connections to the pool
+
+        only resources opened by the repository are closed, a session it was given is left open. the repository stays
+        usable and reconnects on next use
+        """
+        if self.__owns_session:
+            self.__session.close()
+
+        if self.__owns_connection and self.__raw_connection is not None:
+            self.__raw_connection.close()
+            self.__raw_connection = None
+
+    @property
+    def __connection(self):
+        """raw DBAPI connection, opened on first use from the session's database so raw SQL and ORM queries
+        never diverge"""
+        if self.__raw_connection is None:
+            self.__raw_connection = self.__session.bind.raw_connection()
+
+        return self.__raw_connection
+
+    @contextmanager
+    def unit_of_work(self):
+        """repository over a short-lived session
+
+        the session is committed when the block exits, rolled back if it raises and always closed. nothing it
+        loads outlives the block so long-running jobs keep a flat memory profile
+
+        Yields:
+            Repository: bound to the new session
+        """
+        with context.unit_of_work(self.__session.bind) as session:
+            yield Repository(session=session)
 
     def clear_predictions(self, run_id):
         """delete all existing predictions from database
@@ -44,6 +83,47 @@ class Repository:
         """
         self.__session.query(Prediction).filter(Prediction.run_id == run_id).delete()
 
+    def delete_measurements(self, start_date, end_date, chunk_size=50000):
+        """delete raw measurements within a date range
+
+        rows are removed in chunks of at most chunk_size, each in its own transaction, so no lock is held on
+        measurement for longer than a single chunk takes to delete
+
+        Args:
+            start_date (DateTime): beginning of the range, inclusive
+            end_date (DateTime): end of the range, exclusive
+            chunk_size (int) - optional: maximum number of rows deleted per transaction
+
+        Returns:
+            (int, int): number of rows deleted and the bytes their tuples occupied. the space becomes reusable once
+            measurement is vacuumed, it is not returned to the file system
+        """
+        rows, size = 0, 0
+        try:
+            with self.__connection.cursor() as cursor:
+                while True:
+                    cursor.execute("""
+                        DELETE FROM measurement
+                        WHERE ctid = ANY(ARRAY(
+                            SELECT ctid FROM measurement
+                            WHERE date_time >= %s AND date_time < %s
+                            LIMIT %s))
+                        RETURNING pg_column_size(measurement.*);
+                    """, (start_date, end_date, chunk_size))
+                    deleted = cursor.fetchall()
+                    self.__connection.commit()
+
+                    rows += len(deleted)
+                    size += sum(d[0] for d in deleted)
+                    if len(deleted) < chunk_size:
+                        break
+
+            return rows, size
+        except:
+            self.__connection.rollback()
+
+            raise
+
     def get_all_runs(self):
         """retrieve all runs from db
 
@@ -54,35 +134,107 @@ class Repository:
         runs = pd.DataFrame([r.dict for r in self.__session.query(RiverRun).all()])
         return runs
 
-    def get_all_runs_as_list(self):
+    def get_all_runs_as_list(self, lightweight=False):
         """returns all runs as select list
 
+        Args:
+            lightweight (bool) - optional: return read-only RiverRunRows built without the ORM
+
         Returns
             [{'label', 'value'}]: list of select options for drop down
         """
         try:
+            if lightweight:
+                return self.__get_run_rows()
+
             return self.__session.query(RiverRun).all()
         except SQLAlchemyError as e:
             print([str(a) for a in e.args])
             self.__session.rollback()
 
-    def get_all_stations(self, source=None):
+    def get_all_stations(self, source=None, lightweight=False):
         """retrieve all weather stations from db
 
+        Args:
+            source (str) - optional: only retrieve stations from this source
+            lightweight (bool) - optional: return a list of read-only StationRows instead of a DataFrame
+
         Returns:
             DataFrame: containing all weather stations
         """
+        query = select([Station.station_id, Station.source, Station.name, Station.latitude, Station.longitude])
         if source is not None:
-            stations = self.__session.query(Station).filter(
-                Station.source == source
-            ).all()
-        else:
-            stations = self.__session.query(Station).all()
+            query = query.where(Station.source == source)
+
+        stations = [StationRow(*s) for s in self.__session.execute(query)]
+        if lightweight:
+            return stations
 
-        stations = [s.dict for s in stations]
-        return pd.DataFrame(stations)
+        return pd.DataFrame([s.dict for s in stations])
 
-    def get_measurements(self, run_id, start_date=None, end_date=None, min_distance=0., metric_ids=None):
+    def get_climatology(self, run_id, days_of_year=None):
+        """retrieve the day-of-year flow rate climatology of a run
+
+        Args:
+            run_id (int): run id
+            days_of_year ([int]) - optional: days of the year to retrieve, every day if None
+
+        Returns:
+            DataFrame: samples, min, q10, q25, q50, q75, q90 and max indexed by day_of_year, without the days that have
+            no climatology
+        """
+        query = self.__session.query(Climatology).filter(Climatology.run_id == run_id)
+        if days_of_year is not None:
+            query = query.filter(Climatology.day_of_year.in_([int(d) for d in days_of_year]))
+
+        columns = ['day_of_year', 'samples', 'min', 'q10', 'q25', 'q50', 'q75', 'q90', 'max']
+        return pd.DataFrame([[getattr(c, column) for column in columns] for c in query], columns=columns) \
+            .set_index('day_of_year')
+
+    def get_input_fingerprint(self, run_id, metric_ids=None, start_date=None, end_date=None, resolution=None,
+                              resolution_metric_ids=None):
+        """ get a cheap fingerprint of the measurements a run is modeled on
+
+        the fingerprint covers the run's stations and the latest timestamp and number of measurements for each of
+        their metrics, it changes whenever a measurement for the run is added or removed
+
+        Args:
+            run_id (int): run id
+            metric_ids ([str]) - optional: list of metric ids to include
+            start_date (DateTime) - optional: only cover measurements from this date on
+            end_date (DateTime) - optional: only cover measurements before this date
+            resolution (int) - optional: only cover the measurements get_measurements retrieves at this resolution
+            resolution_metric_ids ([str]) - optional: metrics the resolution applies to, see get_measurements
+
+        Returns:
+            str: hex digest, equal as long as the run's measurements have not changed
+        """
+        station_ids = [s[0] for s in self.get_run_stations(run_id)]
+
+        query = select([Measurement.station_id, Measurement.metric_id,
+                        func.max(Measurement.date_time), func.count()]) \
+            .where(Measurement.station_id.in_(station_ids)) \
+            .group_by(Measurement.station_id, Measurement.metric_id) \
+            .order_by(Measurement.station_id, Measurement.metric_id)
+        if metric_ids is not None:
+            query = query.where(Measurement.metric_id.in_(metric_ids))
+        if start_date is not None:
+            query = query.where(Measurement.date_time >= start_date)
+        if end_date is not None:
+            query = query.where(Measurement.date_time < end_date)
+        if resolution is not None:
+            query = query.where(self.__at_resolution(resolution, resolution_metric_ids))
+
+        # the key of the default resolution is unchanged so earlier fingerprints stay valid
+        key = sorted(station_ids) if resolution is None else (sorted(station_ids), resolution)
+        digest = hashlib.sha1(repr(key).encode())
+        for row in self.__session.execute(query):
+            digest.update(repr(tuple(row)).encode())
+
+        return digest.hexdigest()
+
+    def get_measurements(self, run_id, start_date=None, end_date=None, min_distance=0., metric_ids=None,
+                         lightweight=False, resolution=None, resolution_metric_ids=None, compact=False):
         """ get a set of measurements from the db
 
         * not supplying a start and end date will return measurements covering the previous 30 days. add a start date to retrieve older
@@ -91,6 +243,8 @@ class Repository:
         * supplying a distance will NOT guarantee both NOAA and USGS stations are retrieved
         * supplying an end date without a start will raise an exception
         * supplying an end date earlier than the start will raise an exception
+        * supplying a resolution only retrieves measurements taken on a multiple of that many minutes after
+        midnight, e.g. hourly readings of a station reporting every 15 minutes for a resolution of 60
 
         Args:
             run_id (int): retrieve measurements associated with a specific run
@@ -99,6 +253,12 @@ class Repository:
             end_date (DateTime) - optional: end of date range for which to retrieve measurements
             min_distance (float) - optional: distance from run for which to retrieve measurements
             metric_ids ([str]) - optional: list of metric ids to filter
+            lightweight (bool) - optional: return a list of read-only MeasurementRows instead of a DataFrame
+            resolution (int) - optional: minutes between the measurements retrieved, every measurement if None
+            resolution_metric_ids ([str]) - optional: metrics the resolution applies to, every metric if None.
+            metrics that are summed should be left out so no reading is lost
+            compact (bool) - optional: return a DataFrame with categorical ids, float32 values and datetime64
+            timestamps built column by column without intermediate rows, see rows.measurement_frame
 
         Returns:
             DataFrame: containing measurements within the given set of parameters
@@ -135,6 +295,197 @@ class Repository:
         else:
             raise_rid_error()
 
+        stations = self.get_run_stations(run_id, min_distance)
+        station_ids = [s[0] for s in stations]
+
+        # make the query, the source of each station is already known so no join is required
+        sources = {s[0]: s[2] for s in stations}
+        query = select([Measurement.date_time, Measurement.metric_id, Measurement.station_id, Measurement.value]) \
+            .where(Measurement.date_time >= start_date) \
+            .where(Measurement.date_time < end_date) \
+            .where(Measurement.station_id.in_(station_ids))
+        if metric_ids is not None:
+            query = query.where(Measurement.metric_id.in_(metric_ids))
+        if resolution is not None:
+            query = query.where(self.__at_resolution(resolution, resolution_metric_ids))
+
+        if compact:
+            return measurement_frame(self.__session.execute(query), sources)
+
+        measurements = [
+            MeasurementRow(date_time, metric_id, station_id, sources[station_id], value)
+            for date_time, metric_id, station_id, value in self.__session.execute(query)
+        ]
+        if lightweight:
+            return measurements
+
+        df = pd.DataFrame([m.dict for m in measurements])
+        return df
+
+    def get_model_fit(self, run_id):
+        """retrieve the most recent model fit for a run
+
+        fits may be written by other processes so the fit is always reloaded from the db
+
+        Args:
+            run_id (int): run id
+
+        Returns:
+            ModelFit: the fit or None if the run has not been modeled
+        """
+        return self.__session.query(ModelFit).populate_existing().filter(ModelFit.run_id == run_id).scalar()
+
+    def get_model_order(self, run_id):
+        """retrieve the cached ARMA order for a run
+
+        Args:
+            run_id (int): run id
+
+        Returns:
+            ModelOrder: the cached order or None if no order has been selected
+        """
+        return self.__session.query(ModelOrder).filter(ModelOrder.run_id == run_id).scalar()
+
+    def get_longest_training_days(self):
+        """retrieve the longest training window configured for any run
+
+        Returns:
+            int: days of history, None if no run overrides the default window
+        """
+        return self.__session.execute(select([func.max(RiverRun.training_days)])).scalar()
+
+    def get_oldest_measurement_date(self):
+        """retrieve the timestamp of the oldest raw measurement
+
+        Returns:
+            DateTime: oldest measurement timestamp or None if the table is empty
+        """
+        with self.__connection.cursor() as cursor:
+            cursor.execute("SELECT min(date_time) FROM measurement;")
+            oldest = cursor.fetchone()[0]
+
+        self.__connection.commit()
+        return oldest
+
+    def get_predicted_runs(self, lightweight=False):
+        """retrieve runs that have a prediction for today
+
+        runs are filtered and ordered on the persisted runability column, see put_runability, predictions are not
+        loaded
+
+        Args:
+            lightweight (bool) - optional: return read-only RiverRunRows built without the ORM
+
+        Returns:
+            [RiverRun]: runs ordered by runability
+        """
+        try:
+            if lightweight:
+                return self.__get_run_rows(RiverRun.runability.isnot(None), RiverRun.runability != -2,
+                                           predictions=False)
+
+            return self.__session.query(RiverRun) \
+                .options(lazyload(RiverRun.predictions)) \
+                .filter(RiverRun.runability.isnot(None), RiverRun.runability != -2) \
+                .order_by(RiverRun.runability) \
+                .all()
+        except SQLAlchemyError as e:
+            print([str(a) for a in e.args])
+            self.__session.rollback()
+            raise e
+
+    def get_raw_measurements(self, start_date, end_date):
+        """retrieve every raw measurement within a date range regardless of run
+
+        Args:
+            start_date (DateTime): beginning of the range, inclusive
+            end_date (DateTime): end of the range, exclusive
+
+        Returns:
+            DataFrame: columns date_time, station_id, metric_id and value
+        """
+        with self.__connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT date_time, station_id, metric_id, value FROM measurement
+                WHERE date_time >= %s AND date_time < %s;
+            """, (start_date, end_date))
+            rows = cursor.fetchall()
+
+        self.__connection.commit()
+        return pd.DataFrame(rows, columns=['date_time', 'station_id', 'metric_id', 'value'])
+
+    def get_run(self, run_id, lightweight=False):
+        """retrieve a single run
+
+        Args
+            run_id (int): run id
+            lightweight (bool) - optional: return a read-only RiverRunRow built without the ORM
+        """
+        if run_id < 0:
+            raise ValueError('run id does not exist')
+        else:
+            pass
+
+        try:
+            if lightweight:
+                runs = self.__get_run_rows(RiverRun.run_id == run_id)
+                run = runs[0] if len(runs) > 0 else None
+            else:
+                run = self.__session.query(RiverRun).filter(RiverRun.run_id == run_id).scalar()
+
+            if run is None:
+                raise ValueError('run id does not exist')
+
+            return run
+        except SQLAlchemyError as e:
+            print([str(a) for a in e.args])
+            raise e
+
+    def get_series_diagnostics(self, run_ids=None):
+        """retrieve the stored time series diagnostics of runs
+
+        Args:
+            run_ids ([int]) - optional: runs to retrieve, all runs with diagnostics if None
+
+        Returns:
+            DataFrame: one row of diagnostics per run, see SeriesDiagnostics
+        """
+        query = self.__session.query(SeriesDiagnostics)
+        if run_ids is not None:
+            query = query.filter(SeriesDiagnostics.run_id.in_(run_ids))
+
+        columns = [c.name for c in SeriesDiagnostics.__table__.columns]
+        return pd.DataFrame([d.dict for d in query.order_by(SeriesDiagnostics.run_id)], columns=columns)
+
+    def get_training_config(self, run_id):
+        """retrieve the training window and resolution configured for a run
+
+        Args:
+            run_id (int): run id
+
+        Returns:
+            (int, int): days of history and minutes between measurements, None for either when the run uses the
+            default
+        """
+        row = self.__session.execute(
+            select([RiverRun.training_days, RiverRun.training_resolution]).where(RiverRun.run_id == run_id)).first()
+
+        return (None, None) if row is None else tuple(row)
+
+    def get_run_stations(self, run_id, min_distance=0.):
+        """ get the weather stations whose measurements are associated with a run
+
+        * if no min distance (or a negative distance) is provided the closest station from each unique source is
+        returned
+        * supplying a distance will NOT guarantee both NOAA and USGS stations are returned
+
+        Args:
+            run_id (int): run id
+            min_distance (float) - optional: distance from run within which to return stations
+
+        Returns:
+            [(str, float, str)]: station id, distance and source of each station, closest first
+        """
         # define the stations we need to reference
         stations = self.__session.query(StationRiverDistance.station_id,
                                         StationRiverDistance.distance,
@@ -165,47 +516,130 @@ class Repository:
         else:
             stations = [s for s in stations if s[1] < min_distance]
 
-        station_ids = [s[0] for s in stations]
+        return stations
 
-        # make the query
-        if metric_ids is None:
-            measurements = self.__session.query(Measurement) \
-                .filter(Measurement.date_time >= start_date,
-                        Measurement.date_time < end_date,
-                        Measurement.station_id.in_(station_ids), ) \
-                .all()
-        else:
-            measurements = self.__session.query(Measurement) \
-                .filter(Measurement.date_time >= start_date,
-                        Measurement.date_time < end_date,
-                        Measurement.station_id.in_(station_ids),
-                        Measurement.metric_id.in_(metric_ids)) \
-                .all()
+    def put_climatology(self, start_date, end_date, window=7, metric_id='00060'):
+        """recompute the day-of-year flow rate climatology of every run for the days of a date range
 
-        df = pd.DataFrame([m.dict for m in measurements])
-        return df
+        the statistics of a day of the year are computed over the daily rollups of the run's closest USGS station
+        on every day of every year whose day of the year is within window days of it. only the days of the year
+        whose statistics the rollups of [start_date, end_date) contribute to are recomputed, so the climatology is
+        kept up to date by calling this after each put_daily_measurements
 
-    def get_run(self, run_id):
-        """retrieve a single run
+        Notes:
+            * will overwrite the previous climatology of the recomputed days
+            * connection will rollback transaction if commit fails
 
-        Args
-            run_id (int): run id
+        Args:
+            start_date (DateTime): beginning of the range, inclusive
+            end_date (DateTime): end of the range, exclusive
+            window (int) - optional: days either side of a day of the year its statistics are computed over
+            metric_id (str) - optional: metric the climatology is computed for, the flow rate by default
+
+        Returns:
+            int: number of runs' days of the year written
         """
-        if run_id < 0:
-            raise ValueError('run id does not exist')
-        else:
-            pass
+        try:
+            with self.__connection.cursor() as cursor:
+                cursor.execute("""
+                    WITH flow_station AS (
+                        SELECT DISTINCT ON (d.run_id) d.run_id, d.station_id
+                        FROM station_river_distance d
+                            JOIN station s ON s.station_id = d.station_id
+                        WHERE s.source = 'USGS'
+                        ORDER BY d.run_id, d.distance
+                    ), touched AS (
+                        SELECT DISTINCT (extract(doy FROM day)::int - 1 + shift + 366) %% 366 + 1 AS day_of_year
+                        FROM generate_series(%(start)s::date, %(end)s::date - 1, interval '1 day') AS day,
+                             generate_series(-%(window)s, %(window)s) AS shift
+                    ), samples AS (
+                        SELECT f.run_id, t.day_of_year, m.mean
+                        FROM flow_station f
+                            JOIN daily_measurement m ON m.station_id = f.station_id AND m.metric_id = %(metric)s
+                            JOIN touched t ON least(abs(extract(doy FROM m.date)::int - t.day_of_year),
+                                                    366 - abs(extract(doy FROM m.date)::int - t.day_of_year))
+                                              <= %(window)s
+                        WHERE m.mean IS NOT NULL
+                    )
+                    INSERT INTO climatology (run_id, day_of_year, samples, min, q10, q25, q50, q75, q90, max,
+                                             updated_on)
+                        SELECT run_id, day_of_year, count(*), min(mean),
+                               percentile_cont(.1) WITHIN GROUP (ORDER BY mean),
+                               percentile_cont(.25) WITHIN GROUP (ORDER BY mean),
+                               percentile_cont(.5) WITHIN GROUP (ORDER BY mean),
+                               percentile_cont(.75) WITHIN GROUP (ORDER BY mean),
+                               percentile_cont(.9) WITHIN GROUP (ORDER BY mean),
+                               max(mean), now()
+                        FROM samples
+                        GROUP BY run_id, day_of_year
+                    ON CONFLICT (run_id, day_of_year)
+                        DO UPDATE SET samples = EXCLUDED.samples, min = EXCLUDED.min, q10 = EXCLUDED.q10,
+                                      q25 = EXCLUDED.q25, q50 = EXCLUDED.q50, q75 = EXCLUDED.q75,
+                                      q90 = EXCLUDED.q90, max = EXCLUDED.max, updated_on = EXCLUDED.updated_on;
+                """, dict(start=start_date, end=end_date, window=window, metric=metric_id))
+                written = cursor.rowcount
+
+            self.__connection.commit()
 
+            return written
+        except:
+            self.__connection.rollback()
+
+            raise
+
+    def put_daily_measurements(self, start_date, end_date, overwrite=True):
+        """roll raw measurements up into daily_measurement
+
+        Notes:
+            * will overwrite previous rollups for the same station, metric and day unless overwrite is False
+            * connection will rollback transaction if commit fails
+
+        Args:
+            start_date (DateTime): beginning of the range, inclusive
+            end_date (DateTime): end of the range, exclusive
+            overwrite (bool) - optional: replace existing rollups, otherwise only days without a rollup are written.
+            rollups of days whose raw measurements may already be partially deleted must not be overwritten
+
+        Returns:
+            int: number of daily rollups written
+        """
         try:
-            run = self.__session.query(RiverRun).filter(RiverRun.run_id == run_id).scalar()
+            with self.__connection.cursor() as cursor:
+                conflict = """
+                    DO UPDATE SET count = EXCLUDED.count, mean = EXCLUDED.mean, sum = EXCLUDED.sum,
+                                  min = EXCLUDED.min, max = EXCLUDED.max""" if overwrite else 'DO NOTHING'
+                cursor.execute(f"""
+                    INSERT INTO daily_measurement (date, metric_id, station_id, count, mean, sum, min, max)
+                        SELECT date_time::date, metric_id, station_id,
+                               count(*), avg(value), sum(value), min(value), max(value)
+                        FROM measurement
+                        WHERE date_time >= %s AND date_time < %s
+                        GROUP BY date_time::date, metric_id, station_id
+                    ON CONFLICT (date, metric_id, station_id) {conflict};
+                """, (start_date, end_date))
+                written = cursor.rowcount
 
-            if run is None:
-                raise ValueError('run id does not exist')
+            self.__connection.commit()
 
-            return run
-        except SQLAlchemyError as e:
-            print([str(a) for a in e.args])
-            raise e
+            return written
+        except:
+            self.__connection.rollback()
+
+            raise
+
+    def put_input_fingerprints(self, fingerprints, commit=True):
+        """record the input fingerprints runs' published predictions were computed from
+
+        Args:
+            fingerprints ({int: str}): fingerprint by run id, see get_input_fingerprint
+            commit (bool) - optional: commit the session, False within a unit of work that commits once
+        """
+        for run_id, fingerprint in fingerprints.items():
+            self.__session.query(RiverRun) \
+                .filter(RiverRun.run_id == run_id) \
+                .update({RiverRun.input_fingerprint: fingerprint}, synchronize_session=False)
+        if commit:
+            self.__session.commit()
 
     def put_measurements_from_csv(self, csv_file):
         """ add a file of measurements
@@ -268,6 +702,44 @@ class Repository:
             self.__session.rollback()
             raise e
 
+    def put_model_fit(self, fit):
+        """add or replace the most recent model fit for a run
+
+        Args:
+            fit (ModelFit): fit to store
+
+        Returns:
+            ModelFit: the persisted fit
+        """
+        try:
+            fit = self.__session.merge(fit)
+            self.__session.commit()
+
+            return fit
+        except SQLAlchemyError as e:
+            print([str(a) for a in e.args])
+            self.__session.rollback()
+            raise e
+
+    def put_model_order(self, order):
+        """add or replace the cached ARMA order for a run
+
+        Args:
+            order (ModelOrder): order to cache
+
+        Returns:
+            ModelOrder: the persisted order
+        """
+        try:
+            order = self.__session.merge(order)
+            self.__session.commit()
+
+            return order
+        except SQLAlchemyError as e:
+            print([str(a) for a in e.args])
+            self.__session.rollback()
+            raise e
+
     def put_predictions(self, predictions):
         """add a set of predictions
 
@@ -280,6 +752,44 @@ class Repository:
         self.__session.add_all(predictions)
         self.__session.commit()
 
+    def put_runability(self, run_ids=None, stale=False, commit=True):
+        """recompute and persist todays_runability
+
+        the daily job refreshes the snapshot when it publishes predictions, then refreshes every snapshot taken before
+        today, e.g. of runs whose model failed, from the runs' existing predictions
+
+        Args:
+            run_ids ([int]) - optional: runs to refresh, all runs are refreshed if None
+            stale (bool) - optional: only refresh runs whose snapshot was taken before today
+            commit (bool) - optional: commit the session, False within a unit of work that commits once
+        """
+        query = self.__session.query(RiverRun)
+        if run_ids is not None:
+            query = query.filter(RiverRun.run_id.in_(run_ids))
+        if stale:
+            today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+            query = query.filter(or_(RiverRun.runability_on.is_(None), RiverRun.runability_on < today))
+
+        query.update({RiverRun.runability: RiverRun.todays_runability,
+                      RiverRun.runability_on: datetime.datetime.now()}, synchronize_session=False)
+        if commit:
+            self.__session.commit()
+
+    def put_series_diagnostics(self, diagnostics):
+        """add or replace the time series diagnostics of a set of runs
+
+        Args:
+            diagnostics ([SeriesDiagnostics]): diagnostics to store, replacing each run's previous diagnostics
+        """
+        try:
+            for d in diagnostics:
+                self.__session.merge(d)
+            self.__session.commit()
+        except SQLAlchemyError as e:
+            print([str(a) for a in e.args])
+            self.__session.rollback()
+            raise e
+
     def put_station_river_distances(self, strd):
         """put station river distance objects in the db
 
@@ -298,3 +808,73 @@ class Repository:
             self.__session.rollback()
 
             return False
+
+    def replace_predictions(self, run_ids, predictions, commit=True):
+        """replace the predictions of a set of runs in a single transaction
+
+        Args:
+            run_ids ([int]): runs whose existing predictions are deleted
+            predictions ([Prediction]): predictions to insert in their place
+            commit (bool) - optional: commit the session, False within a unit of work that commits once
+        """
+        try:
+            self.__session.query(Prediction) \
+                .filter(Prediction.run_id.in_(run_ids)) \
+                .delete(synchronize_session=False)
+            self.__session.bulk_save_objects(predictions)
+            if commit:
+                self.__session.commit()
+
+        except SQLAlchemyError as e:
+            print([str(a) for a in e.args])
+            self.__session.rollback()
+            raise e
+
+    @staticmethod
+    def __at_resolution(resolution, metric_ids=None):
+        """filter measurements to those taken on a multiple of resolution minutes after midnight
+
+        Args:
+            resolution (int): minutes between measurements
+            metric_ids ([str]) - optional: metrics the resolution applies to, every metric if None
+
+        Returns:
+            criterion on measurement
+        """
+        minute = cast(extract('hour', Measurement.date_time), Integer)*60 + \
+            cast(extract('minute', Measurement.date_time), Integer)
+        criterion = minute % resolution == 0
+        if metric_ids is None:
+            return criterion
+
+        return or_(Measurement.metric_id.notin_(metric_ids), criterion)
+
+    def __get_run_rows(self, *criteria, predictions=True):
+        """build RiverRunRows with a Core query per table
+
+        Args:
+            criteria: filters applied to river_run
+            predictions (bool) - optional: also load each run's predictions
+
+        Returns:
+            [RiverRunRow]: matching runs ordered by runability
+        """
+        columns = [c for c in RiverRun.__table__.columns]
+        query = select(columns)
+        for criterion in criteria:
+            query = query.where(criterion)
+        rows = self.__session.execute(query.order_by(RiverRun.runability)).fetchall()
+
+        grouped = {r.run_id: [] for r in rows}
+        if predictions and len(rows) > 0:
+            query = select([Prediction.run_id, Prediction.timestamp, Prediction.fr_lb, Prediction.fr,
+                            Prediction.fr_ub]) \
+                .where(Prediction.run_id.in_(list(grouped.keys()))) \
+                .order_by(Prediction.timestamp)
+            for p in self.__session.execute(query):
+                grouped[p[0]].append(PredictionRow(*p))
+
+        return [
+            RiverRunRow(predictions=tuple(grouped[r.run_id]), **{c.name: r[c] for c in columns})
+            for r in rows
+        ]
@@ -0,0 +1,154 @@
+"""
+Module defining lightweight read-only row types.
+
+Rows are built by Repository from Core queries when a caller only needs to read data. They are immutable tuples
+without session, identity map or change tracking overhead and expose the same read properties as their ORM
+counterparts in riverrunner.context.
+
+Classes:
+    MeasurementRow: read-only Measurement
+    PredictionRow: read-only Prediction
+    RiverRunRow: read-only RiverRun including its predictions
+    StationRow: read-only Station
+
+Functions:
+    measurement_frame: columnar frame of measurements with compact dtypes
+"""
+
+from collections import namedtuple
+import datetime
+import numpy as np
+import pandas as pd
+from riverrunner.context import compute_runability
+
+
+class MeasurementRow(namedtuple('MeasurementRow', ['date_time', 'metric_id', 'station_id', 'source', 'value'])):
+    """read-only measurement
+
+    Attributes:
+        date_time (DateTime): timestamp for when the measurement was taken
+        metric_id (str): reference to the metric gathered
+        station_id (str): reference to the weather station that gathered the measurement
+        source (str): the weather station's controlling authority
+        value (float): the value recorded
+    """
+    __slots__ = ()
+
+    @property
+    def dict(self):
+        """dictionary representation of the measurement"""
+        return dict(self._asdict())
+
+
+class PredictionRow(namedtuple('PredictionRow', ['run_id', 'timestamp', 'fr_lb', 'fr', 'fr_ub'])):
+    """read-only prediction
+
+    Attributes:
+        run_id (int): reference to the river run this prediction is referencing
+        timestamp (DateTime): timestamp for the prediction
+        fr_lb (float): the lower bound of a confidence interval surrounding the prediction
+        fr (float): the predicted flow rate
+        fr_ub (float): the upper bound of a confidence interval surrounding the prediction
+    """
+    __slots__ = ()
+
+    @property
+    def year(self):
+        return self.timestamp.year
+
+    @property
+    def month(self):
+        return self.timestamp.month
+
+    @property
+    def day(self):
+        return self.timestamp.day
+
+
+class RiverRunRow(namedtuple('RiverRunRow', [
+        'run_id', 'class_rating', 'max_level', 'min_level', 'put_in_latitude', 'put_in_longitude', 'distance',
+        'river_name', 'run_name', 'take_out_latitude', 'take_out_longitude', 'runability', 'runability_on',
+        'input_fingerprint', 'training_days', 'training_resolution', 'predictions'])):
+    """read-only river run
+
+    Attributes:
+        see riverrunner.context.RiverRun, predictions is a tuple of PredictionRow
+    """
+    __slots__ = ()
+
+    @property
+    def dict(self):
+        """dictionary representation of the river run"""
+        d = dict(self._asdict())
+        del d['runability']
+        del d['runability_on']
+        del d['input_fingerprint']
+        del d['training_days']
+        del d['training_resolution']
+        del d['predictions']
+
+        return d
+
+    @property
+    def observed_measurements(self):
+        today = datetime.datetime.today()
+        return [p for p in self.predictions if p.timestamp <= today]
+
+    @property
+    def predicted_measurements(self):
+        today = datetime.datetime.today()
+        return [p for p in self.predictions if p.timestamp > today]
+
+    @property
+    def todays_runability(self):
+        return compute_runability(self.predictions, self.min_level, self.max_level)
+
+    @property
+    def select_option(self):
+        return {'label': self.run_name, 'value': self.run_id}
+
+
+class StationRow(namedtuple('StationRow', ['station_id', 'source', 'name', 'latitude', 'longitude'])):
+    """read-only weather station
+
+    Attributes:
+        station_id (string): id
+        source (string): the weather station's controlling authority {USGS, NOAA}
+        name (string): name
+        latitude (float): geographical latitude (DD)
+        longitude (float): geographical longitude (DD)
+    """
+    __slots__ = ()
+
+    @property
+    def dict(self):
+        return dict(self._asdict())
+
+
+def measurement_frame(measurements, sources):
+    """columnar frame of measurements with compact dtypes
+
+    ids and sources are stored as categorical codes, values as float32 and timestamps as datetime64, so the frame
+    holds no python object per row. float32 keeps the 7 significant digits the gauges and weather stations report
+
+    Args:
+        measurements: iterable of (date_time, metric_id, station_id, value) tuples
+        sources: ({str: str}) source of each station id
+
+    Returns:
+        DataFrame: date_time, metric_id, station_id, source and value columns, as MeasurementRow
+    """
+    date_time, metric_id, station_id, value = list(zip(*measurements)) or [(), (), (), ()]
+
+    stations = pd.Categorical(station_id)
+    source_names = sorted({sources[s] for s in stations.categories})
+    source_codes = np.array([source_names.index(sources[s]) for s in stations.categories], dtype=np.int8)
+    source = pd.Categorical.from_codes(source_codes[stations.codes], source_names)
+
+    return pd.DataFrame({
+        'date_time': pd.DatetimeIndex(date_time).values,
+        'metric_id': pd.Categorical(metric_id),
+        'station_id': stations,
+        'source': source,
+        'value': np.array(value, dtype=np.float32)
+    }, columns=['date_time', 'metric_id', 'station_id', 'source', 'value'])
@@ -0,0 +1,113 @@
+"""
+Module for caching runs' daily feature frames on local disk.
+
+Each run's daily features, as aggregated by arima.daily_features, are stored column by column in a numpy .npz file
+together with the range of raw measurements they were aggregated from and a fingerprint of those measurements, see
+Repository.get_input_fingerprint. Arima.daily_avg revalidates the fingerprint, aggregates only the days after the
+cached range and appends them, and rebuilds the whole history only when the cached range's measurements changed.
+
+Classes:
+    CachedSeries: a run's cached daily features and the measurements they cover
+
+    SeriesCache: per-run daily feature cache
+        Functions:
+            get: retrieve a run's cached daily features
+
+            put: atomically write a run's daily features
+"""
+
+from collections import namedtuple
+import os
+import numpy as np
+import pandas as pd
+
+
+"""directory daily feature frames are cached in"""
+SERIES_CACHE_DIR = 'data/series'
+
+
+"""daily features aggregated from a run's raw measurements in [start, through), with their fingerprint"""
+CachedSeries = namedtuple('CachedSeries', ['frame', 'start', 'through', 'fingerprint'])
+
+
+class SeriesCache:
+    """
+    Caches each run's daily features keyed by run_id
+
+    Args:
+        directory: (str) optional directory the frames are stored in, created on first write
+    """
+    def __init__(self, directory=SERIES_CACHE_DIR):
+        self.directory = directory
+
+    def path(self, run_id):
+        """file a run's daily features are stored in
+
+        Args:
+            run_id: (int) run the features are for
+
+        Returns:
+            str: path of the cached frame
+        """
+        return os.path.join(self.directory, f'{run_id}.npz')
+
+    def get(self, run_id):
+        """retrieve a run's cached daily features
+
+        Args:
+            run_id: (int) run the features are for
+
+        Returns:
+            CachedSeries: the cached frame, indexed by UTC day like the output of arima.daily_features, or None if
+            nothing is cached for the run
+        """
+        try:
+            with np.load(self.path(run_id)) as npz:
+                columns = [str(c) for c in npz['columns']]
+                index = pd.DatetimeIndex(npz['days'].astype('datetime64[D]'), name='date_time')
+                frame = pd.DataFrame({c: npz[f'column_{c}'] for c in columns},
+                                     index=index.tz_localize('UTC'), columns=columns)
+
+                return CachedSeries(frame=frame,
+                                    start=pd.Timestamp(npz['start'][()]).to_pydatetime(),
+                                    through=pd.Timestamp(npz['through'][()]).to_pydatetime(),
+                                    fingerprint=str(npz['fingerprint']))
+        except (OSError, ValueError, KeyError):
+            # missing, written by another version or unreadable
+            return None
+
+    def put(self, run_id, frame, start, through, fingerprint):
+        """atomically write a run's daily features
+
+        the frame is written to a temporary file unique to this process and moved into place so readers never see a
+        partially written frame
+
+        Args:
+            run_id: (int) run the features are for
+            frame: (DataFrame) daily features indexed by UTC day
+            start: (DateTime) beginning of the raw measurements aggregated, inclusive
+            through: (DateTime) end of the raw measurements aggregated, exclusive
+            fingerprint: (str) fingerprint of the raw measurements in [start, through)
+
+        Returns:
+            str: path of the cached frame
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        path = self.path(run_id)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f,
+                     columns=np.asarray(frame.columns, dtype=str),
+                     days=frame.index.tz_convert(None).values.astype('datetime64[D]').astype(np.int64),
+                     start=np.datetime64(start, 's'),
+                     through=np.datetime64(through, 's'),
+                     fingerprint=np.asarray(fingerprint, dtype=str),
+                     **{f'column_{c}': np.asarray(frame[c], dtype=float) for c in frame.columns})
+        os.replace(tmp, path)
+
+        return path
+
+
+"""the cache daily features are kept in by default"""
+SERIES_CACHE = SeriesCache()
@@ -0,0 +1,133 @@
+"""
+Module for sharing runs' daily series with worker processes without copying them.
+
+Every run's daily feature frame is packed into one block of aligned arrays: a float64 value matrix with one column
+per feature, an int64 array of days since the epoch and an index mapping each run_id to the slice of rows holding
+its series. The arrays are written as .npy files, by default to /dev/shm, and workers memory-map them read-only so
+every process reads the same pages rather than receiving a pickled copy of each frame.
+
+Classes:
+    SharedSeries: read-only view of a packed block
+        Functions:
+            slice: rows of the block holding a run's series
+
+            frame: a run's daily feature frame
+
+            unlink: remove the block
+
+Functions:
+    pack_series: write runs' daily feature frames to a new block
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+
+"""directory packed blocks are created in, shared memory where the platform exposes it"""
+SHARED_SERIES_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+"""files of a packed block"""
+_VALUES, _DAYS, _INDEX = 'values.npy', 'days.npy', 'index.npz'
+
+
+class SharedSeries:
+    """
+    Read-only view of a block of runs' daily series written by pack_series
+
+    Args:
+        directory: (str) directory the block was written to
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.values = np.load(os.path.join(directory, _VALUES), mmap_mode='r')
+        self.days = np.load(os.path.join(directory, _DAYS), mmap_mode='r')
+
+        with np.load(os.path.join(directory, _INDEX)) as index:
+            self.columns = [str(c) for c in index['columns']]
+            self.index = {int(r): (int(start), int(stop))
+                          for r, start, stop in zip(index['run_ids'], index['starts'], index['stops'])}
+
+    def __contains__(self, run_id):
+        return run_id in self.index
+
+    def slice(self, run_id):
+        """rows of the block holding a run's series
+
+        Args:
+            run_id: (int) run to look up
+
+        Returns:
+            slice: rows of values and days, None if the run was not packed
+        """
+        if run_id not in self.index:
+            return None
+
+        return slice(*self.index[run_id])
+
+    def frame(self, run_id):
+        """a run's daily feature frame
+
+        the frame's values are a read-only view of the block, copied only if modified
+
+        Args:
+            run_id: (int) run to look up
+
+        Returns:
+            DataFrame: indexed by UTC day like the output of Arima.daily_avg, None if the run was not packed
+        """
+        rows = self.slice(run_id)
+        if rows is None:
+            return None
+
+        index = pd.DatetimeIndex(self.days[rows].astype('datetime64[D]'), name='date_time').tz_localize('UTC')
+        return pd.DataFrame(self.values[rows], index=index, columns=self.columns, copy=False)
+
+    def unlink(self):
+        """remove the block, views already taken stay valid until released"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def pack_series(frames, columns=('temp', 'flow', 'precip'), directory=SHARED_SERIES_DIR):
+    """write runs' daily feature frames to a new block
+
+    Args:
+        frames: ({int: DataFrame}) output of Arima.daily_avg by run id, None or empty frames are packed as empty
+            series
+        columns: ((str)) optional feature columns to pack
+        directory: (str) optional directory the block is created in, the platform's temporary directory if None
+
+    Returns:
+        SharedSeries: view of the new block, unlink it once no worker needs it
+    """
+    block = tempfile.mkdtemp(prefix='riverrunner_series_', dir=directory)
+
+    lengths = [0 if f is None else len(f) for f in frames.values()]
+    stops = np.cumsum(lengths, dtype=np.int64)
+    starts = stops - np.asarray(lengths, dtype=np.int64)
+
+    values = np.lib.format.open_memmap(os.path.join(block, _VALUES), mode='w+', dtype=np.float64,
+                                       shape=(int(stops[-1]) if len(stops) > 0 else 0, len(columns)))
+    days = np.lib.format.open_memmap(os.path.join(block, _DAYS), mode='w+', dtype=np.int64,
+                                     shape=(len(values),))
+
+    for frame, start, stop in zip(frames.values(), starts, stops):
+        if start == stop:
+            continue
+
+        values[start:stop] = frame[list(columns)].values
+        days[start:stop] = frame.index.tz_convert(None).values.astype('datetime64[D]').astype(np.int64)
+
+    values.flush()
+    days.flush()
+    del values, days
+
+    np.savez(os.path.join(block, _INDEX),
+             run_ids=np.asarray(list(frames), dtype=np.int64),
+             starts=starts,
+             stops=stops,
+             columns=np.asarray(columns, dtype=str))
+
+    return SharedSeries(block)
@@ -31,6 +31,7 @@ from statsmodels.tsa.arima_model import ARIMA
 from statsmodels.tsa.stattools import acf, pacf
 from statsmodels.tsa.stattools import adfuller
 from statsmodels.tsa.stattools import arma_order_select_ic
+from riverrunner.arima import daily_features, parallel_order_select
 from riverrunner.repository import Repository
 
 REPO = Repository()
@@ -49,26 +50,7 @@ def daily_avg(time_series):
     Returns:
         DataFrame: containing daily measurements
     """
-    precip = time_series[time_series.metric_id == '00003']
-    precip['date_time'] = pd.to_datetime(precip['date_time'], utc=True)
-    precip.index = precip['date_time']
-    precip_daily = precip.resample('D').sum()
-
-    flow = time_series[time_series.metric_id == '00060']
-    flow['date_time'] = pd.to_datetime(flow['date_time'], utc=True)
-    flow.index = flow['date_time']
-    flow_daily = flow.resample('D').mean()
-
-    temp = time_series[time_series.metric_id == '00001']
-    temp['date_time'] = pd.to_datetime(temp['date_time'], utc=True)
-    temp.index = temp['date_time']
-    temp_daily = temp.resample('D').mean()
-
-    time_series_daily = temp_daily.merge(flow_daily, how='inner',
-                                         left_index=True, right_index=True)\
-        .merge(precip_daily, how='inner', left_index=True, right_index=True)
-    time_series_daily.columns = ['temp', 'flow', 'precip']
-    return time_series_daily
+    return daily_features(time_series)
 
 
 def test_stationarity(time_series):
@@ -141,11 +123,13 @@ def plot_autocorrs(time_series):
     plt.tight_layout()
 
 
-def test_model(run_id):
+def test_model(run_id, workers=None):
     """Function to test model for one run
 
     Args:
         run_id: run for which to test model
+        workers: optional process pool size for order selection, the
+        search runs serially if None
 
     Returns: plots showing model results
     """
@@ -166,7 +150,11 @@ def test_model(run_id):
     test_stationarity(train_measures_daily['flow'])
 
     # Determine p and q parameters for ARIMA model
-    params = arma_order_select_ic(train_measures_daily['flow'], ic='aic')
+    if workers is None:
+        params = arma_order_select_ic(train_measures_daily['flow'], ic='aic')
+    else:
+        params = parallel_order_select(train_measures_daily['flow'],
+                                       ic='aic', workers=workers)
 
     # Build and fit model
     mod = ARIMA(train_measures_daily['flow'],
@@ -0,0 +1,333 @@
+"""
+Module for benchmarking the modeling pipeline on synthetic data.
+
+Benchmarks run without a database against measurements generated to
+resemble a run's USGS and NOAA stations, so their results are
+reproducible on any machine. Like the exploration module, this module is
+not part of the daily pipeline and is not accompanied by unit tests.
+
+Examples:
+    python -m riverrunner.static.benchmarks
+
+Functions:
+    synthetic_measurements: generates raw measurements shaped like the
+    output of Repository.get_measurements
+
+    legacy_daily_avg: the filter-convert-resample-merge implementation
+    daily_features replaced, kept as a baseline
+
+    benchmark_daily_avg: times legacy_daily_avg against daily_features
+
+    benchmark_arx: times and scores the batched AR-X engine against fitting
+    statsmodels' ARIMA per run
+
+    benchmark_order_select: times and scores Hannan-Rissanen order
+    selection against the exhaustive search
+
+    benchmark_memory: bytes per row of measurement frames built from
+    MeasurementRows against the compact measurement_frame
+"""
+
+import datetime
+import timeit
+import time
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima_model import ARIMA
+from statsmodels.tsa.stattools import arma_order_select_ic
+from riverrunner.arima import ARX_LAGS, batched_arx, daily_features, \
+    hannan_rissanen_order_select
+from riverrunner.rows import MeasurementRow, measurement_frame
+
+
+def synthetic_measurements(days=4*365, seed=0, end=None):
+    """Generates raw measurements for one run
+
+    Flow is reported every 15 minutes by a USGS station and follows an
+    annual snow-melt cycle, temperature and precipitation are reported
+    hourly by a NOAA station.
+
+    Args:
+        days (int) - optional: days of history to generate
+        seed (int) - optional: random seed
+        end (DateTime) - optional: last timestamp, defaults to today
+
+    Returns:
+        DataFrame: with date_time, metric_id, station_id, source and
+        value columns
+    """
+    rng = np.random.RandomState(seed)
+    if end is None:
+        now = datetime.datetime.now()
+        end = datetime.datetime(now.year, now.month, now.day)
+    start = end - datetime.timedelta(days=days)
+
+    hourly = pd.date_range(start, periods=days*24, freq='60min')
+    quarter_hourly = pd.date_range(start, periods=days*96, freq='15min')
+
+    def season(index):
+        return np.sin(2*np.pi*(index.dayofyear.values - 80)/365.25)
+
+    temp = 10 + 12*season(hourly) + rng.normal(0, 3, len(hourly))
+    precip = np.where(rng.uniform(size=len(hourly)) < .08,
+                      rng.exponential(.05, len(hourly)), 0.)
+
+    # flow responds to smoothed precipitation on top of the seasonal melt
+    rain = pd.Series(precip, index=hourly).rolling(72, min_periods=1).sum()
+    rain = rain.reindex(quarter_hourly, method='ffill').values
+    flow = 800 + 500*season(quarter_hourly) + 2000*rain + \
+        rng.normal(0, 25, len(quarter_hourly))
+
+    frames = [
+        pd.DataFrame({'date_time': hourly, 'metric_id': '00001',
+                      'station_id': 'NOAA1', 'source': 'NOAA',
+                      'value': temp}),
+        pd.DataFrame({'date_time': hourly, 'metric_id': '00003',
+                      'station_id': 'NOAA1', 'source': 'NOAA',
+                      'value': precip}),
+        pd.DataFrame({'date_time': quarter_hourly, 'metric_id': '00060',
+                      'station_id': 'USGS1', 'source': 'USGS',
+                      'value': np.maximum(flow, 0.)})
+    ]
+    measurements = pd.concat(frames, ignore_index=True)
+    measurements = measurements[['date_time', 'metric_id', 'station_id',
+                                 'source', 'value']]
+
+    # the repository returns python datetimes, not datetime64
+    measurements['date_time'] = measurements['date_time'].astype(object)
+    return measurements
+
+
+def legacy_daily_avg(time_series):
+    """Filter-convert-resample-merge daily averages, the baseline for
+    daily_features
+
+    Args:
+        time_series: dataframe with metrics for one run_id, assumes output
+        from get_measurements function
+
+    Returns:
+        DataFrame: containing daily measurements
+    """
+    precip = time_series[time_series.metric_id == '00003']
+    precip['date_time'] = pd.to_datetime(precip['date_time'], utc=True)
+    precip.index = precip['date_time']
+    precip_daily = precip[['value']].resample('D').sum()
+
+    flow = time_series[time_series.metric_id == '00060']
+    flow['date_time'] = pd.to_datetime(flow['date_time'], utc=True)
+    flow.index = flow['date_time']
+    flow_daily = flow[['value']].resample('D').mean()
+
+    temp = time_series[time_series.metric_id == '00001']
+    temp['date_time'] = pd.to_datetime(temp['date_time'], utc=True)
+    temp.index = temp['date_time']
+    temp_daily = temp[['value']].resample('D').mean()
+
+    time_series_daily = temp_daily.merge(flow_daily, how='inner',
+                                         left_index=True, right_index=True)\
+        .merge(precip_daily, how='inner', left_index=True, right_index=True)
+    time_series_daily.columns = ['temp', 'flow', 'precip']
+    return time_series_daily.dropna()
+
+
+def benchmark_daily_avg(days=4*365, repeat=5):
+    """Times legacy_daily_avg against daily_features
+
+    Args:
+        days (int) - optional: days of synthetic history
+        repeat (int) - optional: timing repetitions, the best is reported
+
+    Returns:
+        dict: rows, best seconds for each implementation and whether both
+        produced the same frame
+    """
+    measurements = synthetic_measurements(days)
+
+    legacy = min(timeit.repeat(lambda: legacy_daily_avg(measurements),
+                               number=1, repeat=repeat))
+    vectorized = min(timeit.repeat(
+        lambda: daily_features(measurements).dropna(),
+        number=1, repeat=repeat))
+
+    expected = legacy_daily_avg(measurements)
+    actual = daily_features(measurements).dropna()
+    same = np.allclose(expected.values, actual.values) and \
+        (expected.index == actual.index).all()
+
+    return {'rows': len(measurements), 'legacy': legacy,
+            'vectorized': vectorized, 'identical': bool(same)}
+
+
+def benchmark_arx(runs=20, days=2*365, steps=7):
+    """Times and scores the batched AR-X engine against per-run ARIMA
+
+    Both fit the same AR(ARX_LAGS) model with temperature and
+    precipitation regressors to every run's history less its last steps
+    days and forecast those days from the same future predictors.
+
+    Args:
+        runs (int) - optional: number of synthetic runs
+        days (int) - optional: days of synthetic history per run
+        steps (int) - optional: held out days forecast
+
+    Returns:
+        dict: runs, seconds and mean absolute error of each engine
+    """
+    frames = [daily_features(synthetic_measurements(days, seed=seed)).dropna()
+              for seed in range(runs)]
+    train = [f.iloc[:-steps] for f in frames]
+    actual = np.stack([f['flow'].values[-steps:] for f in frames])
+
+    start = time.time()
+    forecasts = []
+    for t in train:
+        future = pd.concat([t[['temp', 'precip']].iloc[-7:].mean()
+                            .to_frame().T]*steps, ignore_index=True)
+        mod = ARIMA(t['flow'], order=(ARX_LAGS, 0, 0),
+                    exog=t[['temp', 'precip']]).fit(disp=0)
+        forecasts.append(mod.forecast(steps=steps, exog=future)[0])
+    arima_seconds = time.time() - start
+    arima_mae = np.abs(np.stack(forecasts) - actual).mean()
+
+    start = time.time()
+    forecasts = batched_arx(train, steps=steps)
+    arx_seconds = time.time() - start
+    arx_mae = np.abs(np.stack([f.values for f in forecasts]) - actual).mean()
+
+    return {'runs': runs, 'arima': arima_seconds, 'arx': arx_seconds,
+            'arima_mae': arima_mae, 'arx_mae': arx_mae}
+
+
+def benchmark_order_select(runs=5, days=2*365, steps=7):
+    """Times and scores Hannan-Rissanen order selection against the
+    exhaustive arma_order_select_ic search
+
+    Each run's order is selected on its history less its last steps days,
+    then an ARIMA with that order and temperature and precipitation
+    regressors forecasts those days.
+
+    Args:
+        runs (int) - optional: number of synthetic runs
+        days (int) - optional: days of synthetic history per run
+        steps (int) - optional: held out days forecast
+
+    Returns:
+        dict: runs, and for each method the selection seconds, forecast
+        mean absolute error and selected orders
+    """
+    frames = [daily_features(synthetic_measurements(days, seed=seed)).dropna()
+              for seed in range(runs)]
+
+    methods = {
+        'exhaustive': lambda y: arma_order_select_ic(y, ic='aic'),
+        'hannan_rissanen': lambda y: hannan_rissanen_order_select(y, ic='aic')
+    }
+
+    result = {'runs': runs}
+    for method, select in methods.items():
+        seconds, errors, orders = 0., [], []
+        for frame in frames:
+            train = frame.iloc[:-steps]
+
+            start = time.time()
+            p, q = select(train['flow']).aic_min_order
+            seconds += time.time() - start
+
+            future = pd.concat([train[['temp', 'precip']].iloc[-7:].mean()
+                                .to_frame().T]*steps, ignore_index=True)
+            mod = ARIMA(train['flow'], order=(p, 0, q),
+                        exog=train[['temp', 'precip']]).fit(disp=0)
+            forecast = mod.forecast(steps=steps, exog=future)[0]
+
+            errors.append(np.abs(forecast - frame['flow'].values[-steps:]))
+            orders.append((int(p), int(q)))
+
+        result[method] = {'seconds': seconds, 'mae': np.mean(errors),
+                          'orders': orders}
+
+    return result
+
+
+def benchmark_memory(days=4*365, repeat=3):
+    """Bytes per row of measurement frames built from MeasurementRows
+    against the compact measurement_frame
+
+    Both frames are built from the (date_time, metric_id, station_id,
+    value) tuples a Repository.get_measurements query yields and then
+    aggregated with daily_features.
+
+    Args:
+        days (int) - optional: days of synthetic history
+        repeat (int) - optional: timing repetitions, the best is reported
+
+    Returns:
+        dict: rows, and for each representation the bytes per row, best
+        seconds to build the frame and to aggregate it, and whether both
+        aggregate to the same daily features
+    """
+    measurements = synthetic_measurements(days)
+    sources = dict(zip(measurements['station_id'], measurements['source']))
+    date_time = [t.to_pydatetime() for t in measurements['date_time']]
+    rows = list(zip(date_time, measurements['metric_id'],
+                    measurements['station_id'], measurements['value']))
+
+    builders = {
+        'rows': lambda: pd.DataFrame([
+            MeasurementRow(date_time, metric_id, station_id,
+                           sources[station_id], value).dict
+            for date_time, metric_id, station_id, value in rows]),
+        'compact': lambda: measurement_frame(rows, sources)
+    }
+
+    result = {'rows': len(rows)}
+    features = {}
+    for name, build in builders.items():
+        frame = build()
+        features[name] = daily_features(frame).dropna()
+        result[name] = {
+            'bytes_per_row': frame.memory_usage(deep=True).sum()/len(frame),
+            'build': min(timeit.repeat(build, number=1, repeat=repeat)),
+            'aggregate': min(timeit.repeat(lambda: daily_features(frame),
+                                           number=1, repeat=repeat))
+        }
+
+    # float32 values agree with float64 to about 7 significant digits
+    result['identical'] = bool(
+        (features['rows'].index == features['compact'].index).all() and
+        np.allclose(features['rows'].values, features['compact'].values,
+                    rtol=1e-6, atol=1e-4))
+    return result
+
+
+if __name__ == '__main__':
+    pd.options.mode.chained_assignment = None
+
+    result = benchmark_daily_avg()
+    print(f'daily_avg over {result["rows"]} rows: '
+          f'legacy {result["legacy"]:.3f}s, '
+          f'vectorized {result["vectorized"]:.3f}s '
+          f'({result["legacy"]/result["vectorized"]:.1f}x), '
+          f'identical: {result["identical"]}')
+
+    result = benchmark_arx()
+    print(f'{result["runs"]} runs: '
+          f'arima {result["arima"]:.2f}s (MAE {result["arima_mae"]:.1f}), '
+          f'arx {result["arx"]:.3f}s (MAE {result["arx_mae"]:.1f}) '
+          f'({result["arima"]/result["arx"]:.0f}x)')
+
+    result = benchmark_order_select()
+    for method in ('exhaustive', 'hannan_rissanen'):
+        print(f'{method} order selection for {result["runs"]} runs: '
+              f'{result[method]["seconds"]:.2f}s, '
+              f'MAE {result[method]["mae"]:.1f}, '
+              f'orders {result[method]["orders"]}')
+
+    result = benchmark_memory()
+    for representation in ('rows', 'compact'):
+        print(f'{representation} measurement frame of {result["rows"]} rows: '
+              f'{result[representation]["bytes_per_row"]:.1f} bytes/row, '
+              f'built in {result[representation]["build"]:.2f}s, '
+              f'aggregated in {result[representation]["aggregate"]:.3f}s')
+    print(f'compact frame {result["rows"]["bytes_per_row"]/result["compact"]["bytes_per_row"]:.1f}x smaller, '
+          f'identical daily features: {result["identical"]}')
@@ -1,10 +1,23 @@
 """
 Unit tests for arima module
 """
+import datetime
+import os
+import shutil
+import signal
+import tempfile
+import time
 import unittest
 import numpy as np
-from riverrunner.arima import Arima
+import pandas as pd
+from statsmodels.tsa.arima_process import arma_generate_sample
+from statsmodels.tsa.stattools import arma_order_select_ic
+from riverrunner.arima import Arima, daily_features, data_fingerprint, \
+    parallel_order_select, run_with_budget, batched_arx, \
+    hannan_rissanen_order_select
 from riverrunner.context import Context
+from riverrunner.model_store import ModelStore
+from riverrunner.series_cache import SeriesCache
 import riverrunner.settings as settings
 
 
@@ -18,7 +31,7 @@ class TestArima(unittest.TestCase):
     def setUpClass(cls):
         cls.context = Context(settings.DATABASE)
         cls.session = cls.context.Session()
-        cls.arima = Arima(cls.session)
+        cls.arima = Arima(cls.session, store=None, series_cache=None)
 
     def test_daily_avg_returns_correct_columns(self):
         """
@@ -47,6 +60,29 @@ class TestArima(unittest.TestCase):
         # assert
         self.assertFalse(averages.isnull().any().any())
 
+    def test_daily_avg_appends_to_cached_series(self):
+        """
+        Tests that daily averages built from the series cache match those
+        rebuilt from raw measurements
+
+        Returns: result of test
+        """
+        # setup
+        directory = tempfile.mkdtemp()
+        try:
+            arima = Arima(self.session, store=None,
+                          series_cache=SeriesCache(directory))
+            arima.daily_avg(run_id=599)
+            cached = arima.series_cache.get(599)
+            averages = arima.daily_avg(run_id=599)
+
+            # assert
+            self.assertIsNotNone(cached)
+            pd.testing.assert_frame_equal(averages,
+                                          self.arima.daily_avg(run_id=599))
+        finally:
+            shutil.rmtree(directory)
+
     def test_arima_model_returns_correct_days(self):
         """
         Test that arima_model function returns 7 predictions + 20
@@ -83,6 +119,154 @@ class TestArima(unittest.TestCase):
         except Exception:
             self.fail("arima_model() raised Exception unexpectedly")
 
+    def test_select_order_reuses_cached_order(self):
+        """
+        Tests that a second order selection returns the cached order
+        instead of re-running the search
+
+        Returns: Result of test
+        """
+        # setup
+        flow = self.arima.daily_avg(run_id=386)['flow']
+        first = self.arima.select_order(386, flow, force=True)
+        second = self.arima.select_order(386, flow)
+
+        # assert
+        self.assertEqual(first.selected_on, second.selected_on)
+        self.assertEqual((first.p, first.q), (second.p, second.q))
+
+    def test_select_order_resets_baseline_and_method(self):
+        """
+        Tests that a reselection clears the previous order's baseline AIC
+        and that an order from another order method is not reused
+
+        Returns: Result of test
+        """
+        # setup
+        flow = self.arima.daily_avg(run_id=386)['flow']
+        first = self.arima.select_order(386, flow, force=True)
+        first.aic, first.nobs = 100., 10
+        selected_on = self.arima.repo.put_model_order(first).selected_on
+
+        regression = Arima(self.session, store=None, series_cache=None,
+                           order_method='hannan_rissanen')
+        second = regression.select_order(386, flow)
+
+        # assert
+        self.assertGreater(second.selected_on, selected_on)
+        self.assertEqual(second.method, 'hannan_rissanen')
+        self.assertIsNone(second.aic)
+        self.assertIsNone(second.nobs)
+
+    def test_arima_model_warm_starts_second_fit(self):
+        """
+        Tests that refitting a run starts from the stored coefficients of
+        its previous fit
+
+        Returns: Result of test
+        """
+        # setup
+        self.arima.arima_model(run_id=386)
+        self.arima.arima_model(run_id=386)
+
+        # assert
+        self.assertTrue(self.arima.last_fit.warm_start)
+        self.assertIsNotNone(self.arima.last_fit.iterations)
+
+    def test_arima_model_incremental_updates_state(self):
+        """
+        Tests that in incremental mode a run with a recent state-space fit
+        is forecast by filtering, without refitting
+
+        Returns: Result of test
+        """
+        # setup
+        arima = Arima(self.session, incremental=True, store=None)
+        arima.arima_model(run_id=386)
+        refit_on = arima.last_fit.refit_on
+
+        predictions = arima.arima_model(run_id=386)
+
+        # assert
+        self.assertEqual(len(predictions), 27)
+        self.assertEqual(arima.last_fit.model, 'statespace')
+        self.assertEqual(arima.last_fit.iterations, 0)
+        self.assertEqual(arima.last_fit.refit_on, refit_on)
+
+    def test_arima_model_reuses_stored_forecast(self):
+        """
+        Tests that a run whose data has not changed is forecast from the
+        model store without fitting
+
+        Returns: Result of test
+        """
+        # setup
+        directory = tempfile.mkdtemp()
+        try:
+            arima = Arima(self.session, store=ModelStore(directory))
+            first = arima.arima_model(run_id=386)
+            second = arima.arima_model(run_id=386)
+
+            # assert
+            self.assertIsNone(arima.last_fit)
+            self.assertIsNotNone(arima.last_artifact)
+            self.assertTrue(np.allclose(first.values, second.values))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_model_version_keys_modeling_configuration(self):
+        """
+        Tests that artifacts of differently configured order searches are
+        kept apart and that models are only stored when asked to
+
+        Returns: Result of test
+        """
+        # setup
+        exhaustive = Arima(self.session)
+        regression = Arima(self.session, order_method='hannan_rissanen')
+        parallel = Arima(self.session, order_workers=2)
+
+        # assert
+        self.assertIsNone(exhaustive.store)
+        self.assertEqual(len({exhaustive.model_version,
+                              regression.model_version,
+                              parallel.model_version}), 3)
+
+    def test_arima_model_falls_back_when_over_budget(self):
+        """
+        Tests that a run whose fit exceeds the budget is forecast by
+        climatology, or persistence without enough climatology
+
+        Returns: Result of test
+        """
+        # setup
+        arima = Arima(self.session, store=None, fit_budget=.01)
+        predictions = arima.arima_model(run_id=386)
+
+        # assert
+        self.assertEqual(len(predictions), 27)
+        self.assertIn(arima.last_model, ('climatology', 'persistence'))
+
+    def test_arima_model_falls_back_when_fit_is_killed(self):
+        """
+        Tests that a run whose fitting process is killed, as by the out of
+        memory killer, is forecast by climatology or persistence
+
+        Returns: Result of test
+        """
+        # setup
+        class Killed(Arima):
+            def forecast(self, run_id, measures, exog_future_predictors):
+                os.kill(os.getpid(), signal.SIGKILL)
+
+        arima = Killed(self.session, store=None)
+        predictions = arima.arima_model(run_id=386)
+
+        # assert
+        self.assertEqual(len(predictions), 27)
+        self.assertIn(arima.last_model, ('climatology', 'persistence'))
+        self.assertIsNone(arima.last_fit)
+
     def test_get_min_max_returns_correct_min(self):
         """
         Tests if function returns correct min value for known quantity
@@ -106,3 +290,222 @@ class TestArima(unittest.TestCase):
 
         # assert
         self.assertAlmostEquals(np.float(levels['max_level']), 6000)
+
+
+class TestDailyFeatures(unittest.TestCase):
+    """test class for arima.daily_features
+
+    Attributes:
+        measurements (DataFrame): two days of raw measurements
+    """
+    @classmethod
+    def setUpClass(cls):
+        start = datetime.datetime(2018, 5, 1)
+        rows = []
+        for hour in range(48):
+            date_time = start + datetime.timedelta(hours=hour)
+            rows.append((date_time, '00060', 100. + hour))
+            rows.append((date_time, '00001', 10.))
+            # it only rains on the first day
+            if hour < 24:
+                rows.append((date_time, '00003', .5))
+        cls.measurements = pd.DataFrame(
+            rows, columns=['date_time', 'metric_id', 'value'])
+
+    def test_daily_features_columns_in_order(self):
+        """Tests features are returned in aggregation order"""
+        features = daily_features(self.measurements)
+
+        self.assertEqual(list(features.columns), ['temp', 'flow', 'precip'])
+
+    def test_daily_features_aggregates(self):
+        """Tests flow is averaged and precipitation is summed per day"""
+        features = daily_features(self.measurements)
+
+        self.assertEqual(len(features), 1)
+        self.assertAlmostEqual(features['flow'].iloc[0], 111.5)
+        self.assertAlmostEqual(features['precip'].iloc[0], 12.)
+
+    def test_daily_features_custom_aggregations(self):
+        """Tests any metric to aggregation mapping is honored"""
+        features = daily_features(self.measurements, {
+            '00060': ('flow_max', 'max'),
+            '00001': ('temp_count', 'count')
+        })
+
+        self.assertEqual(list(features['flow_max']), [123., 147.])
+        self.assertEqual(list(features['temp_count']), [24., 24.])
+
+    def test_daily_features_missing_metric(self):
+        """Tests an empty frame is returned if a metric was never observed"""
+        features = daily_features(
+            self.measurements[self.measurements.metric_id != '00003'])
+
+        self.assertEqual(len(features), 0)
+
+    def test_daily_features_unsupported_aggregation(self):
+        """Tests unsupported aggregations raise"""
+        with self.assertRaises(ValueError):
+            daily_features(self.measurements, {'00060': ('flow', 'median')})
+
+
+class TestDataFingerprint(unittest.TestCase):
+    """test class for arima.data_fingerprint"""
+
+    def test_data_fingerprint_equal_for_equal_data(self):
+        """Tests equal series hash equally"""
+        index = pd.date_range('2018-05-01', periods=5, freq='D')
+        a = pd.Series(np.arange(5.), index=index)
+
+        self.assertEqual(data_fingerprint(a), data_fingerprint(a.copy()))
+
+    def test_data_fingerprint_changes_with_values(self):
+        """Tests changing a value changes the fingerprint"""
+        index = pd.date_range('2018-05-01', periods=5, freq='D')
+        a = pd.Series(np.arange(5.), index=index)
+        b = a.copy()
+        b.iloc[-1] = 10.
+
+        self.assertNotEqual(data_fingerprint(a), data_fingerprint(b))
+
+
+class TestRunWithBudget(unittest.TestCase):
+    """test class for arima.run_with_budget"""
+
+    def test_run_with_budget_returns_result(self):
+        """Tests the child's return value is passed back"""
+        result = run_with_budget(10, lambda x: pd.Series([x]*3), 2.)
+
+        self.assertEqual(list(result), [2., 2., 2.])
+
+    def test_run_with_budget_raises_when_child_is_killed(self):
+        """Tests a child killed before returning raises RuntimeError"""
+        with self.assertRaises(RuntimeError):
+            run_with_budget(10, lambda: os.kill(os.getpid(), signal.SIGKILL))
+
+    def test_run_with_budget_raises_exception(self):
+        """Tests an exception raised in the child is re-raised"""
+        def fail():
+            raise ValueError('no convergence')
+
+        self.assertRaises(ValueError, run_with_budget, 10, fail)
+
+    def test_run_with_budget_kills_slow_call(self):
+        """Tests a call over budget is killed promptly"""
+        start = time.time()
+        self.assertRaises(TimeoutError, run_with_budget, .5,
+                          time.sleep, 30)
+        self.assertLess(time.time() - start, 5)
+
+
+class TestBatchedArx(unittest.TestCase):
+    """test class for arima.batched_arx"""
+
+    @staticmethod
+    def simulate(days, seed, end='2018-06-01'):
+        """daily features following a known AR(2)-X process"""
+        rng = np.random.RandomState(seed)
+        temp = rng.normal(10, 3, days)
+        precip = rng.exponential(.2, days)
+        flow = np.zeros(days)
+        flow[:2] = 500.
+        for t in range(2, days):
+            flow[t] = 100. + .6*flow[t - 1] + .2*flow[t - 2] + \
+                2.*temp[t] + 50.*precip[t] + rng.normal(0, 1)
+        index = pd.date_range(end=end, periods=days, freq='D', tz='UTC')
+        return pd.DataFrame({'temp': temp, 'flow': flow, 'precip': precip},
+                            index=index, columns=['temp', 'flow', 'precip'])
+
+    def test_batched_arx_forecasts_known_process(self):
+        """Tests forecasts follow the simulated process' expected path"""
+        frames = [self.simulate(400, 0),
+                  self.simulate(300, 1, end='2018-05-20')]
+        forecasts = batched_arx(frames)
+
+        for frame, forecast in zip(frames, forecasts):
+            future = frame[['temp', 'precip']].iloc[-7:].mean().values
+            history = list(frame['flow'].values[-2:])
+            for value in forecast.values:
+                expected = 100. + .6*history[-1] + .2*history[-2] + \
+                    2.*future[0] + 50.*future[1]
+                self.assertAlmostEqual(value, expected, delta=5.)
+                history.append(value)
+
+    def test_batched_arx_skips_short_runs(self):
+        """Tests runs with too few observations are not forecast"""
+        forecasts = batched_arx([self.simulate(400, 0),
+                                 self.simulate(5, 1)])
+
+        self.assertEqual(len(forecasts[0]), 7)
+        self.assertIsNone(forecasts[1])
+
+
+class TestParallelOrderSelect(unittest.TestCase):
+    """test class for arima.parallel_order_select
+
+    Attributes:
+        y (ndarray): simulated ARMA(2, 1) series
+    """
+    @classmethod
+    def setUpClass(cls):
+        np.random.seed(2014)
+        cls.y = arma_generate_sample([1, -.75, .25], [1, .65], 250)
+
+    def test_parallel_order_select_matches_serial(self):
+        """Tests the parallel search selects the serial search's order"""
+        serial = arma_order_select_ic(self.y, ic='aic')
+        parallel = parallel_order_select(self.y, ic='aic', workers=2)
+
+        self.assertEqual(tuple(serial.aic_min_order),
+                         parallel.aic_min_order)
+
+    def test_parallel_order_select_matches_serial_with_moving_average(self):
+        """Tests the heuristic bound keeps the serial order on series a long
+        autoregression approximates poorly"""
+        for ma, seed in [([1, .9], 0), ([1, .8, .6], 1), ([1, -.9], 2)]:
+            np.random.seed(seed)
+            y = arma_generate_sample([1, -.5], ma, 120)
+
+            for ic in ['aic', 'bic']:
+                serial = arma_order_select_ic(y, ic=ic)
+                parallel = parallel_order_select(y, ic=ic, workers=2)
+
+                self.assertEqual(tuple(serial[f'{ic}_min_order']),
+                                 parallel[f'{ic}_min_order'])
+
+    def test_parallel_order_select_structure(self):
+        """Tests the result has arma_order_select_ic's shape"""
+        parallel = parallel_order_select(self.y, max_ar=2, max_ma=1,
+                                         ic='bic', workers=2)
+
+        self.assertEqual(parallel.bic.shape, (3, 2))
+        self.assertIn('bic_min_order', parallel)
+
+
+class TestHannanRissanenOrderSelect(unittest.TestCase):
+    """test class for arima.hannan_rissanen_order_select
+
+    Attributes:
+        y (ndarray): simulated ARMA(2, 1) series
+    """
+    @classmethod
+    def setUpClass(cls):
+        np.random.seed(2014)
+        cls.y = arma_generate_sample([1, -.75, .25], [1, .65], 500)
+
+    def test_hannan_rissanen_ranks_generating_order(self):
+        """Tests the generating order is among the fitted candidates"""
+        selected = hannan_rissanen_order_select(self.y, ic='bic', top=2)
+
+        fitted = selected.bic.notnull()
+        self.assertEqual(int(fitted.values.sum()), 2)
+        self.assertTrue(fitted.loc[2, 1] or fitted.loc[1, 1])
+
+    def test_hannan_rissanen_structure(self):
+        """Tests the result has arma_order_select_ic's shape"""
+        selected = hannan_rissanen_order_select(self.y, max_ar=2, max_ma=1,
+                                                ic='aic')
+
+        self.assertEqual(selected.aic.shape, (3, 2))
+        self.assertEqual(selected.aic_regression.shape, (3, 2))
+        self.assertIn('aic_min_order', selected)
@@ -0,0 +1,116 @@
+import json
+import os
+from riverrunner.backtest import MemoryRepository, ModelConfig, backtest, config_model, forecast_config, \
+    rolling_origins, summarize, synthetic_frames, write_report
+import shutil
+import tempfile
+from unittest import TestCase
+
+
+class TestBacktest(TestCase):
+    """test class for backtest.py"""
+
+    configs = [ModelConfig('arx', 'arx', None, False, None),
+               ModelConfig('persistence', 'persistence', None, False, None)]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.frames = synthetic_frames(2, days=365)
+
+    def test_rolling_origins(self):
+        """test origins are a horizon apart and the last leaves one horizon to score"""
+        self.assertEqual(rolling_origins(100, origins=3, horizon=7), [79, 86, 93])
+
+    def test_rolling_origins_drops_short_training(self):
+        """test origins without enough training history are dropped"""
+        self.assertEqual(rolling_origins(70, origins=3, horizon=7), [63])
+
+    def test_backtest_results(self):
+        """test every run is forecast with every configuration from every origin"""
+        report = backtest(self.frames, self.configs, origins=3, workers=1)
+
+        self.assertEqual(len(report['results']), 2*2*3)
+        self.assertTrue(all(r['error'] is None for r in report['results']))
+        self.assertTrue(all(r['wall'] >= 0 and r['peak_mb'] >= 0 for r in report['results']))
+        self.assertEqual(list(report['summary']), ['arx', 'persistence'])
+        self.assertEqual(report['summary']['arx']['forecasts'], 6)
+        self.assertEqual(report['summary']['persistence']['skill'], 0.)
+
+    def test_backtest_windows(self):
+        """test every window is evaluated and trains on at most its days"""
+        report = backtest(self.frames, self.configs[:1], origins=1, workers=1, windows=[90, None])
+
+        days = {(r['run_id'], r['window']): r['days'] for r in report['results']}
+        self.assertEqual(len(days), 4)
+        self.assertEqual(days[(0, 90)], 90)
+        self.assertGreater(days[(0, None)], 90)
+
+    def test_backtest_records_failures(self):
+        """test a configuration that cannot be fit is reported as failed"""
+        report = backtest(self.frames, [ModelConfig('unknown', 'unknown', None, False, None)], origins=1, workers=1)
+
+        self.assertEqual(report['summary']['unknown']['failures'], 2)
+        self.assertIsNone(report['summary']['unknown']['mae'])
+
+    def test_forecast_config_through_model(self):
+        """test the arima engine forecasts with Arima, reusing the run's cached order and warm starting from its fit"""
+        config = ModelConfig('arima', 'arima', 'hannan_rissanen', False, None)
+        arima = config_model(config)
+        measures = self.frames[0]
+
+        forecast = forecast_config(config, measures.iloc[:300], 7, arima, run_id=0)
+        order = arima.repo.get_model_order(0)
+        forecast_config(config, measures.iloc[:307], 7, arima, run_id=0)
+
+        self.assertEqual(len(forecast), 7)
+        self.assertEqual(arima.last_model, 'arima')
+        self.assertIs(arima.repo.get_model_order(0), order)
+        self.assertEqual(order.method, 'hannan_rissanen')
+        self.assertTrue(arima.last_fit.warm_start)
+
+    def test_config_model(self):
+        """test the Arima instance is configured as the configuration and has no database"""
+        arima = config_model(ModelConfig('statespace', 'statespace', 'hannan_rissanen', False, 30.), '/tmp/models')
+
+        self.assertIsNone(arima.session)
+        self.assertIsInstance(arima.repo, MemoryRepository)
+        self.assertTrue(arima.incremental)
+        self.assertEqual(arima.order_method, 'hannan_rissanen')
+        self.assertIsNone(arima.store)
+        self.assertEqual(arima.fit_budget, 30.)
+
+    def test_memory_repository_climatology(self):
+        """test the climatology of a day of the year covers the days within the window of it in every year"""
+        repo = MemoryRepository()
+        flow = self.frames[0]['flow']
+        repo.put_climatology(0, flow, window=7)
+
+        climatology = repo.get_climatology(0, [flow.index[0].dayofyear])
+        self.assertEqual(len(climatology), 1)
+        self.assertEqual(climatology['samples'].iloc[0], 15)
+        self.assertLessEqual(climatology['min'].iloc[0], climatology['q50'].iloc[0])
+        self.assertEqual(len(repo.get_climatology(1)), 0)
+
+    def test_summarize_skill(self):
+        """test skill is relative to persistence on the same run origins"""
+        results = [
+            dict(run_id=1, config='persistence', origin='2018-01-01', mae=4., rmse=4., wall=0., cpu=0., peak_mb=0.,
+                 error=None),
+            dict(run_id=1, config='arx', origin='2018-01-01', mae=1., rmse=1., wall=0., cpu=0., peak_mb=0.,
+                 error=None)
+        ]
+
+        self.assertEqual(summarize(results)['arx']['skill'], .75)
+
+    def test_write_report(self):
+        """test the report is written as JSON"""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'reports', 'backtest.json')
+            write_report({'summary': {}}, path)
+
+            with open(path) as f:
+                self.assertEqual(json.load(f), {'summary': {}})
+            self.assertEqual(os.listdir(os.path.dirname(path)), ['backtest.json'])
+        finally:
+            shutil.rmtree(directory)
@@ -158,3 +158,30 @@ class TestContext(TestCase):
         # assert
         measurements = self.session.query(context.Measurement).all()
         self.assertEqual(len(measurements), 0)
+
+    def test_unit_of_work_commits(self):
+        """test work done in a unit of work persists once the block exits"""
+        # setup
+        predictions = self.context.get_predictions_for_test(1, self.session)
+        with context.unit_of_work(self.session.bind) as session:
+            session.add(predictions[0])
+
+        # assert
+        predictions = self.session.query(context.Prediction).all()
+        self.assertEqual(len(predictions), 1)
+
+    def test_unit_of_work_rolls_back(self):
+        """test work done in a unit of work that raises is discarded"""
+        # setup
+        predictions = self.context.get_predictions_for_test(1, self.session)
+        try:
+            with context.unit_of_work(self.session.bind) as session:
+                session.add(predictions[0])
+                session.flush()
+                raise ValueError('abandon this unit of work')
+        except ValueError:
+            pass
+
+        # assert
+        predictions = self.session.query(context.Prediction).all()
+        self.assertEqual(len(predictions), 0)
@@ -1,6 +1,9 @@
 import os
 import psycopg2
+import shutil
+from riverrunner import context
 from riverrunner.daily import *
+from riverrunner.daily import _publish_groups
 from riverrunner.repository import Repository
 from riverrunner.tests.tcontext import TContext
 from unittest import TestCase
@@ -123,3 +126,182 @@ class TestDaily(TestCase):
 
         m = compute_predictions(self.session)
         self.assertTrue(m)
+
+    def test_compute_predictions_skips_unchanged_run(self):
+        run = self.context.get_runs_for_test(1, self.session)[0]
+        station = self.context.get_stations_for_test(1, self.session)[0]
+        metrics = self.context.get_metrics_for_test(3)
+        metrics[0].metric_id = '00003'
+        metrics[1].metric_id = '00001'
+        metrics[2].metric_id = '00060'
+
+        self.session.add_all([run, station])
+        self.session.add_all(metrics)
+        self.session.commit()
+
+        compute_predictions(self.session)
+        self.session.expire_all()
+
+        row = self.repo.get_all_runs_as_list(lightweight=True)[0]
+        fingerprint = prediction_fingerprint(self.repo.get_input_fingerprint(run.run_id, list(DAILY_AGGREGATIONS)), row)
+        self.assertEqual(run.input_fingerprint, fingerprint)
+
+        compute_predictions(self.session)
+        now = dt.datetime.today()
+        path = f'data/logs/{now.year}{now.month}{now.day}_log.txt'
+
+        with open(path) as f:
+            line = f.readlines()[-1]
+
+        self.assertTrue('0 failed, 1 skipped' in line)
+
+    def test_prediction_fingerprint_changes_with_configuration(self):
+        run = self.context.get_runs_for_test(1, self.session)[0]
+        self.session.add(run)
+        self.session.commit()
+        row = self.repo.get_all_runs_as_list(lightweight=True)[0]
+
+        fingerprint = prediction_fingerprint('a'*40, row)
+        self.assertEqual(len(fingerprint), 40)
+        self.assertEqual(fingerprint, prediction_fingerprint('a'*40, row._replace(training_days=TRAINING_DAYS)))
+        self.assertNotEqual(fingerprint, prediction_fingerprint('b'*40, row))
+        self.assertNotEqual(fingerprint, prediction_fingerprint('a'*40, row._replace(training_days=365)))
+        self.assertNotEqual(fingerprint, prediction_fingerprint('a'*40, row, engine='arx'))
+        self.assertNotEqual(fingerprint, prediction_fingerprint('a'*40, row, incremental=True))
+
+    def test_publish_groups_rolls_back_whole_batch(self):
+        run = self.context.get_runs_for_test(1, self.session)[0]
+        self.session.add(run)
+        self.session.commit()
+        rows = self.repo.get_all_runs_as_list(lightweight=True)
+
+        forecast = pd.Series([10.]*7, index=pd.date_range(dt.date.today(), periods=7), name='flow')
+        # the fingerprint overflows its column, failing the batch after the predictions were written
+        published = _publish_groups(self.session, {run.run_id: rows}, {run.run_id: 'x'*41},
+                                    [(run.run_id, forecast, '', 'arima')])
+
+        self.session.expire_all()
+        self.assertEqual(published, [])
+        self.assertEqual(self.session.query(context.Prediction).count(), 0)
+        self.assertIsNone(self.session.query(context.RiverRun).one().runability_on)
+
+    def test_group_runs_shares_stations(self):
+        runs = self.context.get_runs_for_test(3, self.session)
+        station = self.context.get_stations_for_test(1, self.session)[0]
+        self.session.add_all(runs + [station])
+        self.session.add_all([
+            context.StationRiverDistance(station_id=station.station_id, run_id=run.run_id, distance=1.)
+            for run in runs[:2]
+        ])
+        self.session.commit()
+
+        groups = group_runs(self.repo, self.repo.get_all_runs_as_list(lightweight=True))
+        sizes = sorted(len(group) for group in groups)
+
+        self.assertEqual(sizes, [1, 2])
+
+    def test_group_runs_separates_training_configs(self):
+        runs = self.context.get_runs_for_test(3, self.session)
+        station = self.context.get_stations_for_test(1, self.session)[0]
+        runs[1].training_days = TRAINING_DAYS
+        runs[2].training_days = 365
+        self.session.add_all(runs + [station])
+        self.session.add_all([
+            context.StationRiverDistance(station_id=station.station_id, run_id=run.run_id, distance=1.)
+            for run in runs
+        ])
+        self.session.commit()
+
+        groups = group_runs(self.repo, self.repo.get_all_runs_as_list(lightweight=True))
+        sizes = sorted(len(group) for group in groups)
+
+        self.assertEqual(sizes, [1, 2])
+
+    def test_compact_measurements_nothing_to_compact(self):
+        summary = compact_measurements(self.session, archive_dir='archive_for_test')
+        self.assertEqual(summary['rows'], 0)
+
+    def test_compact_measurements_removes_old_rows(self):
+        measurements = self.context.get_measurements_for_test(10, self.session)
+        for m in measurements[:5]:
+            m.date_time = m.date_time - dt.timedelta(days=RETENTION_DAYS+40)
+        self.session.add_all(measurements)
+        self.session.commit()
+
+        summary = compact_measurements(self.session, archive_dir='archive_for_test', chunk_size=2)
+        shutil.rmtree('archive_for_test')
+
+        self.assertEqual(summary['rows'], 5)
+        self.assertTrue(summary['tuple_bytes'] > 0)
+        self.assertEqual(self.session.query(context.Measurement).count(), 5)
+        self.assertTrue(self.session.query(context.DailyMeasurement).count() > 0)
+
+    def test_compact_measurements_rerun_after_interrupted_delete(self):
+        measurements = self.context.get_measurements_for_test(10, self.session)
+        for i, m in enumerate(measurements):
+            m.date_time = dt.datetime(2000, 1, 10, 12) + dt.timedelta(minutes=i)
+        self.session.add_all(measurements)
+        self.session.commit()
+
+        # the first run rolls up and archives the month, then dies after deleting part of it
+        start, end = dt.datetime(2000, 1, 1), dt.datetime(2000, 2, 1)
+        path = os.path.join('archive_for_test', f'measurement_{start:%Y%m%d}_{end:%Y%m%d}.npz')
+        os.makedirs('archive_for_test')
+        try:
+            self.repo.put_daily_measurements(start, end, overwrite=False)
+            archive_measurements(self.repo.get_raw_measurements(start, end), path)
+            self.repo.delete_measurements(start, dt.datetime(2000, 1, 10, 12, 5))
+            rollups = {(d.station_id, d.metric_id): (d.count, d.mean)
+                       for d in self.session.query(context.DailyMeasurement).all()}
+
+            summary = compact_measurements(self.session, archive_dir='archive_for_test')
+            with np.load(path) as archive:
+                archived = len(archive['value'])
+        finally:
+            shutil.rmtree('archive_for_test')
+
+        self.session.expire_all()
+        self.assertEqual(summary['rows'], 5)
+        self.assertEqual(summary['rollups'], 0)
+        self.assertEqual(archived, 10)
+        self.assertEqual(self.session.query(context.Measurement).count(), 0)
+        self.assertEqual({(d.station_id, d.metric_id): (d.count, d.mean)
+                          for d in self.session.query(context.DailyMeasurement).all()}, rollups)
+
+    def test_compact_measurements_keeps_training_window(self):
+        measurements = self.context.get_measurements_for_test(10, self.session)
+        for m in measurements[:5]:
+            m.date_time = m.date_time - dt.timedelta(days=TRAINING_DAYS+40)
+        self.session.add_all(measurements)
+        self.session.commit()
+
+        summary = compact_measurements(self.session, retention_days=TRAINING_DAYS, archive_dir='archive_for_test')
+
+        self.assertEqual(summary['rows'], 0)
+        self.assertEqual(self.session.query(context.Measurement).count(), 10)
+
+    def test_update_climatology_rolls_up_recent_days(self):
+        measurements = self.context.get_measurements_for_test(10, self.session)
+        self.session.add_all(measurements)
+        self.session.commit()
+
+        summary = update_climatology(self.session, end_date=dt.datetime.now() + dt.timedelta(days=1))
+
+        self.assertTrue(summary['rollups'] > 0)
+        self.assertEqual(self.session.query(context.Measurement).count(), 10)
+        self.assertTrue(self.session.query(context.DailyMeasurement).count() > 0)
+
+    def test_compute_predictions_parallel_for_one_run(self):
+        run = self.context.get_runs_for_test(1, self.session)[0]
+        station = self.context.get_stations_for_test(1, self.session)[0]
+        metrics = self.context.get_metrics_for_test(3)
+        metrics[0].metric_id = '00003'
+        metrics[1].metric_id = '00001'
+        metrics[2].metric_id = '00060'
+
+        self.session.add_all([run, station])
+        self.session.add_all(metrics)
+        self.session.commit()
+
+        m = compute_predictions(self.session, workers=2)
+        self.assertTrue(m)
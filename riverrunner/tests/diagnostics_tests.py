@@ -0,0 +1,61 @@
+import numpy as np
+from riverrunner.arima import daily_features
+from riverrunner.diagnostics import batched_acf, batched_adf, batched_pacf, diagnose, rolling_statistics, \
+    stack_series
+from riverrunner.static.benchmarks import synthetic_measurements
+from statsmodels.tsa.stattools import acf, adfuller, pacf
+from unittest import TestCase
+
+
+class TestDiagnostics(TestCase):
+    """test class for diagnostics.py"""
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.series = [np.cumsum(rng.normal(size=300)) + 50., rng.normal(size=120) + 3.]
+        self.values, self.lengths = stack_series(self.series)
+
+    def test_acf_and_pacf(self):
+        """test the batched autocorrelations match statsmodels on each run alone"""
+        batched = batched_acf(self.values, self.lengths, nlags=150)
+        partial = batched_pacf(batched, nlags=20)
+
+        for i, y in enumerate(self.series):
+            np.testing.assert_allclose(batched[i, :len(y)], acf(y, nlags=len(y) - 1, fft=False)[:151], atol=1e-10)
+            np.testing.assert_allclose(partial[i], pacf(y, nlags=20, method='ywm'), atol=1e-10)
+        self.assertTrue(np.isnan(batched[1, 120:]).all())
+
+    def test_adf(self):
+        """test the batched Dickey-Fuller statistics match statsmodels on each run alone"""
+        stat, pvalue, lags = batched_adf(self.values, self.lengths, lags=4)
+
+        self.assertEqual(lags, 4)
+        for i, y in enumerate(self.series):
+            expected = adfuller(y, maxlag=4, autolag=None, regression='c')
+            self.assertAlmostEqual(stat[i], expected[0])
+            self.assertAlmostEqual(pvalue[i], expected[1])
+        self.assertGreater(pvalue[0], .05)
+        self.assertLess(pvalue[1], .05)
+
+    def test_rolling_statistics(self):
+        """test windows end every step days back from each run's last observation"""
+        means, stds = rolling_statistics(self.values, self.lengths, window=100, step=50)
+
+        self.assertEqual(len(means[0]), 5)
+        self.assertEqual(len(means[1]), 1)
+        self.assertAlmostEqual(means[0][-1], self.series[0][-100:].mean())
+        self.assertAlmostEqual(means[0][0], self.series[0][:100].mean())
+        self.assertAlmostEqual(stds[1][0], self.series[1][-100:].std(ddof=1))
+
+    def test_diagnose(self):
+        """test one row of diagnostics per run with features"""
+        frames = {4: daily_features(synthetic_measurements(400, seed=0)).dropna(), 5: None}
+        diagnostics = diagnose(frames, acf_lags=30, pacf_lags=10, window=90, step=30)
+
+        self.assertEqual([d.run_id for d in diagnostics], [4])
+        self.assertEqual(diagnostics[0].nobs, len(frames[4]))
+        self.assertEqual(len(diagnostics[0].acf), 31)
+        self.assertEqual(len(diagnostics[0].pacf), 11)
+        self.assertEqual(diagnostics[0].acf[0], 1.)
+        self.assertIsInstance(diagnostics[0].stationary, bool)
+        self.assertEqual(diagnostics[0].end, frames[4].index[-1].date())
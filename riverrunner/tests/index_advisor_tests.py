@@ -0,0 +1,88 @@
+from riverrunner.index_advisor import IndexCandidate, IndexCheck, Query, apply_indexes, captured_station_ids, \
+    improves, propose_indexes
+from riverrunner.tests.tcontext import TContext
+from unittest import TestCase
+
+
+class TestIndexAdvisor(TestCase):
+    """test class for index_advisor.py"""
+
+    statement = 'SELECT measurement.date_time AS measurement_date_time, ' \
+                'measurement.metric_id AS measurement_metric_id, ' \
+                'measurement.station_id AS measurement_station_id, ' \
+                'measurement.value AS measurement_value ' \
+                'FROM measurement ' \
+                'WHERE measurement.date_time >= %(date_time_1)s AND measurement.date_time < %(date_time_2)s ' \
+                'AND measurement.station_id IN (%(station_id_1)s, %(station_id_2)s) ' \
+                'AND measurement.metric_id IN (%(metric_id_1)s)'
+
+    def test_propose_indexes_orders_equality_before_range(self):
+        """test the composite candidate leads with station and metric then date"""
+        candidates = propose_indexes([Query(self.statement, {})])
+        btree = [c for c in candidates if c.kind == 'btree'][0]
+
+        self.assertEqual(btree.columns, ('station_id', 'metric_id', 'date_time'))
+
+    def test_propose_indexes_covering_includes_value(self):
+        """test the covering candidate includes the selected value column"""
+        candidates = propose_indexes([Query(self.statement, {})])
+        covering = [c for c in candidates if c.kind == 'covering'][0]
+
+        self.assertEqual(covering.include, ('value',))
+
+    def test_propose_indexes_brin_on_date_time(self):
+        """test a BRIN candidate is proposed for the range column"""
+        candidates = propose_indexes([Query(self.statement, {})])
+        brin = [c for c in candidates if c.kind == 'brin']
+
+        self.assertEqual([c.columns for c in brin], [('date_time',)])
+
+    def test_propose_indexes_bare_columns(self):
+        """test raw SQL with unqualified columns contributes its predicates and selected columns"""
+        raw = 'SELECT date_time, station_id, metric_id, value FROM measurement ' \
+              'WHERE date_time >= %s AND date_time < %s;'
+        candidates = propose_indexes([Query(raw, ())])
+
+        self.assertEqual([c.columns for c in candidates if c.kind == 'btree'], [('date_time',)])
+        covering = [c for c in candidates if c.kind == 'covering'][0]
+        self.assertEqual(covering.include, ('station_id', 'metric_id', 'value'))
+
+    def test_improves_requires_every_statement(self):
+        """test a candidate is only accepted if it speeds up every statement and the total enough"""
+        candidate = propose_indexes([Query(self.statement, {})])[0]
+
+        self.assertTrue(improves(IndexCheck(candidate, [10., 10.], [5., 9.])))
+        self.assertFalse(improves(IndexCheck(candidate, [10., 10.], [1., 11.])))
+        self.assertFalse(improves(IndexCheck(candidate, [10., 10.], [9., 9.5])))
+
+    def test_propose_indexes_no_queries(self):
+        """test nothing is proposed without captured statements"""
+        self.assertEqual(propose_indexes([]), [])
+
+    def test_captured_station_ids(self):
+        """test every bound station id is collected once in binding order"""
+        queries = [
+            Query(self.statement, {'date_time_1': 0, 'station_id_1': 'USGS1', 'station_id_2': 'NOAA1'}),
+            Query(self.statement, {'station_id_1': 'NOAA1', 'metric_id_1': '00060'})
+        ]
+
+        self.assertEqual(captured_station_ids(queries), ['USGS1', 'NOAA1'])
+
+    def test_apply_indexes_switches_driver_to_autocommit(self):
+        """test indexes are built concurrently through a pooled connection and its driver's mode is restored"""
+        session = TContext().Session()
+        connection = session.bind.raw_connection()
+        candidate = IndexCandidate(
+            name='idx_measurement_advisor_test', kind='btree', columns=('date_time',), include=(),
+            ddl='CREATE INDEX {concurrently} IF NOT EXISTS {name} ON {table} (date_time)'
+        )
+
+        try:
+            self.assertEqual(apply_indexes(connection, [candidate]), [candidate.name])
+            self.assertFalse(connection.connection.autocommit)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP INDEX IF EXISTS {candidate.name};')
+            connection.commit()
+            connection.close()
+            session.close()
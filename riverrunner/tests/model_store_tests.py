@@ -0,0 +1,60 @@
+import numpy as np
+import os
+from riverrunner.model_store import ModelStore
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+
+class TestModelStore(TestCase):
+    """test class for model_store.py"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ModelStore(os.path.join(self.directory, 'models'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_get_round_trip(self):
+        """test stored arrays are returned unchanged and None values are skipped"""
+        self.store.put(1, 'arima1', 'abc', {'p': 2, 'params': [.1, .2, .3], 'state': None})
+        artifact = self.store.get(1, 'arima1', 'abc')
+
+        self.assertEqual(int(artifact['p']), 2)
+        self.assertTrue(np.allclose(artifact['params'], [.1, .2, .3]))
+        self.assertNotIn('state', artifact)
+
+    def test_get_is_keyed_by_version_and_fingerprint(self):
+        """test a different version or fingerprint misses"""
+        self.store.put(1, 'arima1', 'abc', {'p': 2})
+
+        self.assertIsNone(self.store.get(1, 'arima2', 'abc'))
+        self.assertIsNone(self.store.get(1, 'arima1', 'abd'))
+        self.assertIsNone(self.store.get(2, 'arima1', 'abc'))
+
+    def test_put_leaves_no_temporary_files(self):
+        """test only the artifact remains after a write"""
+        self.store.put(1, 'arima1', 'abc', {'p': 2})
+
+        self.assertEqual(os.listdir(self.store.directory), ['1_arima1_abc.npz'])
+
+    def test_evict_removes_least_recently_used(self):
+        """test eviction keeps the most recently read artifacts within the size limit"""
+        for run_id in range(3):
+            self.store.put(run_id, 'arima1', 'abc', {'params': np.zeros(100)})
+            past = time.time() - 100 + run_id
+            os.utime(self.store.path(run_id, 'arima1', 'abc'), (past, past))
+
+        # reading the oldest artifact makes it the most recently used
+        self.store.get(0, 'arima1', 'abc')
+
+        size = os.path.getsize(self.store.path(0, 'arima1', 'abc'))
+        self.store.max_bytes = 2*size
+        removed = self.store.evict()
+
+        self.assertEqual(removed, 1)
+        self.assertIsNone(self.store.get(1, 'arima1', 'abc'))
+        self.assertIsNotNone(self.store.get(0, 'arima1', 'abc'))
+        self.assertIsNotNone(self.store.get(2, 'arima1', 'abc'))
@@ -0,0 +1,55 @@
+from riverrunner.profiling import StageProfiler, StageRecord, profile_stage
+from unittest import TestCase
+
+
+class TestProfiling(TestCase):
+    """test class for profiling.py"""
+
+    def test_profile_stage_records_stage(self):
+        """test a stage is recorded with its row count"""
+        profiler = StageProfiler()
+        with profile_stage(profiler, 1, 'get_data') as stage:
+            sum(range(100000))
+            stage['rows'] = 10
+
+        self.assertEqual(len(profiler.records), 1)
+        record = profiler.records[0]
+        self.assertEqual((record.run_id, record.stage, record.rows), (1, 'get_data', 10))
+        self.assertGreater(record.wall, 0)
+        self.assertGreaterEqual(record.cpu, 0)
+        self.assertGreater(record.peak_memory, 0)
+
+    def test_profile_stage_records_failed_stage(self):
+        """test a stage that raises is still recorded"""
+        profiler = StageProfiler()
+        with self.assertRaises(ValueError):
+            with profile_stage(profiler, 1, 'fit'):
+                raise ValueError('fit failed')
+
+        self.assertEqual([r.stage for r in profiler.records], ['fit'])
+
+    def test_profile_stage_without_profiler(self):
+        """test a stage can run without a profiler"""
+        with profile_stage(None, 1, 'fit') as stage:
+            stage['rows'] = 10
+
+    def test_summary(self):
+        """test records are summarized per stage in order of first appearance"""
+        profiler = StageProfiler()
+        for run_id in (1, 2):
+            profiler.record(StageRecord(run_id, 'get_data', 2., 1., 2**20, 100))
+            profiler.record(StageRecord(run_id, 'fit', 4., 3., 2**21, 10))
+
+        summary = profiler.summary()
+
+        self.assertEqual(list(summary.index), ['get_data', 'fit'])
+        self.assertEqual(list(summary['runs']), [2, 2])
+        self.assertEqual(list(summary['wall']), [4., 8.])
+        self.assertEqual(list(summary['mean_wall']), [2., 4.])
+        self.assertEqual(list(summary['cpu']), [2., 6.])
+        self.assertEqual(list(summary['peak_mb']), [1., 2.])
+        self.assertEqual(list(summary['rows']), [200, 20])
+
+    def test_summary_without_records(self):
+        """test an empty profiler summarizes to an empty table"""
+        self.assertEqual(len(StageProfiler().summary()), 0)
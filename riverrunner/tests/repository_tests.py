@@ -2,8 +2,10 @@ import datetime
 import numpy as np
 import psycopg2
 from riverrunner import context, settings
-from riverrunner.context import Address, Measurement, Metric, RiverRun, Station, StationRiverDistance
+from riverrunner.context import Address, DailyMeasurement, Measurement, Metric, RiverRun, Station, \
+    StationRiverDistance
 from riverrunner.repository import Repository
+from riverrunner.rows import MeasurementRow, RiverRunRow
 from riverrunner.tests.tcontext import TContext
 from unittest import TestCase
 from unittest import skip
@@ -677,3 +679,191 @@ class TestRepository(TestCase):
         # assert
         measurements = self.session.query(Measurement).all()
         self.assertEqual(24, len(measurements))
+
+    def test_put_runability_matches_hybrid(self):
+        """test the persisted runability equals the python todays_runability"""
+        # setup
+        predictions = self.context.get_predictions_for_test(5, self.session)
+        self.session.add_all(predictions)
+        self.session.commit()
+
+        self.repo.put_runability()
+
+        # assert
+        for run in self.session.query(RiverRun).all():
+            self.session.refresh(run)
+            self.assertAlmostEqual(run.runability, run.todays_runability, places=6)
+
+    def test_get_predicted_runs_excludes_runs_without_predictions(self):
+        """test runs without a prediction for today are filtered out"""
+        # setup
+        predictions = self.context.get_predictions_for_test(1, self.session)
+        self.session.add_all(predictions)
+        self.session.commit()
+
+        self.repo.put_runability()
+
+        # assert
+        runs = self.repo.get_predicted_runs()
+        self.assertEqual([r.run_id for r in runs], [predictions[0].run_id])
+
+    def test_put_runability_refreshes_stale_snapshots(self):
+        """test only snapshots taken before today are refreshed from the live runability"""
+        # setup
+        predictions = self.context.get_predictions_for_test(1, self.session)
+        self.session.add_all(predictions)
+        self.session.commit()
+
+        self.session.query(RiverRun).update({
+            RiverRun.runability: -2.,
+            RiverRun.runability_on: datetime.datetime.now() - datetime.timedelta(days=1)
+        }, synchronize_session=False)
+        self.session.commit()
+
+        self.assertEqual(self.repo.get_predicted_runs(), [])
+        self.repo.put_runability(stale=True)
+
+        # assert
+        runs = self.repo.get_predicted_runs()
+        self.assertEqual([r.run_id for r in runs], [predictions[0].run_id])
+        self.assertAlmostEqual(runs[0].runability, runs[0].todays_runability, places=6)
+        self.assertEqual(runs[0].runability_on.date(), datetime.date.today())
+
+    def test_close_returns_connections_to_pool(self):
+        """test closing the repository and its session leaves no connection checked out"""
+        # setup
+        pool = self.session.bind.pool
+        self.session.close()
+        checked_out = pool.checkedout()
+
+        repo = Repository(self.session)
+        repo.get_raw_measurements(datetime.datetime(2000, 1, 1), datetime.datetime(2000, 1, 2))
+        self.session.query(RiverRun).all()
+        self.assertGreater(pool.checkedout(), checked_out)
+
+        repo.close()
+        self.session.close()
+
+        # assert
+        self.assertEqual(pool.checkedout(), checked_out)
+
+    def test_get_all_runs_as_list_lightweight_matches_orm(self):
+        """test lightweight runs expose the same properties as ORM runs"""
+        # setup
+        predictions = self.context.get_predictions_for_test(5, self.session)
+        self.session.add_all(predictions)
+        self.session.commit()
+
+        # assert
+        runs = {r.run_id: r for r in self.repo.get_all_runs_as_list()}
+        rows = self.repo.get_all_runs_as_list(lightweight=True)
+
+        self.assertEqual(len(runs), len(rows))
+        for row in rows:
+            self.assertIsInstance(row, RiverRunRow)
+            self.assertEqual(row.dict, runs[row.run_id].dict)
+            self.assertEqual(row.select_option, runs[row.run_id].select_option)
+            self.assertEqual(row.todays_runability, runs[row.run_id].todays_runability)
+
+    def test_get_measurements_lightweight(self):
+        """test lightweight measurements match the DataFrame representation"""
+        # setup
+        measurements = self.context.get_measurements_for_test(10, self.session)
+        run = self.context.get_runs_for_test(1, self.session)[0]
+        self.session.add(run)
+        self.session.add_all(measurements)
+        self.session.add_all([
+            StationRiverDistance(station_id=s.station_id, run_id=run.run_id, distance=1.)
+            for s in self.session.query(Station).all()
+        ])
+        self.session.commit()
+
+        # assert
+        df = self.repo.get_measurements(run_id=run.run_id, min_distance=10.)
+        rows = self.repo.get_measurements(run_id=run.run_id, min_distance=10., lightweight=True)
+
+        self.assertEqual(len(df), len(rows))
+        self.assertTrue(all(isinstance(r, MeasurementRow) for r in rows))
+
+    def test_get_measurements_compact(self):
+        """test compact measurements hold the same data as the DataFrame representation in compact dtypes"""
+        # setup
+        measurements = self.context.get_measurements_for_test(10, self.session)
+        run = self.context.get_runs_for_test(1, self.session)[0]
+        self.session.add(run)
+        self.session.add_all(measurements)
+        self.session.add_all([
+            StationRiverDistance(station_id=s.station_id, run_id=run.run_id, distance=1.)
+            for s in self.session.query(Station).all()
+        ])
+        self.session.commit()
+
+        # assert
+        df = self.repo.get_measurements(run_id=run.run_id, min_distance=10.).sort_values('date_time')
+        compact = self.repo.get_measurements(run_id=run.run_id, min_distance=10., compact=True) \
+            .sort_values('date_time')
+
+        self.assertEqual(list(compact.columns), list(df.columns))
+        self.assertEqual(compact['value'].dtype, np.float32)
+        self.assertEqual(compact['metric_id'].dtype.name, 'category')
+        self.assertEqual(compact['source'].dtype.name, 'category')
+        self.assertTrue(np.issubdtype(compact['date_time'].dtype, np.datetime64))
+        self.assertEqual(list(compact['station_id'].astype(str)), list(df['station_id']))
+        self.assertEqual(list(compact['source'].astype(str)), list(df['source']))
+        self.assertTrue(np.allclose(compact['value'].values, df['value'].values, rtol=1e-6))
+
+    def test_get_input_fingerprint_changes_with_new_measurement(self):
+        """test the input fingerprint is stable until a measurement is added for the run"""
+        # setup
+        measurements = self.context.get_measurements_for_test(10, self.session)
+        run = self.context.get_runs_for_test(1, self.session)[0]
+        self.session.add(run)
+        self.session.add_all(measurements)
+        self.session.add_all([
+            StationRiverDistance(station_id=s.station_id, run_id=run.run_id, distance=1.)
+            for s in self.session.query(Station).all()
+        ])
+        self.session.commit()
+
+        first = self.repo.get_input_fingerprint(run.run_id)
+        second = self.repo.get_input_fingerprint(run.run_id)
+
+        station_id = self.repo.get_run_stations(run.run_id)[0][0]
+        self.session.add(Measurement(
+            station_id=station_id,
+            metric_id=measurements[0].metric_id,
+            date_time=datetime.datetime.now() + datetime.timedelta(minutes=1),
+            value=1.
+        ))
+        self.session.commit()
+
+        # assert
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, self.repo.get_input_fingerprint(run.run_id))
+
+    def test_put_climatology_recomputes_touched_days(self):
+        """test only the days of the year around the range are recomputed from the closest USGS station's rollups"""
+        # setup
+        run = self.context.get_runs_for_test(1, self.session)[0]
+        self.session.add(run)
+        self.session.add(Station(station_id='flow', source='USGS', name='flow station', latitude=47., longitude=-122.))
+        self.session.add(Metric(metric_id='00060', description='discharge', name='flow', units='cfs'))
+        self.session.commit()
+        self.session.add(StationRiverDistance(station_id='flow', run_id=run.run_id, distance=1.))
+        self.session.add_all([
+            DailyMeasurement(date=datetime.date(year, 3, day), metric_id='00060', station_id='flow', count=96,
+                             mean=float(year - 2000), sum=0., min=0., max=0.)
+            for year in range(2010, 2015) for day in range(1, 31)
+        ])
+        self.session.commit()
+
+        written = self.repo.put_climatology(datetime.datetime(2014, 3, 15), datetime.datetime(2014, 3, 16), window=2)
+        climatology = self.repo.get_climatology(run.run_id)
+
+        # assert
+        self.assertEqual(written, 5)
+        self.assertEqual(list(climatology.index), [72, 73, 74, 75, 76])
+        self.assertEqual(climatology.loc[74, 'min'], 10.)
+        self.assertEqual(climatology.loc[74, 'max'], 14.)
+        self.assertEqual(climatology.loc[74, 'q50'], 12.)
+        self.assertEqual(len(self.repo.get_climatology(run.run_id, [74, 100])), 1)
@@ -0,0 +1,42 @@
+import datetime
+import os
+import pandas as pd
+from riverrunner.arima import daily_features
+from riverrunner.series_cache import SeriesCache
+from riverrunner.static.benchmarks import synthetic_measurements
+import shutil
+import tempfile
+from unittest import TestCase
+
+
+class TestSeriesCache(TestCase):
+    """test class for series_cache.py"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = SeriesCache(os.path.join(self.directory, 'series'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_get_round_trip(self):
+        """test a cached frame and its range are returned unchanged"""
+        frame = daily_features(synthetic_measurements(30))
+        start, through = datetime.datetime(2018, 1, 1), datetime.datetime(2018, 1, 31)
+        self.cache.put(1, frame, start, through, 'abc')
+
+        cached = self.cache.get(1)
+
+        pd.testing.assert_frame_equal(cached.frame, frame)
+        self.assertEqual((cached.start, cached.through, cached.fingerprint), (start, through, 'abc'))
+
+    def test_get_missing(self):
+        """test nothing is returned for a run without a cached frame"""
+        self.assertIsNone(self.cache.get(1))
+
+    def test_put_leaves_no_temporary_files(self):
+        """test only the cached frame remains after a write"""
+        frame = daily_features(synthetic_measurements(5))
+        self.cache.put(1, frame, datetime.datetime(2018, 1, 1), datetime.datetime(2018, 1, 5), 'abc')
+
+        self.assertEqual(os.listdir(self.cache.directory), ['1.npz'])
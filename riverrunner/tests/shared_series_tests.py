@@ -0,0 +1,60 @@
+import numpy as np
+import os
+import pandas as pd
+from riverrunner.arima import daily_features, data_fingerprint
+from riverrunner.shared_series import SharedSeries, pack_series
+from riverrunner.static.benchmarks import synthetic_measurements
+import shutil
+import tempfile
+from unittest import TestCase
+
+
+class TestSharedSeries(TestCase):
+    """test class for shared_series.py"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        def frame(days, seed):
+            return daily_features(synthetic_measurements(days, seed=seed)).dropna()
+
+        self.frames = {3: frame(10, 0), 1: None, 7: frame(25, 1)}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_frame_round_trip(self):
+        """test every run's frame is returned unchanged, so model artifacts keyed by it are reused"""
+        series = pack_series(self.frames, directory=self.directory)
+
+        for run_id in (3, 7):
+            frame = series.frame(run_id)
+            pd.testing.assert_frame_equal(frame, self.frames[run_id])
+            self.assertEqual(data_fingerprint(frame), data_fingerprint(self.frames[run_id]))
+
+    def test_slice(self):
+        """test run ids map to consecutive slices of the block"""
+        series = pack_series(self.frames, directory=self.directory)
+
+        self.assertEqual(series.slice(3), slice(0, 10))
+        self.assertEqual(series.slice(1), slice(10, 10))
+        self.assertEqual(series.slice(7), slice(10, 35))
+        self.assertIsNone(series.slice(2))
+        self.assertEqual(len(series.frame(1)), 0)
+        self.assertIsNone(series.frame(2))
+
+    def test_attach_is_read_only(self):
+        """test an attached block is a read-only memory map"""
+        block = pack_series(self.frames, directory=self.directory).directory
+        series = SharedSeries(block)
+
+        self.assertIsInstance(series.values, np.memmap)
+        with self.assertRaises(ValueError):
+            series.values[0, 0] = 1.
+
+    def test_unlink(self):
+        """test unlinking removes the block"""
+        series = pack_series(self.frames, directory=self.directory)
+        series.unlink()
+
+        self.assertEqual(os.listdir(self.directory), [])
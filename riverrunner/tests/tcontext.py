@@ -50,7 +50,12 @@ class TContext(context.Context):
         """
         entities = [
             context.Prediction,
+            context.Climatology,
+            context.SeriesDiagnostics,
+            context.ModelFit,
+            context.ModelOrder,
             context.StationRiverDistance,
+            context.DailyMeasurement,
             context.Measurement,
             context.Metric,
             context.Station,
@@ -0,0 +1,33 @@
+from riverrunner.window_sweep import shortest_windows, sweep_table
+from unittest import TestCase
+
+
+class TestWindowSweep(TestCase):
+    """test class for window_sweep.py"""
+
+    @staticmethod
+    def result(window, mae, wall, error=None):
+        return dict(run_id=1, config='arima', window=window, origin='2018-01-01', mae=mae, wall=wall, error=error)
+
+    def test_sweep_table(self):
+        """test results are averaged per run, configuration and window"""
+        table = sweep_table([
+            self.result(365, 2., 1.), self.result(365, 4., 3.), self.result(180, None, None, 'failed'),
+            self.result(180, 6., 1.)
+        ])
+
+        self.assertEqual(list(table['window']), [180, 365])
+        self.assertEqual(list(table['forecasts']), [2, 2])
+        self.assertEqual(list(table['failures']), [1, 0])
+        self.assertEqual(list(table['mae']), [6., 3.])
+        self.assertEqual(list(table['wall']), [1., 2.])
+
+    def test_shortest_windows(self):
+        """test the shortest window within tolerance of the best is proposed"""
+        table = sweep_table([self.result(180, 12., .5), self.result(365, 10.4, 1.), self.result(730, 10., 2.)])
+
+        shortest = shortest_windows(table, tolerance=.05)
+
+        self.assertEqual(len(shortest), 1)
+        self.assertEqual(shortest['window'][0], 365)
+        self.assertEqual(shortest['best_window'][0], 730)
@@ -0,0 +1,126 @@
+""" script that sweeps training window lengths over the backtest data
+
+Examples:
+    python window_sweep.py [--synthetic RUNS | --run-ids RUN_ID ...] [--windows DAYS ...] [--configs NAME ...]
+                           [--tolerance T] [--workers N] [--output PATH]
+
+    * backtests every run with each training window, see backtest
+    * reports fit time against forecast error per run, window and configuration
+    * proposes, per run and configuration, the shortest window whose error is within tolerance of the best window,
+      which can be configured as the run's RiverRun.training_days
+
+Functions:
+    sweep_table: mean forecast error and fit time per run, configuration and window
+
+    shortest_windows: the shortest window holding accuracy per run and configuration
+"""
+
+import argparse
+import json
+import pandas as pd
+from riverrunner import settings
+from riverrunner.backtest import BACKTEST_HORIZON, BACKTEST_ORIGINS, CONFIGS, backtest, database_frames, \
+    synthetic_frames, write_report
+from riverrunner.context import Context
+
+
+"""training windows in days swept by default"""
+WINDOWS = [180, 365, 2*365, 3*365, 4*365]
+
+"""relative increase in mean absolute error over the best window a shorter window may have"""
+WINDOW_TOLERANCE = .05
+
+"""file the report is written to"""
+SWEEP_REPORT = 'data/window_sweep.json'
+
+
+def sweep_table(results):
+    """mean forecast error and fit time per run, configuration and window
+
+    Args:
+        results: ([dict]) results of a backtest over several windows
+
+    Returns:
+        DataFrame: run_id, config, window, forecasts, failures and the mean mae and fit seconds of successful
+        forecasts, ordered by run, configuration and window
+    """
+    columns = ['run_id', 'config', 'window', 'forecasts', 'failures', 'mae', 'wall']
+    if len(results) == 0:
+        return pd.DataFrame(columns=columns)
+
+    df = pd.DataFrame(results)
+    df['failed'] = df['error'].notnull()
+    grouped = df.groupby(['run_id', 'config', 'window'])
+
+    table = pd.DataFrame({
+        'forecasts': grouped['failed'].size(),
+        'failures': grouped['failed'].sum().astype(int),
+        'mae': grouped['mae'].mean(),
+        'wall': grouped['wall'].mean()
+    }).reset_index()
+
+    return table[columns].sort_values(['run_id', 'config', 'window']).reset_index(drop=True)
+
+
+def shortest_windows(table, tolerance=WINDOW_TOLERANCE):
+    """the shortest window holding accuracy per run and configuration
+
+    Args:
+        table: (DataFrame) output of sweep_table
+        tolerance: (float) optional relative increase in mae over the best window a shorter window may have
+
+    Returns:
+        DataFrame: run_id, config, the shortest window within tolerance with its mae and fit seconds, and the best
+        window with its mae and fit seconds
+    """
+    rows = []
+    for (run_id, config), group in table.dropna(subset=['mae']).groupby(['run_id', 'config']):
+        best = group.loc[group['mae'].idxmin()]
+        shortest = group[group['mae'] <= best['mae']*(1 + tolerance)].iloc[0]
+
+        rows.append(dict(run_id=run_id, config=config,
+                         window=shortest['window'], mae=shortest['mae'], wall=shortest['wall'],
+                         best_window=best['window'], best_mae=best['mae'], best_wall=best['wall']))
+
+    return pd.DataFrame(rows, columns=['run_id', 'config', 'window', 'mae', 'wall', 'best_window', 'best_mae',
+                                       'best_wall'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='sweep training window lengths over the backtest data')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--synthetic', type=int, metavar='RUNS', help='sweep this many synthetic runs')
+    source.add_argument('--run-ids', nargs='+', type=int, help='runs to sweep, every run if omitted')
+    parser.add_argument('--windows', nargs='+', type=int, default=WINDOWS)
+    parser.add_argument('--configs', nargs='+', choices=[c.name for c in CONFIGS], default=['arima'])
+    parser.add_argument('--origins', type=int, default=BACKTEST_ORIGINS)
+    parser.add_argument('--horizon', type=int, default=BACKTEST_HORIZON)
+    parser.add_argument('--tolerance', type=float, default=WINDOW_TOLERANCE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=SWEEP_REPORT)
+    args = parser.parse_args()
+
+    pd.options.mode.chained_assignment = None
+
+    # the longest window must fit before the earliest origin
+    days = max(args.windows) + args.origins*args.horizon
+    if args.synthetic is not None:
+        frames = synthetic_frames(args.synthetic, days)
+    else:
+        session = Context(settings.DATABASE).Session()
+        frames = database_frames(session, args.run_ids, days)
+        session.close()
+
+    configs = [c for c in CONFIGS if c.name in args.configs]
+    report = backtest(frames, configs, args.origins, args.horizon, args.workers, sorted(args.windows))
+
+    table = sweep_table(report['results'])
+    shortest = shortest_windows(table, args.tolerance)
+    report['sweep'] = json.loads(table.to_json(orient='records'))
+    report['shortest'] = json.loads(shortest.to_json(orient='records'))
+    write_report(report, args.output)
+
+    print(table.to_string(index=False, float_format=lambda x: f'{x:.2f}'))
+    print()
+    print(shortest.to_string(index=False, float_format=lambda x: f'{x:.2f}'))
+    print(f'report written to {args.output}')